@@ -0,0 +1,1159 @@
+import argparse
+import contextlib
+import datetime
+import hashlib
+import html
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import requests
+
+import deal_analytics
+import replay
+import restaurant_matcher
+import scrapping
+import scrappingsignature
+import theforkProcessing
+from browser_pool import BrowserPool, fetch_promotion_pages, page_url
+from change_detection import compute_daily_changes, restaurant_entry
+from content_store import ContentStore
+from history_store import CHECKPOINT_INTERVAL_DAYS, HistoryStore
+from json_stream import iter_array_items
+from request_scheduler import DEFAULT_MAX_ATTEMPTS, RequestScheduler
+from restaurant_record import RestaurantRecord, to_json
+from snapshot_store import SnapshotStore, snapshot_hash
+from summary_store import COMPACT_EVERY, RUN_COUNT_FIELDS, SummaryStore, migrate
+from stub_server import StubServer, synthetic_restaurants
+from time_travel import reconstruct_snapshot
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_details(args):
+    restaurants = synthetic_restaurants(args.restaurants)
+    slugs = [r['slug'] for r in restaurants]
+
+    with StubServer(restaurants, latency=args.latency, error_rate=args.error_rate,
+                    retry_after=args.retry_after) as stub:
+        scrapping.API_BASE_URL = stub.url
+
+        serial_scheduler = RequestScheduler(max_attempts=args.max_attempts)
+        serial, serial_time = timed(
+            lambda: [scrapping.fetch_restaurant_details(slug, scheduler=serial_scheduler) for slug in slugs])
+        concurrent_scheduler = RequestScheduler(max_attempts=args.max_attempts)
+        concurrent, concurrent_time = timed(
+            scrapping.fetch_all_details, slugs, args.concurrency, args.rate_limit, scheduler=concurrent_scheduler)
+
+    if not args.error_rate:
+        assert serial == concurrent, "concurrent fetch returned different details"
+    print(f"Detail fetch for {len(slugs)} restaurants ({args.latency * 1000:.0f} ms latency, "
+          f"{args.error_rate:.0%} errors)")
+    for label, results, seconds, scheduler in (('serial', serial, serial_time, serial_scheduler),
+                                               ('concurrent', concurrent, concurrent_time, concurrent_scheduler)):
+        stats = scheduler.stats
+        print(f"  {label + ':':<12}{seconds:.2f}s, {sum(r is None for r in results)} failed, "
+              f"{stats['retries']} retries, {stats['throttled']} throttled")
+    print(f"  speedup:    {serial_time / concurrent_time:.1f}x (up to {args.concurrency} in flight)")
+
+
+def listing_uuids(city, window, scheduler=None, concurrency=scrapping.MAX_WINDOW, rate_limit=None):
+    return [r['uuid'] for r in scrapping.fetch_neotaste_data(city, scheduler=scheduler, window=window,
+                                                             concurrency=concurrency, rate_limit=rate_limit)]
+
+
+def check_listing(restaurants, page_size, window, fail_pages=(), short_pages=()):
+    # The speculative walk has to return exactly what the serial one does
+    with StubServer(restaurants, page_size=page_size, fail_pages=fail_pages, short_pages=short_pages) as stub:
+        scrapping.API_BASE_URL = stub.url
+        serial = listing_uuids('stub', 1, RequestScheduler(max_attempts=1))
+        speculative = listing_uuids('stub', window, RequestScheduler(max_attempts=1))
+    assert serial == speculative, (len(restaurants), page_size, fail_pages, short_pages)
+    return serial
+
+
+def bench_listing(args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        page_size = 20
+        for count in (0, 1, page_size - 1, page_size, page_size * 5, page_size * 5 + 7, page_size * 40):
+            uuids = check_listing(synthetic_restaurants(count), page_size, args.window)
+            assert uuids == [r['uuid'] for r in synthetic_restaurants(count)]
+
+        # Restaurants that move between pages while paging show up twice
+        restaurants = synthetic_restaurants(100)
+        shifted = restaurants[:40] + restaurants[35:]
+        assert check_listing(shifted, page_size, args.window) == [r['uuid'] for r in restaurants]
+
+        # A page that keeps failing ends the listing before it, as the serial walk does
+        assert check_listing(restaurants, page_size, args.window, fail_pages={3}) == \
+            [r['uuid'] for r in restaurants[:40]]
+        assert check_listing(restaurants, page_size, args.window, fail_pages={1}) == []
+
+        # Only isLastPage ends the listing, not a page that comes back short
+        short = check_listing(restaurants, page_size, args.window, short_pages={2, 3})
+        assert short == [r['uuid'] for n, r in enumerate(restaurants) if n not in (39, 59)]
+    print("Speculative listing matches the serial walk "
+          "(empty, partial, exact, duplicated, short and failing listings)")
+
+    restaurants = synthetic_restaurants(args.restaurants)
+    with StubServer(restaurants, latency=args.latency, page_size=args.page_size) as stub:
+        scrapping.API_BASE_URL = stub.url
+        with contextlib.redirect_stdout(io.StringIO()):
+            serial, serial_time = timed(listing_uuids, 'stub', 1)
+            speculative, speculative_time = timed(listing_uuids, 'stub', args.window, None, args.concurrency,
+                                                  args.rate_limit)
+            # The speculative window stays within the host budget
+            assert stub.max_in_flight <= scrapping.listing_window_limit(args.concurrency), stub.max_in_flight
+    assert serial == speculative
+
+    pages = -(-args.restaurants // args.page_size)
+    print(f"Listing {args.restaurants} restaurants in {pages} pages ({args.latency * 1000:.0f} ms latency, "
+          f"{args.concurrency} in flight, {args.rate_limit or 'unlimited'} req/s)")
+    print(f"  serial:       {serial_time:.2f}s")
+    max_window = scrapping.listing_window_limit(args.concurrency)
+    print(f"  speculative:  {speculative_time:.2f}s (window {min(args.window, max_window)} growing to "
+          f"{max_window}, {serial_time / speculative_time:.1f}x faster)")
+
+
+def synthetic_snapshot(count, seed=0):
+    # Listing + details merged the way process_city stores them
+    snapshot = synthetic_restaurants(count, seed)
+    for r in snapshot:
+        r['images'] = [img['url'] for img in r['images']]
+    return snapshot
+
+
+def mutate_snapshot(snapshot, churn=0.01, seed=1):
+    rng = random.Random(seed)
+    current = [dict(r) for r in snapshot if rng.random() >= churn]
+    current += synthetic_snapshot(int(len(snapshot) * churn), seed=1000000 * seed)
+    for r in rng.sample(current, int(len(current) * churn * 2)):
+        r['deals'] = r['deals'] + [{'uuid': f"deal-{r['uuid']}-new-{seed}", 'name': 'Free dessert', 'type': 'FREEBIE'}]
+    return current
+
+
+def legacy_daily_changes(previous_data, data, today):
+    # save_structured_data's original change detection, kept as the baseline
+    new_restaurants = [r for r in data if r['uuid'] not in [pr['uuid'] for pr in previous_data]]
+    removed_restaurants = [r for r in previous_data if r['uuid'] not in [nr['uuid'] for nr in data]]
+    existing_restaurants = [r for r in data if r['uuid'] in [pr['uuid'] for pr in previous_data]]
+
+    daily_changes = {
+        'date': today,
+        'new_restaurants': [restaurant_entry(r) for r in new_restaurants],
+        'removed_restaurants': [restaurant_entry(r) for r in removed_restaurants],
+        'existing_restaurants': [],
+        'total_restaurants': len(data)
+    }
+
+    for current in existing_restaurants:
+        previous = next((r for r in previous_data if r['uuid'] == current['uuid']), None)
+        if previous:
+            current_deals = set(json.dumps(d) for d in current.get('deals', []))
+            previous_deals = set(json.dumps(d) for d in previous.get('deals', []))
+
+            new_deals = [json.loads(d) for d in current_deals - previous_deals]
+            removed_deals = [json.loads(d) for d in previous_deals - current_deals]
+
+            if (new_deals or removed_deals or
+                current['avgRating'] != previous['avgRating'] or
+                current['priceRange'] != previous['priceRange']):
+                daily_changes['existing_restaurants'].append({'uuid': current['uuid'],
+                                                              'new_deals': new_deals,
+                                                              'removed_deals': removed_deals})
+
+    return daily_changes
+
+
+def bench_diff(args):
+    for size in args.sizes:
+        previous = synthetic_snapshot(size)
+        current = mutate_snapshot(previous)
+
+        changes, new_time = timed(compute_daily_changes, previous, current, '2024-01-01')
+        line = (f"{size:>7} restaurants: indexed {new_time * 1000:9.1f} ms "
+                f"({len(changes['new_restaurants'])} new, {len(changes['removed_restaurants'])} removed, "
+                f"{len(changes['existing_restaurants'])} changed)")
+
+        if size <= args.legacy_max:
+            legacy, legacy_time = timed(legacy_daily_changes, previous, current, '2024-01-01')
+            assert len(legacy['existing_restaurants']) == len(changes['existing_restaurants'])
+            line += f", legacy {legacy_time * 1000:9.1f} ms ({legacy_time / new_time:.0f}x)"
+        else:
+            line += ", legacy skipped"
+        print(line)
+
+
+def thefork_item(n):
+    return {
+        'restaurant': {
+            'id': str(n),
+            'name': f'Ristorante {n}',
+            'address': {'street': f'Hauptstrasse {n % 300}', 'zipCode': f'{1010 + n % 23 * 10}',
+                        'locality': 'Wien', 'country': 'AT'},
+            'geolocation': {'latitude': 48.2 + (n % 1000) / 10000, 'longitude': 16.3 + (n // 1000) / 10000},
+            'aggregateRatings': {'thefork': {'ratingValue': 8 + n % 20 / 10, 'reviewCount': n % 900}},
+            'priceRangeLevel': n % 4 + 1,
+            'averagePrice': 20 + n % 40,
+            'servesCuisine': 'Italienisch',
+            'mainPhotoUrl': f'https://photos.example/{n}/main.jpg',
+            'photos': [{'src': f'https://photos.example/{n}/{k}.jpg', 'alt': 'Foto'} for k in range(10)],
+            'slug': f'ristorante-{n}',
+            'description': 'Lorem ipsum dolor sit amet ' * 20
+        },
+        'marketingOffer': {'label': '-30%', 'type': 'DISCOUNT', 'title': '30% auf die Speisekarte',
+                           'discountPercentage': 30} if n % 2 else None
+    }
+
+
+def write_thefork_folder(folder, files, items_per_file):
+    for i in range(files):
+        name = 'promotions.json' if i == 0 else f'promotions ({i}).json'
+        # Neighbouring pages overlap by a couple of restaurants, like real dumps
+        start = i * (items_per_file - 2)
+        page = {'pageProps': {
+            'fallback': {}, 'faq': [], 'page': {'breadcrumbs': [{'title': 'Wien'}] * 50},
+            'searchPageResultsFetchResult': {
+                'totalCount': files * items_per_file,
+                'list': [thefork_item(n) for n in range(start, start + items_per_file)]
+            }
+        }}
+        with open(os.path.join(folder, name), 'w', encoding='utf-8') as f:
+            json.dump(page, f, ensure_ascii=False)
+
+
+def check_json_stream(documents=40, seed=0):
+    # iter_array_items has to decode every element like json.loads, whatever chunk
+    # boundary a number, string or nested value is split at
+    rng = random.Random(seed)
+    scalars = (lambda: rng.randint(-10 ** 6, 10 ** 6), lambda: round(rng.uniform(-1e4, 1e4), rng.randint(0, 6)),
+               lambda: rng.uniform(-1, 1) * 10 ** rng.randint(-20, 20), lambda: rng.choice((True, False, None)),
+               lambda: 'caf\u00e9 "quoted" \\ text', lambda: {'x': [1.25, 2e-3], 'y': 'z'})
+    checked = 0
+    for n in range(documents):
+        items = [rng.choice(scalars)() for _ in range(rng.randint(0, 12))]
+        document = json.dumps({'skip': [1.5, {'a': 2e3}], 'a': {'b': items}},
+                              separators=(',', ':') if n % 2 else (', ', ': '), ensure_ascii=n % 3 == 0)
+        for chunk_size in range(1, len(document) + 1):
+            assert list(iter_array_items(io.StringIO(document), ['a', 'b'], chunk_size)) == items, \
+                (document, chunk_size)
+            checked += 1
+    return checked
+
+
+def bench_thefork(args):
+    print(f"Streaming JSON reader agrees with json.loads on {check_json_stream()} document/chunk size pairs")
+    with tempfile.TemporaryDirectory() as folder:
+        write_thefork_folder(folder, args.files, args.items)
+        size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)) / 1024 / 1024
+        print(f"{args.files} files, {args.items} restaurants each, {size:.1f} MiB on {os.cpu_count()} cores")
+
+        baseline = None
+        for workers in args.workers:
+            restaurants, seconds = timed(theforkProcessing.process_thefork_data, folder, workers)
+            ids = [r['id'] for r in restaurants]
+            if baseline is None:
+                baseline = ids
+            assert ids == baseline, "merge order depends on the worker count"
+            print(f"  {workers:>2} workers: {seconds:6.2f}s, {size / seconds:6.1f} MiB/s, "
+                  f"{size / seconds / min(workers, os.cpu_count()):6.1f} MiB/s per core, {len(ids)} restaurants")
+
+
+def thefork_page(page, page_count, items_per_page):
+    start = (page - 1) * items_per_page
+    return {'pageProps': {'searchPageResultsFetchResult': {
+        'list': [thefork_item(n) for n in range(start, start + items_per_page)],
+        'pagination': {'totalCount': page_count * items_per_page, 'totalPage': page_count,
+                       'currentPage': page, 'hasNext': page < page_count, 'limit': items_per_page}
+    }}}
+
+
+class SimulatedBrowser:
+    # Stands in for headless Chrome: a fixed startup cost, then pages are read over HTTP
+    def __init__(self, startup):
+        time.sleep(startup)
+        self.session = requests.Session()
+
+    def quit(self):
+        self.session.close()
+
+
+def simulated_read_json(driver, url):
+    return driver.session.get(url).json()
+
+
+def bench_browser(args):
+    path = '/_next/data/build/de-AT/search/cityTag/wien/597321/promotions.json'
+    json_pages = {f'{path}?p={page}': thefork_page(page, args.pages, args.items)
+                  for page in range(1, args.pages + 1)}
+
+    def pool(size):
+        return BrowserPool(size, lambda: SimulatedBrowser(args.startup), simulated_read_json)
+
+    with StubServer(json_pages=json_pages, latency=args.latency) as stub:
+        url = stub.url + path
+        print(f"{args.pages} pages, {args.startup:.1f}s browser startup, {args.latency * 1000:.0f} ms latency")
+
+        # What the scraper used to do: one fresh browser per page, one page after another
+        def browser_per_page():
+            pages = []
+            for page in range(1, args.pages + 1):
+                with pool(1) as fresh:
+                    pages.append(fresh.fetch_json(page_url(url, page)))
+            return pages
+
+        runs = [('browser per page', browser_per_page)]
+        for workers in args.workers:
+            runs.append((f'{workers} warm browsers',
+                         lambda workers=workers: fetch_promotion_pages(url, workers, use_http=False,
+                                                                       pool=pool(workers))))
+        runs.append(('HTTP first', lambda: fetch_promotion_pages(url, max(args.workers), pool=pool(1))))
+
+        for label, run in runs:
+            pages, seconds = timed(run)
+            assert [p['pageProps']['searchPageResultsFetchResult']['pagination']['currentPage'] for p in pages] \
+                == list(range(1, args.pages + 1))
+            print(f"  {label:<18} {seconds:6.2f}s")
+
+
+def signature_page(n, filler_paragraphs=200):
+    filler = ''.join(f'<p class="text-sm">Absatz {k}: Genuss in Wien, Gutschein gültig bis Ende des Jahres.</p>'
+                     for k in range(filler_paragraphs))
+    return f"""<!DOCTYPE html>
+<html lang="de"><head><meta charset="utf-8"><title>Restaurant {n}</title>
+<script>window.dataLayer = window.dataLayer || [];</script></head>
+<body><nav><ul>{''.join(f'<li><a href="/kategorie/{k}">Kategorie {k}</a></li>' for k in range(40))}</ul></nav>
+<div class="js-gallery-item gallery-item mb-4"><a href="/img/{n}/large.jpg"><img src="/img/{n}/thumb.jpg" alt="Restaurant {n}"></a></div>
+<div class="text-gray-900 sm:w-10/12 mx-auto leading-normal">
+  <h1>Restaurant {n}</h1>
+  <div class="font-thin mb-8 text-justify">
+    Zwei Hauptspeisen zum Preis von einer &amp; ein Glas Wein. Ersparnis bis zu € {n % 40 + 10},50 oder EUR {n % 20 + 5}.
+  </div>
+  <div class="leading-loose">{filler}</div>
+</div>
+<div class="text-gray-800 mt-12 sm:w-10/12 mx-auto mb-8">
+  <div><strong>Restaurant {n}</strong><br>Praterstrasse {n % 90 + 1}<br>1020 Wien</div>
+  <div><a href="tel:+431{n:06d}">+43 1 {n:06d}</a></div>
+  <div><a href="mailto:office{n}@example.at">office{n}@example.at</a></div>
+  <div><a href="https://restaurant{n}.example.at">restaurant{n}.example.at</a></div>
+</div>
+<footer>{filler}</footer>
+</body></html>"""
+
+
+def signature_markers(count, base_url):
+    return [{'title': f'Restaurant {n}', 'url': f'{base_url}/restaurant/{n}',
+             'pos': {'lat': 48.2 + n / 10000, 'lng': 16.37},
+             'data': {'state': 'Wien', 'type': 'Restaurant', 'category': 'Gourmet'}} for n in range(count)]
+
+
+def parse_signature_page(page, backend):
+    if backend == 'stream':
+        return scrappingsignature.extract_page_sections(page, {})
+    return scrappingsignature.parse_restaurant_page(scrappingsignature.BeautifulSoup(page, backend), {})
+
+
+def signature_fixtures(directory):
+    # Saved pages (*.html) and replay cassettes (*.jsonl) alike; from a cassette every
+    # successful HTML response counts
+    documents = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.html'):
+            with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                documents.append(f.read())
+    for interaction in replay.Cassette(directory).by_url.values():
+        if interaction['status'] == 200 and interaction['encoding'] == 'utf-8' \
+                and 'html' in interaction['headers'].get('Content-Type', 'text/html'):
+            documents.append(interaction['body'])
+    return documents
+
+
+def bench_signature(args):
+    pages = {f'/restaurant/{n}': signature_page(n) for n in range(args.pages)}
+    backends = [scrappingsignature.resolve_parser(name) for name in args.parsers]
+
+    print(f"{args.pages} restaurant pages of {len(pages['/restaurant/0']) / 1024:.0f} KiB")
+    print("Parse only:")
+    for backend in dict.fromkeys(backends):
+        _, seconds = timed(lambda: [parse_signature_page(page, backend) for page in pages.values()])
+        print(f"  {backend:<12} {args.pages / seconds:8.1f} pages/s")
+
+    # The streaming extractor has to agree with the BeautifulSoup path field for field, on
+    # the synthetic pages and on the saved real-world ones
+    fixtures = signature_fixtures(args.fixtures)
+    if not fixtures:
+        sys.exit(f"No restaurant pages in {args.fixtures}")
+    documents = list(pages.values()) + fixtures
+    mismatches = sum(parse_signature_page(page, 'stream') != parse_signature_page(page, 'html.parser')
+                     for page in documents)
+    print(f"Stream extractor vs html.parser: {mismatches} mismatches in {len(documents)} pages "
+          f"({len(fixtures)} from {args.fixtures})")
+    assert not mismatches
+
+    with StubServer(pages=pages, latency=args.latency) as stub:
+        markers = signature_markers(args.pages, stub.url)
+        print(f"Fetch + parse ({args.latency * 1000:.0f} ms latency):")
+        for backend in dict.fromkeys(backends):
+            for workers in (1, args.workers):
+                session = scrappingsignature.make_session(pool_size=workers)
+                results, seconds = timed(scrappingsignature.scrape_restaurants, markers, stub.url,
+                                         session, workers, backend)
+                session.close()
+                assert len(results) == args.pages and all('phone' in r for r in results)
+                print(f"  {backend:<12} {workers:>2} workers: {args.pages / seconds:8.1f} pages/s")
+
+
+def legacy_summary_update(city_data_dir, entry, data):
+    # save_structured_data's original summary write, kept as the baseline
+    path = os.path.join(city_data_dir, 'summary.json')
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+    else:
+        summary = {'daily_counts': []}
+    summary['daily_counts'].append(entry)
+    summary['last_updated'] = entry['date']
+    summary['restaurants'] = [restaurant_entry(r).to_dict() for r in data]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+def split_runs(entries, every=7):
+    # Every `every` days the scraper runs twice; the two runs' counts add up to the day's
+    runs = []
+    for day, entry in enumerate(entries):
+        if day % every:
+            runs.append(entry)
+            continue
+        first = {**entry, **{field: entry[field] // 2 for field in RUN_COUNT_FIELDS},
+                 'total_restaurants': entry['total_restaurants'] + 1, 'total_deals': entry['total_deals'] - 1}
+        runs.append(first)
+        runs.append({**entry, **{field: entry[field] - first[field] for field in RUN_COUNT_FIELDS}})
+    return runs
+
+
+def check_interrupted_compaction(runs, expected):
+    # A compaction that died after writing summary.json but before removing the log it
+    # set aside must not count that log's runs a second time
+    with tempfile.TemporaryDirectory() as city_data_dir:
+        summary = SummaryStore(city_data_dir)
+        half = len(runs) // 2
+        for run in runs[:half]:
+            summary.append(run)
+        with open(summary.log_path, 'rb') as f:
+            log = f.read()
+        summary.compact()
+        with open(os.path.join(city_data_dir, summary.load_compacted()['folded_logs'][-1]), 'wb') as f:
+            f.write(log)
+        for run in runs[half:]:
+            summary.append(run)
+        assert summary.daily_counts() == expected
+        summary.compact()
+        assert summary.daily_counts() == expected
+
+
+def bench_summary(args):
+    data = synthetic_snapshot(args.restaurants)
+    entries = synthetic_daily_counts(args.days)
+    runs = split_runs(entries)
+    print(f"{len(runs)} runs over {args.days} days, {args.restaurants} restaurants, "
+          f"compaction every {COMPACT_EVERY} runs")
+    check_interrupted_compaction(runs, entries)
+
+    with tempfile.TemporaryDirectory() as legacy_dir, tempfile.TemporaryDirectory() as store_dir:
+        def legacy():
+            for entry in runs:
+                legacy_summary_update(legacy_dir, entry, data)
+
+        def store():
+            summary = SummaryStore(store_dir)
+            for entry in runs:
+                summary.append(entry)
+                summary.maybe_compact()
+
+        _, legacy_seconds = timed(legacy)
+        _, store_seconds = timed(store)
+        legacy_size = os.path.getsize(os.path.join(legacy_dir, 'summary.json'))
+        store_size = sum(os.path.getsize(os.path.join(store_dir, name)) for name in os.listdir(store_dir))
+
+        assert SummaryStore(store_dir).daily_counts() == entries
+        print(f"  rewrite summary.json:  {legacy_seconds:.3f}s ({legacy_seconds / len(runs) * 1000:.2f} ms/run), "
+              f"{legacy_size / 1024:.1f} KiB on disk")
+        print(f"  append + compaction:   {store_seconds:.3f}s ({store_seconds / len(runs) * 1000:.2f} ms/run), "
+              f"{store_size / 1024:.1f} KiB on disk")
+
+        migrated = migrate(legacy_dir)
+        assert SummaryStore(legacy_dir).daily_counts() == entries
+        print(f"  migrated baseline summary.json: {migrated[0] / 1024:.1f} KiB -> {migrated[1] / 1024:.1f} KiB")
+
+
+def peak_memory(func):
+    # Python heap high-water mark; mapped file pages are page cache and don't count
+    tracemalloc.start()
+    try:
+        result, seconds = timed(func)
+        return result, seconds, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_snapshot(args):
+    data = synthetic_snapshot(args.restaurants)
+    rng = random.Random(0)
+    uuids = [r['uuid'] for r in rng.sample(data, min(args.lookups, len(data)))]
+
+    with tempfile.TemporaryDirectory() as city_data_dir:
+        store = SnapshotStore(city_data_dir)
+        store.commit(data, '2024-01-01')
+        json_path = os.path.join(city_data_dir, store.CURRENT)
+        del data
+        print(f"{args.restaurants} restaurants: JSON {os.path.getsize(json_path) / 2 ** 20:.1f} MiB, "
+              f"binary {os.path.getsize(os.path.join(city_data_dir, store.BINARY)) / 2 ** 20:.1f} MiB")
+
+        def json_deals():
+            with open(json_path, 'r', encoding='utf-8') as f:
+                return sum(len(r.get('deals', [])) for r in json.load(f))
+
+        def json_lookups():
+            with open(json_path, 'r', encoding='utf-8') as f:
+                index = {r['uuid']: r for r in json.load(f)}
+            return [index[uuid] for uuid in uuids]
+
+        def binary_lookups():
+            with store.open_binary() as snapshot:
+                return [snapshot.get(uuid) for uuid in uuids]
+
+        results = {}
+        for label, func in (('deal total, json.load', json_deals),
+                            ('deal total, binary', lambda: scrapping.count_snapshot_deals(city_data_dir)),
+                            (f'{len(uuids)} lookups, json.load', json_lookups),
+                            (f'{len(uuids)} lookups, binary', binary_lookups)):
+            results[label], seconds, peak = peak_memory(func)
+            print(f"  {label:<26} {seconds:7.3f}s  peak {peak / 2 ** 20:7.1f} MiB")
+
+        totals, lookups = list(results.values())[:2], list(results.values())[2:]
+        assert totals[0] == totals[1], totals
+        assert lookups[0] == lookups[1]
+
+
+def legacy_listing_restaurant(restaurant):
+    # The dict fetch_neotaste_data built per listed restaurant before RestaurantRecord
+    return {
+        'uuid': restaurant['uuid'],
+        'name': restaurant['name'],
+        'slug': restaurant['slug'],
+        'address': restaurant.get('address', ''),
+        'addressOptional': restaurant.get('addressOptional', ''),
+        'zipCode': restaurant.get('zipCode', ''),
+        'latitude': restaurant.get('latitude'),
+        'longitude': restaurant.get('longitude'),
+        'deals': [],
+        'tags': [],
+        'avgRating': restaurant.get('avgRating'),
+        'ratingsCount': restaurant.get('ratingsCount'),
+        'reviewsCount': restaurant.get('reviewsCount'),
+        'images': [],
+        'priceRange': restaurant.get('priceRange')
+    }
+
+
+def retained_memory(func):
+    # Python heap still held once func returns, i.e. the size of what it built
+    tracemalloc.start()
+    try:
+        result, seconds = timed(func)
+        return result, seconds, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_records(args):
+    # Every restaurant is parsed from its own listing and detail payloads, as in a real run,
+    # so equal strings are distinct objects unless something interns them
+    listing_fields = ('uuid', 'name', 'slug', 'address', 'addressOptional', 'zipCode', 'latitude', 'longitude',
+                      'avgRating', 'ratingsCount', 'reviewsCount', 'priceRange')
+    payloads = [(json.dumps({field: r[field] for field in listing_fields}), json.dumps({'data': r}))
+                for r in synthetic_restaurants(args.restaurants)]
+
+    def build(make):
+        catalogue = []
+        for listing, details in payloads:
+            restaurant = make(json.loads(listing))
+            restaurant.update(scrapping.parse_restaurant_details(json.loads(details)))
+            catalogue.append(restaurant)
+        return catalogue
+
+    dicts, dict_seconds, dict_bytes = retained_memory(lambda: build(legacy_listing_restaurant))
+    records, record_seconds, record_bytes = retained_memory(lambda: build(RestaurantRecord.from_listing))
+    assert json.dumps(records, default=to_json) == json.dumps(dicts)
+    assert snapshot_hash(records) == snapshot_hash(dicts)
+
+    print(f"{args.restaurants} restaurants, listing + details")
+    print(f"  dicts:    {dict_bytes / 2 ** 20:7.1f} MiB ({dict_bytes / args.restaurants:5.0f} B each), "
+          f"built in {dict_seconds:.2f}s")
+    print(f"  records:  {record_bytes / 2 ** 20:7.1f} MiB ({record_bytes / args.restaurants:5.0f} B each), "
+          f"built in {record_seconds:.2f}s ({1 - record_bytes / dict_bytes:.0%} smaller)")
+
+    # Full-catalogue projections, like SummaryStore.restaurants(), and a day of changes
+    copies, _, copy_bytes = retained_memory(lambda: [restaurant_entry(r).to_dict() for r in records])
+    views, _, view_bytes = retained_memory(lambda: [restaurant_entry(r) for r in records])
+    assert json.dumps(views, default=to_json) == json.dumps(copies)
+    print(f"  entries:  copied {copy_bytes / 2 ** 20:.1f} MiB, views {view_bytes / 2 ** 20:.1f} MiB")
+    del copies, views
+
+    previous = json.loads(json.dumps(dicts))
+    current_dicts = mutate_snapshot(previous)
+    current_records = [RestaurantRecord(r) for r in current_dicts]
+    dict_changes, dict_diff_seconds = timed(compute_daily_changes, previous, current_dicts, '2024-01-01')
+    record_changes, record_diff_seconds = timed(compute_daily_changes, previous, current_records, '2024-01-01')
+    assert json.dumps(record_changes, default=to_json) == json.dumps(dict_changes, default=to_json)
+    print(f"  changes:  {dict_diff_seconds * 1000:.0f} ms over dicts, {record_diff_seconds * 1000:.0f} ms over records")
+
+
+def touch_restaurants(snapshot, share=0.02, seed=0):
+    # Changes that are not deals, ratings or prices, which history has to replay as well
+    rng = random.Random(seed)
+    for r in rng.sample(snapshot, int(len(snapshot) * share)):
+        change = rng.randrange(4)
+        if change == 0:
+            r['tags'] = r['tags'] + [{'name': f'Tag {seed}'}]
+        elif change == 1:
+            r['slug'] = f"{r['slug']}-{seed}"
+        elif change == 2:
+            r['ratingsCount'] = (r['ratingsCount'] or 0) + 1
+        else:
+            r['deals'] = r['deals'][::-1]
+    return snapshot
+
+
+def bench_history(args):
+    # Runs the daily history writes of save_structured_data and checks that every date
+    # reconstructs to exactly the last snapshot written that day. Every --rerun-every days
+    # the scraper runs a second time on the same day
+    snapshot = synthetic_snapshot(args.restaurants)
+    start = datetime.date(2024, 1, 1)
+    written = {}
+    seeds = iter(range(1, 2 ** 31))
+
+    with tempfile.TemporaryDirectory() as city_data_dir:
+        history = HistoryStore(city_data_dir)
+        for day in range(args.days):
+            today = str(start + datetime.timedelta(days=day))
+            reruns = 2 if args.rerun_every and day % args.rerun_every == 0 else 1
+            for _ in range(reruns):
+                seed = next(seeds)
+                current = touch_restaurants(mutate_snapshot(snapshot, args.churn, seed=seed), seed=seed)
+                history.append(compute_daily_changes(snapshot, current, today))
+                history.maybe_checkpoint(today, current, args.interval)
+                written[today] = json.loads(json.dumps(current))
+                snapshot = current
+
+        seconds = []
+        for date, expected in written.items():
+            (rebuilt, _, replayed), elapsed = timed(reconstruct_snapshot, city_data_dir, date)
+            assert {r['uuid']: r for r in rebuilt} == {r['uuid']: r for r in expected}, date
+            seconds.append(elapsed)
+
+    print(f"{args.days} days of history for {args.restaurants} restaurants "
+          f"({args.churn:.0%} churn, checkpoint every {args.interval} days, rerun every {args.rerun_every} days)")
+    print(f"  every date reconstructs to the last snapshot written that day; "
+          f"median {statistics.median(seconds) * 1000:.1f} ms, max {max(seconds) * 1000:.1f} ms")
+
+
+class InlineContent:
+    # Stands in for HistoryStore's ContentStore to write history the way it was before,
+    # with every deal and image list inline
+    def compact_changes(self, daily_changes):
+        return json.loads(json.dumps(daily_changes, default=to_json))
+
+    def compact_snapshot(self, snapshot):
+        return json.loads(json.dumps(snapshot, default=to_json))
+
+    def inflate_changes(self, daily_changes):
+        return daily_changes
+
+    def inflate_snapshot(self, snapshot):
+        return snapshot
+
+    def flush(self):
+        return 0
+
+
+def tree_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def detailed_restaurant(r):
+    # Closer to real detail payloads than the stub's: deals carry their texts and images
+    # have opaque CDN keys, which is what makes inline history hard to compress
+    r['deals'] = [{**deal, 'description': f"{deal['name']} for the whole table, once per visit",
+                   'conditions': 'Not combinable with other offers. Dine-in only.'} for deal in r['deals']]
+    r['images'] = [f"https://cdn.example/restaurants/{hashlib.sha1(url.encode('utf-8')).hexdigest()}.jpg"
+                   for url in r['images']]
+    return r
+
+
+def bench_content(args):
+    snapshot = [detailed_restaurant(r) for r in synthetic_snapshot(args.restaurants)]
+    start = datetime.date(2024, 1, 1)
+
+    with tempfile.TemporaryDirectory() as inline_dir, tempfile.TemporaryDirectory() as content_dir:
+        inline, store = HistoryStore(inline_dir), HistoryStore(content_dir)
+        inline.content = InlineContent()
+        seconds = {'inline': 0.0, 'content': 0.0}
+        for day in range(args.days):
+            today = str(start + datetime.timedelta(days=day))
+            current = mutate_snapshot(snapshot, args.churn, seed=day + 1)
+            changes = compute_daily_changes(snapshot, current, today)
+            for label, history in (('inline', inline), ('content', store)):
+                _, elapsed = timed(lambda: (history.append(changes), history.maybe_checkpoint(today, current)))
+                seconds[label] += elapsed
+            snapshot = current
+
+        inline_size, content_size = tree_size(inline_dir), tree_size(content_dir)
+        objects_size = tree_size(os.path.join(content_dir, ContentStore.DIRNAME))
+        print(f"{args.days} days of history for {args.restaurants} restaurants "
+              f"({args.churn:.0%} churn, checkpoint every {CHECKPOINT_INTERVAL_DAYS} days)")
+        print(f"  inline:          {inline_size / 1024:8.1f} KiB, {inline_size / args.days / 1024:6.1f} KiB/run, "
+              f"{seconds['inline'] / args.days * 1000:.1f} ms/run")
+        print(f"  content store:   {content_size / 1024:8.1f} KiB, {content_size / args.days / 1024:6.1f} KiB/run, "
+              f"{seconds['content'] / args.days * 1000:.1f} ms/run ({objects_size / 1024:.1f} KiB of objects, "
+              f"{1 - content_size / inline_size:.0%} smaller)")
+
+        # Entries and checkpoints read back exactly as written
+        dates = inline.dates()
+        for date in dates[::max(1, len(dates) // 20)] + dates[-1:]:
+            assert HistoryStore(content_dir).read(date) == inline.read(date), date
+        for date in inline.checkpoint_dates():
+            assert HistoryStore(content_dir).load_checkpoint(date) == inline.load_checkpoint(date), date
+        (inline_state, _, _), inline_seconds = timed(reconstruct_snapshot, inline_dir, dates[-1])
+        (content_state, _, _), content_seconds = timed(reconstruct_snapshot, content_dir, dates[-1])
+        assert content_state == inline_state
+        print(f"  reconstructing {dates[-1]}: inline {inline_seconds * 1000:.0f} ms, "
+              f"content store {content_seconds * 1000:.0f} ms")
+
+
+def synthetic_daily_counts(days, seed=0):
+    rng = random.Random(seed)
+    total, deals = 500, 900
+    counts = []
+    for day in range(days):
+        new, removed = rng.randint(0, 8), rng.randint(0, 8)
+        total = max(0, total + new - removed)
+        deals = max(0, deals + rng.randint(-15, 15))
+        entry = {'date': str(datetime.date(2020, 1, 1) + datetime.timedelta(days=day)), 'total_restaurants': total,
+                 'new_restaurants': new, 'removed_restaurants': removed,
+                 'restaurants_with_deal_changes': rng.randint(0, 30), 'total_deals': deals}
+        # Older days predate avg_rating
+        if day > days // 3:
+            entry['avg_rating'] = round(4.2 + rng.uniform(-0.2, 0.2), 3)
+        counts.append(entry)
+    return counts
+
+
+def loop_statistics(daily_counts, restaurants, window):
+    # The same aggregates as deal_analytics.city_statistics, one dict at a time
+    entries = daily_counts
+
+    def rolling(values, mean=False):
+        result = []
+        for i in range(len(values)):
+            window_values = [v for v in values[max(0, i - window + 1):i + 1] if v is not None]
+            if mean:
+                result.append(sum(window_values) / len(window_values) if window_values else None)
+            else:
+                result.append(float(sum(window_values)))
+        return result
+
+    churn = []
+    for i, entry in enumerate(entries):
+        previous = entries[i - 1]['total_restaurants'] if i else 0
+        churn.append((entry['new_restaurants'] + entry['removed_restaurants']) / previous if previous else None)
+
+    tags = {}
+    for r in restaurants:
+        for name in dict.fromkeys(t['name'] for t in r.get('tags', [])):
+            tag = tags.setdefault(name, {'restaurants': 0, 'deals': 0, 'ratings': []})
+            tag['restaurants'] += 1
+            tag['deals'] += len(r.get('deals', []))
+            if r.get('avgRating') is not None:
+                tag['ratings'].append(r['avgRating'])
+
+    distribution = {}
+    for r in restaurants:
+        distribution[len(r.get('deals', []))] = distribution.get(len(r.get('deals', [])), 0) + 1
+
+    return {
+        'rolling_new_restaurants': rolling([e['new_restaurants'] for e in entries]),
+        'rolling_total_deals': rolling([e['total_deals'] for e in entries], mean=True),
+        'churn_rate': churn,
+        'rolling_churn_rate': rolling(churn, mean=True),
+        'rolling_avg_rating': rolling([e.get('avg_rating') for e in entries], mean=True),
+        'deal_count_distribution': [distribution.get(n, 0) for n in range(max(distribution, default=-1) + 1)],
+        'tags': {name: (tag['restaurants'], tag['deals'], sum(tag['ratings']) / len(tag['ratings'])
+                        if tag['ratings'] else None) for name, tag in tags.items()}
+    }
+
+
+def same_series(vectorised, loop):
+    vectorised = deal_analytics.to_json(vectorised, digits=9)
+    return len(vectorised) == len(loop) and all(
+        (a is None and b is None) or (a is not None and b is not None and abs(a - b) < 1e-6)
+        for a, b in zip(vectorised, loop))
+
+
+def bench_analytics(args):
+    restaurants = synthetic_snapshot(args.restaurants)
+    for r in restaurants:
+        r['deals'] = r['deals'] * (int(r['uuid'][-3:]) % 4)
+    print(f"{args.cities} cities, {args.days} days each, {args.restaurants} restaurants per snapshot, "
+          f"{args.window}-day window")
+    histories = [synthetic_daily_counts(args.days, seed) for seed in range(args.cities)]
+
+    def vectorised():
+        snapshot = deal_analytics.Snapshot(restaurants)
+        return [deal_analytics.city_statistics(deal_analytics.CityHistory(counts), snapshot, args.window)
+                for counts in histories]
+
+    def loop():
+        return [loop_statistics(counts, restaurants, args.window) for counts in histories]
+
+    vectorised_results, vectorised_seconds = timed(vectorised)
+    loop_results, loop_seconds = timed(loop)
+
+    for fast, slow in zip(vectorised_results, loop_results):
+        for name in ('rolling_new_restaurants', 'rolling_total_deals', 'churn_rate', 'rolling_churn_rate',
+                     'rolling_avg_rating'):
+            assert same_series(fast['series'][name], slow[name]), name
+        assert deal_analytics.to_json(fast['deal_count_distribution']) == slow['deal_count_distribution']
+        assert {t['name']: (t['restaurants'], t['deals']) for t in fast['tags']} == \
+            {name: values[:2] for name, values in slow['tags'].items()}
+        assert same_series([t['avg_rating'] for t in fast['tags']], [slow['tags'][t['name']][2] for t in fast['tags']])
+
+    print(f"  numpy:      {vectorised_seconds:.3f}s")
+    print(f"  dict loop:  {loop_seconds:.3f}s ({loop_seconds / vectorised_seconds:.1f}x slower)")
+
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ren', 'sta', 'vo', 'bel', 'dor', 'fin', 'gus', 'hai', 'ja', 'kor', 'lun', 'mar',
+             'nel', 'pio', 'ros', 'sal', 'tav', 'ulm', 'ver', 'wen', 'zai')
+
+
+def matcher_sides(count, seed=0, overlap=0.5):
+    # Neotaste-style and TheFork-style records; `overlap` of the Neotaste restaurants also appear
+    # on TheFork a few metres away under a slightly different name. The area grows with the count
+    # (10000 per side cover a Vienna-sized box), the way more cities add records at city density
+    rng = random.Random(seed)
+    span = (count / 10000) ** 0.5
+
+    def place():
+        return 48.12 + rng.random() * 0.2 * span, 16.18 + rng.random() * 0.4 * span
+
+    def name():
+        return ' '.join(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+                        for _ in range(rng.randint(1, 2)))
+
+    neotaste, thefork, truth = [], [], {}
+    for i in range(count):
+        lat, lng = place()
+        neotaste.append({'uuid': f'nt-{i}', 'name': name(), 'latitude': lat, 'longitude': lng})
+        if rng.random() < overlap:
+            variant = rng.choice(['Restaurant {}', '{} Wien', 'Ristorante {}', '{}', '{}!'])
+            thefork.append({'id': f'tf-{i}', 'name': variant.format(neotaste[-1]['name']),
+                            'geolocation': {'latitude': lat + rng.uniform(-3e-4, 3e-4),
+                                            'longitude': lng + rng.uniform(-4e-4, 4e-4)}})
+            truth[f'nt-{i}'] = f'tf-{i}'
+    while len(thefork) < count:
+        lat, lng = place()
+        thefork.append({'id': f'tf-x{len(thefork)}', 'name': name(), 'geolocation': {'latitude': lat, 'longitude': lng}})
+    rng.shuffle(thefork)
+    return neotaste, thefork, truth
+
+
+class BruteForceIndex:
+    # Same interface as restaurant_matcher.GridIndex, but every query scans all points
+    def __init__(self, points, cell_m=None):
+        self.points = list(points)
+
+    def query(self, lat, lng, radius_m):
+        for key, other_lat, other_lng in self.points:
+            distance = restaurant_matcher.haversine_m(lat, lng, other_lat, other_lng)
+            if distance <= radius_m:
+                yield key, distance
+
+
+def bench_matcher(args):
+    for size in args.sizes:
+        neotaste, thefork, truth = matcher_sides(size)
+        matches, seconds = timed(restaurant_matcher.match_restaurants, neotaste, thefork)
+        found = {m['neotaste_uuid']: m['thefork_id'] for m in matches}
+        correct = sum(truth.get(uuid) == thefork_id for uuid, thefork_id in found.items())
+        line = (f"  {size:>7} per side: grid {seconds:7.2f}s, {len(matches)} matches, "
+                f"precision {correct / max(len(found), 1):.3f}, recall {correct / max(len(truth), 1):.3f}")
+        if size <= args.brute_force_max:
+            brute, brute_seconds = timed(restaurant_matcher.match_restaurants, neotaste, thefork,
+                                         index_class=BruteForceIndex)
+            assert brute == matches, "grid index changed the matches"
+            line += f", brute force {brute_seconds:7.2f}s ({brute_seconds / seconds:.0f}x slower)"
+        print(line)
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def e2e_restaurants(args):
+    if not args.cassette:
+        return synthetic_restaurants(args.restaurants)
+    recorded = replay.recorded_restaurants(replay.Cassette(args.cassette))
+    assert recorded, f"no Neotaste restaurants recorded in {args.cassette}"
+    return replay.scale_restaurants(recorded, args.restaurants)
+
+
+def e2e_process_city(args):
+    # Listing, details, diff, persistence, derived files and integrity check for one city
+    restaurants = e2e_restaurants(args)
+    with StubServer(restaurants, latency=args.latency, error_rate=args.error_rate) as stub, \
+            tempfile.TemporaryDirectory() as workdir, working_directory(workdir):
+        scrapping.API_BASE_URL = stub.url
+        result, seconds, peak = peak_memory(lambda: scrapping.process_city('bench', rate_limit=None, cache_path=None))
+    assert result['restaurants'] == len(restaurants) and result['integrity_ok'], result
+    return len(restaurants), 'restaurants', seconds, peak
+
+
+def e2e_thefork_processing(args):
+    with tempfile.TemporaryDirectory() as folder:
+        write_thefork_folder(folder, args.thefork_files, args.thefork_items)
+        restaurants, seconds, peak = peak_memory(lambda: theforkProcessing.process_thefork_data(folder))
+    return len(restaurants), 'restaurants', seconds, peak
+
+
+def e2e_signature(args):
+    # Marker page, then every restaurant page fetched and parsed, as scrappingsignature.main does
+    pages = {f'/restaurant/{n}': signature_page(n) for n in range(args.signature_pages)}
+    with StubServer(pages=pages, latency=args.latency) as stub:
+        markers = json.dumps(signature_markers(args.signature_pages, stub.url))
+        pages['/2-for-1-gourmet-gutscheinbuch'] = (f'<html><body><div id="map" data-markers="{html.escape(markers)}">'
+                                                   f'</div></body></html>')
+
+        def scrape():
+            session = scrappingsignature.make_session(pool_size=args.workers)
+            soup = scrappingsignature.get_soup(f'{stub.url}/2-for-1-gourmet-gutscheinbuch', session)
+            results = scrappingsignature.scrape_restaurants(scrappingsignature.extract_marker_data(soup), stub.url,
+                                                            session, args.workers)
+            session.close()
+            return results
+
+        results, seconds, peak = peak_memory(scrape)
+    assert len(results) == args.signature_pages
+    return len(results), 'pages', seconds, peak
+
+
+E2E_WORKLOADS = {
+    'process_city': e2e_process_city,
+    'thefork_processing': e2e_thefork_processing,
+    'signature': e2e_signature
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def regression_baseline(history, current, name, size, runs):
+    # Medians over the last `runs` entries from the same machine and data at the same size
+    previous = [entry['workloads'][name] for entry in history
+                if (entry.get('machine'), entry.get('source')) == (current['machine'], current['source'])
+                and entry['workloads'].get(name, {}).get('size') == size][-runs:]
+    if not previous:
+        return None
+    return (statistics.median(w['throughput'] for w in previous), statistics.median(w['peak_mib'] for w in previous),
+            len(previous))
+
+
+def bench_e2e(args):
+    machine = f"{platform.node()} {platform.machine()} {os.cpu_count()} cpus python {platform.python_version()}"
+    history = load_history(args.history)
+    entry = {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+             'machine': machine, 'source': args.cassette or 'synthetic', 'workloads': {}}
+    regressions = []
+
+    print(f"End-to-end benchmarks on {machine}" + (f", Neotaste data from {args.cassette}" if args.cassette else ''))
+    for name in args.workloads:
+        with contextlib.redirect_stdout(io.StringIO()):
+            size, unit, seconds, peak = E2E_WORKLOADS[name](args)
+        workload = {'size': size, 'unit': unit, 'seconds': round(seconds, 3),
+                    'throughput': round(size / seconds, 2), 'peak_mib': round(peak / 2 ** 20, 2)}
+        entry['workloads'][name] = workload
+
+        line = (f"  {name:<20} {size:>7} {unit:<12} {seconds:7.2f}s  {workload['throughput']:9.1f} {unit}/s  "
+                f"peak {workload['peak_mib']:7.1f} MiB")
+        baseline = regression_baseline(history, entry, name, size, args.baseline_runs)
+        if baseline:
+            throughput, peak_mib, runs = baseline
+            line += f"  ({workload['throughput'] / throughput - 1:+.0%} throughput, " \
+                    f"{workload['peak_mib'] / peak_mib - 1 if peak_mib else 0:+.0%} memory vs median of {runs})"
+            if workload['throughput'] < throughput * (1 - args.tolerance):
+                regressions.append(f"{name} throughput {workload['throughput']} < {throughput} {unit}/s")
+            if peak_mib and workload['peak_mib'] > peak_mib * (1 + args.tolerance):
+                regressions.append(f"{name} peak memory {workload['peak_mib']} > {peak_mib} MiB")
+        print(line)
+
+    if not args.no_record:
+        os.makedirs(os.path.dirname(args.history) or '.', exist_ok=True)
+        with open(args.history, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        print(f"Appended to {args.history}")
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for the scraping pipeline')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    details = subparsers.add_parser('details', help='serial vs concurrent detail fetching against a local stub')
+    details.add_argument('--restaurants', type=int, default=100)
+    details.add_argument('--latency', type=float, default=0.05)
+    details.add_argument('--concurrency', type=int, default=scrapping.DETAIL_CONCURRENCY)
+    details.add_argument('--rate-limit', type=float, default=None)
+    details.add_argument('--error-rate', type=float, default=0.0, help='fraction of stub responses that fail')
+    details.add_argument('--retry-after', type=float, help='fail with 429 and this Retry-After instead of 503')
+    details.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS)
+    details.set_defaults(func=bench_details)
+
+    diff = subparsers.add_parser('diff', help='indexed change detection vs the original O(n^2) version')
+    diff.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    diff.add_argument('--legacy-max', type=int, default=10000,
+                      help='largest snapshot the quadratic baseline is run on')
+    diff.set_defaults(func=bench_diff)
+
+    thefork = subparsers.add_parser('thefork', help='TheFork folder processing throughput per worker count')
+    thefork.add_argument('--files', type=int, default=200)
+    thefork.add_argument('--items', type=int, default=100)
+    thefork.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    thefork.set_defaults(func=bench_thefork)
+
+    browser = subparsers.add_parser('browser', help='TheFork page fetching: browser per page vs a warm pool vs HTTP')
+    browser.add_argument('--pages', type=int, default=8)
+    browser.add_argument('--items', type=int, default=25)
+    browser.add_argument('--startup', type=float, default=1.5, help='simulated browser startup in seconds')
+    browser.add_argument('--latency', type=float, default=0.2)
+    browser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    browser.set_defaults(func=bench_browser)
+
+    summary = subparsers.add_parser('summary', help='append-only summary log vs rewriting summary.json every run')
+    summary.add_argument('--days', type=int, default=365)
+    summary.add_argument('--restaurants', type=int, default=500)
+    summary.set_defaults(func=bench_summary)
+
+    listing = subparsers.add_parser('listing', help='speculative vs serial listing pagination')
+    listing.add_argument('--restaurants', type=int, default=2000)
+    listing.add_argument('--page-size', type=int, default=20)
+    listing.add_argument('--latency', type=float, default=0.05)
+    listing.add_argument('--window', type=int, default=scrapping.LISTING_WINDOW)
+    listing.add_argument('--concurrency', type=int, default=scrapping.DETAIL_CONCURRENCY)
+    listing.add_argument('--rate-limit', type=float, default=None, help='requests per second (default: unlimited)')
+    listing.set_defaults(func=bench_listing)
+
+    snapshot = subparsers.add_parser('snapshot', help='memory-mapped binary snapshot vs json.load')
+    snapshot.add_argument('--restaurants', type=int, default=50000)
+    snapshot.add_argument('--lookups', type=int, default=1000)
+    snapshot.set_defaults(func=bench_snapshot)
+
+    records = subparsers.add_parser('records', help='slotted restaurant records and entry views vs dicts')
+    records.add_argument('--restaurants', type=int, default=100000)
+    records.set_defaults(func=bench_records)
+
+    history = subparsers.add_parser('history', help='time_travel reconstruction round trip over simulated daily runs')
+    history.add_argument('--days', type=int, default=90)
+    history.add_argument('--restaurants', type=int, default=1000)
+    history.add_argument('--churn', type=float, default=0.01)
+    history.add_argument('--interval', type=int, default=CHECKPOINT_INTERVAL_DAYS, help='days between checkpoints')
+    history.add_argument('--rerun-every', type=int, default=7, help='days between same-day second runs (0: never)')
+    history.set_defaults(func=bench_history)
+
+    content = subparsers.add_parser('content', help='history with a content-addressed deal/image store vs inline')
+    content.add_argument('--days', type=int, default=365)
+    content.add_argument('--restaurants', type=int, default=1000)
+    content.add_argument('--churn', type=float, default=0.01)
+    content.set_defaults(func=bench_content)
+
+    analytics = subparsers.add_parser('analytics', help='numpy deal statistics vs an equivalent dict loop')
+    analytics.add_argument('--cities', type=int, default=7)
+    analytics.add_argument('--days', type=int, default=3650)
+    analytics.add_argument('--restaurants', type=int, default=50000)
+    analytics.add_argument('--window', type=int, default=deal_analytics.DEFAULT_WINDOW)
+    analytics.set_defaults(func=bench_analytics)
+
+    matcher = subparsers.add_parser('matcher', help='Neotaste/TheFork restaurant matching with the grid index')
+    matcher.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    matcher.add_argument('--brute-force-max', type=int, default=2000,
+                         help='largest size the all-pairs baseline is run on')
+    matcher.set_defaults(func=bench_matcher)
+
+    signature = subparsers.add_parser('signature', help='signature.at scraping throughput per parser backend')
+    signature.add_argument('--pages', type=int, default=100)
+    signature.add_argument('--latency', type=float, default=0.05)
+    signature.add_argument('--workers', type=int, default=scrappingsignature.DEFAULT_WORKERS)
+    signature.add_argument('--parsers', nargs='+', default=list(scrappingsignature.PARSER_BACKENDS))
+    signature.add_argument('--fixtures', default=os.path.join('fixtures', 'signature'),
+                           help='directory of saved restaurant pages (*.html) or replay cassettes to check the '
+                                'stream extractor on')
+    signature.set_defaults(func=bench_signature)
+
+    e2e = subparsers.add_parser('e2e', help='process_city, TheFork processing and the signature scraper end to end, '
+                                            'compared against earlier runs')
+    e2e.add_argument('--workloads', nargs='+', choices=list(E2E_WORKLOADS), default=list(E2E_WORKLOADS))
+    e2e.add_argument('--restaurants', type=int, default=2000, help='Neotaste restaurants for process_city')
+    e2e.add_argument('--cassette', help='recorded responses (see replay.py) to build the Neotaste restaurants from')
+    e2e.add_argument('--latency', type=float, default=0.005)
+    e2e.add_argument('--error-rate', type=float, default=0.0)
+    e2e.add_argument('--thefork-files', type=int, default=200)
+    e2e.add_argument('--thefork-items', type=int, default=100)
+    e2e.add_argument('--signature-pages', type=int, default=300)
+    e2e.add_argument('--workers', type=int, default=scrappingsignature.DEFAULT_WORKERS)
+    e2e.add_argument('--history', default=os.path.join('.cache', 'benchmark_history.jsonl'),
+                     help='JSON lines file results are compared with and appended to (kept out of git)')
+    e2e.add_argument('--baseline-runs', type=int, default=5, help='earlier runs the median baseline is taken over')
+    e2e.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown / memory growth before flagging')
+    e2e.add_argument('--no-record', action='store_true', help="don't append this run to the history")
+    e2e.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 on a regression')
+    e2e.set_defaults(func=bench_e2e)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
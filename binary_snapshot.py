@@ -0,0 +1,211 @@
+import argparse
+import bisect
+import json
+import math
+import mmap
+import os
+import struct
+
+BINARY_NAME = 'latest_full_data.bin'
+MAGIC = b'NTSNAP1\0'
+VERSION = 1
+
+# magic, version, restaurants, total deals, record/index/string/blob section offsets, snapshot hash
+HEADER = struct.Struct('<8sHxxII4Q64s')
+# uuid, deal count, tag count, price range, avg rating (NaN when missing), latitude, longitude,
+# name (offset, length) in the string section, details and deals (offset, length) in the blob section
+RECORD = struct.Struct('<36sHHbxddd2I4I')
+# uuid, row: sorted by uuid so a lookup is a binary search over the mapped file
+INDEX_ENTRY = struct.Struct('<36sI')
+UUID_SIZE = 36
+
+NO_VALUE = -1
+
+
+def optional_float(value):
+    return float('nan') if value is None else float(value)
+
+
+def from_optional_float(value):
+    return None if math.isnan(value) else value
+
+
+def encode_uuid(uuid):
+    encoded = uuid.encode('ascii')
+    if len(encoded) > UUID_SIZE:
+        raise ValueError(f"uuid longer than {UUID_SIZE} bytes: {uuid}")
+    return encoded
+
+
+def encode_snapshot(data, digest=''):
+    # Restaurants keep their snapshot order; deals are a blob of their own so
+    # deal lookups skip decoding the rest of the restaurant
+    strings = bytearray()
+    blobs = bytearray()
+    records = bytearray()
+    total_deals = 0
+
+    for restaurant in data:
+        name = (restaurant.get('name') or '').encode('utf-8')
+        details = {key: value for key, value in restaurant.items() if key != 'deals'}
+        details_blob = json.dumps(details, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        deals = restaurant.get('deals', [])
+        deals_blob = json.dumps(deals, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        price_range = restaurant.get('priceRange')
+
+        records += RECORD.pack(
+            encode_uuid(restaurant['uuid']), len(deals), len(restaurant.get('tags', [])),
+            price_range if price_range is not None else NO_VALUE,
+            optional_float(restaurant.get('avgRating')), optional_float(restaurant.get('latitude')),
+            optional_float(restaurant.get('longitude')),
+            len(strings), len(name),
+            len(blobs), len(details_blob), len(blobs) + len(details_blob), len(deals_blob))
+        strings += name
+        blobs += details_blob + deals_blob
+        total_deals += len(deals)
+
+    index = b''.join(INDEX_ENTRY.pack(uuid, row) for uuid, row in
+                     sorted((encode_uuid(r['uuid']), row) for row, r in enumerate(data)))
+
+    records_offset = HEADER.size
+    index_offset = records_offset + len(records)
+    strings_offset = index_offset + len(index)
+    blobs_offset = strings_offset + len(strings)
+    header = HEADER.pack(MAGIC, VERSION, len(data), total_deals, records_offset, index_offset,
+                         strings_offset, blobs_offset, digest.encode('ascii'))
+    return b''.join((header, records, index, bytes(strings), bytes(blobs)))
+
+
+def write_binary_snapshot(path, data, digest=''):
+    # snapshot_store imports this module
+    from snapshot_store import atomic_write_bytes
+
+    atomic_write_bytes(path, encode_snapshot(data, digest))
+
+
+class BinarySnapshot:
+    # Read-only view of a snapshot written by write_binary_snapshot; the file is memory-mapped
+    # and a restaurant is only decoded when asked for, so counts and lookups touch a few pages
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.count, self.total_deals, self.records_offset, self.index_offset,
+         self.strings_offset, self.blobs_offset, digest) = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError(f"{path} is not a version {VERSION} binary snapshot")
+        self.digest = digest.rstrip(b'\0').decode('ascii') or None
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.map.close()
+
+    def _record(self, row):
+        if not 0 <= row < self.count:
+            raise IndexError(row)
+        return RECORD.unpack_from(self.map, self.records_offset + row * RECORD.size)
+
+    def _blob(self, offset, length):
+        start = self.blobs_offset + offset
+        return json.loads(self.map[start:start + length].decode('utf-8'))
+
+    def row(self, row):
+        # The fixed-width fields only
+        (uuid, deal_count, tag_count, price_range, avg_rating, latitude, longitude,
+         name_offset, name_length, _, _, _, _) = self._record(row)
+        start = self.strings_offset + name_offset
+        return {
+            'uuid': uuid.rstrip(b'\0').decode('ascii'),
+            'name': self.map[start:start + name_length].decode('utf-8'),
+            'deal_count': deal_count,
+            'tag_count': tag_count,
+            'priceRange': None if price_range == NO_VALUE else price_range,
+            'avgRating': from_optional_float(avg_rating),
+            'latitude': from_optional_float(latitude),
+            'longitude': from_optional_float(longitude)
+        }
+
+    def deals(self, row):
+        record = self._record(row)
+        return self._blob(record[11], record[12])
+
+    def restaurant(self, row):
+        record = self._record(row)
+        restaurant = self._blob(record[9], record[10])
+        restaurant['deals'] = self._blob(record[11], record[12])
+        return restaurant
+
+    def find(self, uuid):
+        # Row of uuid, or None
+        key = encode_uuid(uuid).ljust(UUID_SIZE, b'\0')
+        keys = IndexKeys(self)
+        position = bisect.bisect_left(keys, key)
+        if position < self.count and keys[position] == key:
+            return INDEX_ENTRY.unpack_from(self.map, self.index_offset + position * INDEX_ENTRY.size)[1]
+        return None
+
+    def get(self, uuid, default=None):
+        row = self.find(uuid)
+        return default if row is None else self.restaurant(row)
+
+    def __contains__(self, uuid):
+        return self.find(uuid) is not None
+
+    def __iter__(self):
+        for row in range(self.count):
+            yield self.restaurant(row)
+
+    def deal_counts(self):
+        # Straight off the record table, no blob is read
+        with memoryview(self.map) as view:
+            table = view[self.records_offset:self.index_offset]
+            try:
+                for record in RECORD.iter_unpack(table):
+                    yield record[1]
+            finally:
+                table.release()
+
+
+class IndexKeys:
+    # Sequence over the sorted uuid column, for bisect
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self):
+        return self.snapshot.count
+
+    def __getitem__(self, position):
+        start = self.snapshot.index_offset + position * INDEX_ENTRY.size
+        return self.snapshot.map[start:start + UUID_SIZE]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a city snapshot to the binary format or look into one')
+    parser.add_argument('city_data_dir')
+    parser.add_argument('--convert', action='store_true', help='(re)write the binary file from latest_full_data.json')
+    parser.add_argument('--uuid', action='append', default=[], help='print the restaurant with this uuid')
+    args = parser.parse_args()
+
+    path = os.path.join(args.city_data_dir, BINARY_NAME)
+    if args.convert:
+        from snapshot_store import SnapshotStore, snapshot_hash
+        data = SnapshotStore(args.city_data_dir).load_current()
+        write_binary_snapshot(path, data, snapshot_hash(data))
+
+    with BinarySnapshot(path) as snapshot:
+        print(f"{path}: {len(snapshot)} restaurants, {snapshot.total_deals} deals, "
+              f"{os.path.getsize(path) / 1024:.1f} KiB")
+        for uuid in args.uuid:
+            print(json.dumps(snapshot.get(uuid), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fetch_engine import make_session
+
+DEFAULT_BROWSERS = 4
+PAGE_LOAD_TIMEOUT = 10
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept': 'application/json'
+}
+
+
+def make_chrome_driver():
+    # Selenium is only needed once a page actually has to go through a browser
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    return webdriver.Chrome(options=chrome_options)
+
+
+def read_json_from_driver(driver, url, timeout=PAGE_LOAD_TIMEOUT):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    driver.get(url)
+    WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+    # Chrome renders a JSON response as the text of a single <pre>
+    return json.loads(driver.find_element(By.TAG_NAME, "pre").text)
+
+
+class BrowserPool:
+    # Keeps up to `size` headless browsers warm and lends them out one page at a time;
+    # a browser is only started when no idle one is left
+    def __init__(self, size=DEFAULT_BROWSERS, driver_factory=make_chrome_driver, read_json=read_json_from_driver):
+        self.size = size
+        self.driver_factory = driver_factory
+        self.read_json = read_json
+        self.idle = queue.Queue()
+        self.drivers = []
+        self.lock = threading.Lock()
+        self.started = 0
+
+    def _acquire(self):
+        while True:
+            try:
+                return self.idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self.lock:
+                start_new = len(self.drivers) < self.size
+                if start_new:
+                    # Reserve the slot before the slow startup so other threads wait instead
+                    self.drivers.append(None)
+            if start_new:
+                break
+            # Wake up now and then in case a discarded browser freed a slot
+            try:
+                return self.idle.get(timeout=0.5)
+            except queue.Empty:
+                pass
+
+        try:
+            driver = self.driver_factory()
+        except Exception:
+            with self.lock:
+                self.drivers.remove(None)
+            raise
+        with self.lock:
+            self.drivers[self.drivers.index(None)] = driver
+            self.started += 1
+        return driver
+
+    def _discard(self, driver):
+        with self.lock:
+            self.drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def run(self, func, *args):
+        driver = self._acquire()
+        try:
+            result = func(driver, *args)
+        except Exception:
+            # The browser may be wedged; the next page gets a fresh one
+            self._discard(driver)
+            raise
+        self.idle.put(driver)
+        return result
+
+    def fetch_json(self, url):
+        return self.run(self.read_json, url)
+
+    def close(self):
+        with self.lock:
+            drivers = [driver for driver in self.drivers if driver is not None]
+            self.drivers = []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PageNotFound(Exception):
+    # A _next/data URL 404s once the build id in it is outdated
+    pass
+
+
+def fetch_json_http(session, url):
+    # The _next/data endpoint often answers plain requests directly; a bot check
+    # shows up as a non-200 status or an HTML page instead of JSON
+    try:
+        response = session.get(url, timeout=PAGE_LOAD_TIMEOUT)
+    except requests.RequestException:
+        return None
+    if response.status_code == 404:
+        raise PageNotFound(url)
+    if response.status_code != 200:
+        return None
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+def page_url(url, page):
+    return f"{url}?p={page}"
+
+
+def total_pages(data):
+    pagination = data['pageProps']['searchPageResultsFetchResult'].get('pagination') or {}
+    return pagination.get('totalPage') or 1
+
+
+class PageFetcher:
+    # Fetches ?p= pages over plain HTTP and switches to the browser pool for good
+    # as soon as HTTP stops returning JSON
+    def __init__(self, pool, session=None, use_http=True):
+        self.pool = pool
+        self.session = session
+        self.use_http = use_http
+        self.http_pages = 0
+        self.browser_pages = 0
+
+    def fetch(self, url):
+        if self.use_http:
+            data = fetch_json_http(self.session, url)
+            if data is not None:
+                self.http_pages += 1
+                return data
+            print(f"Plain HTTP did not return JSON for {url}, using the browser pool")
+            self.use_http = False
+        data = self.pool.fetch_json(url)
+        self.browser_pages += 1
+        return data
+
+
+def fetch_promotion_pages(url, workers=DEFAULT_BROWSERS, session=None, use_http=True, pool=None):
+    # Page 1 tells how many pages there are; the rest are fetched across the workers.
+    # Pages come back in page order, None for pages that failed
+    own_session = session is None
+    session = session or make_session(pool_size=workers, headers=BROWSER_HEADERS)
+    own_pool = pool is None
+    pool = pool or BrowserPool(workers)
+    fetcher = PageFetcher(pool, session, use_http)
+
+    try:
+        first = fetcher.fetch(page_url(url, 1))
+        page_count = total_pages(first)
+
+        def fetch_page(page):
+            try:
+                return fetcher.fetch(page_url(url, page))
+            except Exception as e:
+                print(f"Failed to fetch page {page}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rest = list(executor.map(fetch_page, range(2, page_count + 1)))
+    finally:
+        if own_pool:
+            pool.close()
+        if own_session:
+            session.close()
+
+    print(f"Fetched {page_count} pages: {fetcher.http_pages} over HTTP, {fetcher.browser_pages} "
+          f"in the browser ({pool.started} browser starts)")
+    return [first] + rest
@@ -0,0 +1,211 @@
+import argparse
+import glob
+import gzip
+import json
+import math
+import os
+from datetime import datetime
+
+from snapshot_store import atomic_write_bytes, atomic_write_json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BUNDLE_NAME = 'bundle.min.json'
+# Same bins as createHistogram(values, 6, 50) in deal_statistics.html
+HISTOGRAM_BINS = 6
+HISTOGRAM_MAX = 50
+PRICE_RANGES = (1, 2, 3, 4)
+
+NEOTASTE_DEAL_FIELDS = ('name', 'value', 'conditions', 'locationCondition', 'daysToReset', 'status')
+
+
+def position(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    return [latitude, longitude]
+
+
+def compact_neotaste(restaurant):
+    # Only what the cards, popups and filters read (cards show the first image);
+    # tags live in the bundle's tag index
+    return {
+        'uuid': restaurant['uuid'],
+        'name': restaurant['name'],
+        'address': restaurant.get('address', ''),
+        'zipCode': restaurant.get('zipCode', ''),
+        'priceRange': restaurant.get('priceRange'),
+        'avgRating': restaurant.get('avgRating'),
+        'ratingsCount': restaurant.get('ratingsCount'),
+        'images': restaurant.get('images', [])[:1],
+        'deals': [{key: deal.get(key) for key in NEOTASTE_DEAL_FIELDS} for deal in restaurant.get('deals', [])],
+        'position': position(restaurant.get('latitude'), restaurant.get('longitude'))
+    }
+
+
+def compact_thefork(restaurant):
+    geolocation = restaurant.get('geolocation') or {}
+    return {
+        'id': restaurant['id'],
+        'name': restaurant['name'],
+        'address': restaurant['address'],
+        'rating': restaurant.get('rating'),
+        'reviewCount': restaurant.get('reviewCount'),
+        'priceRange': restaurant.get('priceRange'),
+        'averagePrice': restaurant.get('averagePrice'),
+        'cuisine': restaurant.get('cuisine'),
+        'photos': restaurant.get('photos', [])[:1],
+        'marketingOffer': restaurant.get('marketingOffer'),
+        'position': position(geolocation.get('latitude'), geolocation.get('longitude'))
+    }
+
+
+def thefork_savings(restaurant):
+    offer = restaurant.get('marketingOffer') or {}
+    return (restaurant.get('averagePrice') or 0) * (offer.get('discountPercentage') or 0) / 100
+
+
+def thefork_price_bucket(restaurant):
+    return math.ceil((restaurant.get('averagePrice') or 0) / 25)
+
+
+def histogram(values):
+    bin_size = HISTOGRAM_MAX / HISTOGRAM_BINS
+    counts = [0] * HISTOGRAM_BINS
+    for value in values:
+        counts[min(math.floor(value / bin_size), HISTOGRAM_BINS - 1)] += 1
+    return counts
+
+
+def mean(values):
+    return sum(values) / len(values) if values else 0
+
+
+def index_by(restaurants, keys_of):
+    index = {}
+    for i, restaurant in enumerate(restaurants):
+        for key in keys_of(restaurant):
+            index.setdefault(str(key), []).append(i)
+    return dict(sorted(index.items()))
+
+
+def neotaste_section(restaurants):
+    values = [d['value'] for r in restaurants for d in r.get('deals', []) if d.get('value') is not None]
+    by_price = {price: [] for price in PRICE_RANGES}
+    for r in restaurants:
+        if r.get('priceRange') in by_price:
+            by_price[r['priceRange']].extend(d['value'] for d in r.get('deals', []) if d.get('value') is not None)
+
+    return {
+        'restaurants': [compact_neotaste(r) for r in restaurants],
+        'tags': index_by(restaurants, lambda r: dict.fromkeys(t['name'] for t in r.get('tags', []))),
+        'price_buckets': index_by(restaurants, lambda r: [r['priceRange']] if r.get('priceRange') else []),
+        'stats': {
+            'restaurants': len(restaurants),
+            'deals': len(values),
+            'value_histogram': histogram(values),
+            'avg_value_by_price': [mean(by_price[price]) for price in PRICE_RANGES]
+        }
+    }
+
+
+def thefork_section(restaurants):
+    savings = [thefork_savings(r) for r in restaurants]
+    by_price = {price: [] for price in PRICE_RANGES}
+    for r, value in zip(restaurants, savings):
+        if thefork_price_bucket(r) in by_price:
+            by_price[thefork_price_bucket(r)].append(value)
+
+    return {
+        'restaurants': [compact_thefork(r) for r in restaurants],
+        # restaurants.js buckets TheFork prices by averagePrice, deal_statistics.html by priceRange
+        'price_buckets': index_by(restaurants, lambda r: [thefork_price_bucket(r)]),
+        'price_range_buckets': index_by(restaurants, lambda r: [r['priceRange']] if r.get('priceRange') else []),
+        'stats': {
+            'restaurants': len(restaurants),
+            'deals': len(savings),
+            'value_histogram': histogram(savings),
+            'avg_value_by_price': [mean(by_price[price]) for price in PRICE_RANGES]
+        }
+    }
+
+
+def latest_thefork_file(city_data_dir):
+    paths = sorted(glob.glob(os.path.join(city_data_dir, 'processed_thefork_data_*.json')))
+    return paths[-1] if paths else None
+
+
+def build_city_bundle(city_data_dir, city=None):
+    city = city or os.path.basename(os.path.normpath(city_data_dir))
+    with open(os.path.join(city_data_dir, 'latest_full_data.json'), 'r', encoding='utf-8') as f:
+        neotaste = json.load(f)
+
+    thefork_path = latest_thefork_file(city_data_dir)
+    thefork = []
+    if thefork_path:
+        with open(thefork_path, 'r', encoding='utf-8') as f:
+            thefork = json.load(f)
+
+    return {
+        'city': city,
+        'generated': datetime.now().strftime("%Y-%m-%d"),
+        'thefork_source': os.path.basename(thefork_path) if thefork_path else None,
+        'neotaste': neotaste_section(neotaste),
+        'thefork': thefork_section(thefork)
+    }
+
+
+def write_bundle(city_data_dir, bundle, precompress=False):
+    # Minified JSON; with precompress also .gz/.br copies for hosts that serve those files
+    # directly. They are build output and never committed
+    path = os.path.join(city_data_dir, BUNDLE_NAME)
+    atomic_write_json(path, bundle, ensure_ascii=False, separators=(',', ':'))
+    with open(path, 'rb') as f:
+        body = f.read()
+
+    variants = {path: len(body)}
+    if not precompress:
+        # Copies left from an earlier precompressed build would no longer match the bundle
+        for variant_path in (path + '.gz', path + '.br'):
+            if os.path.exists(variant_path):
+                os.remove(variant_path)
+        return variants
+
+    compressed = [(path + '.gz', gzip.compress(body, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compressed.append((path + '.br', brotli.compress(body, quality=11)))
+    for variant_path, data in compressed:
+        atomic_write_bytes(variant_path, data)
+        variants[variant_path] = len(data)
+    return variants
+
+
+def build_and_write(city_data_dir, city=None, precompress=False):
+    variants = write_bundle(city_data_dir, build_city_bundle(city_data_dir, city), precompress)
+    sizes = ', '.join(f"{os.path.basename(p)} {size / 1024:.1f} KiB" for p, size in variants.items())
+    print(f"Frontend bundle for {city or city_data_dir}: {sizes}")
+    return variants
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the minified per-city frontend bundles')
+    parser.add_argument('cities', nargs='*', help='city names (default: every directory in --data-dir)')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--precompress', action='store_true',
+                        help='also write .gz and .br copies of each bundle (for deployment, not for the repo)')
+    args = parser.parse_args()
+
+    cities = args.cities or sorted(name for name in os.listdir(args.data_dir)
+                                   if os.path.isdir(os.path.join(args.data_dir, name)))
+    for city in cities:
+        city_data_dir = os.path.join(args.data_dir, city)
+        if not os.path.exists(os.path.join(city_data_dir, 'latest_full_data.json')):
+            print(f"Skipping {city}: no latest_full_data.json")
+            continue
+        build_and_write(city_data_dir, city, args.precompress)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import json
+
+from restaurant_record import CHANGED_PROJECTION, ENTRY_PROJECTION, FIELDS, RECORD_PROJECTION, RestaurantView
+
+
+def restaurant_entry(r):
+    # A view, not a copy; json.dump it with default=to_json
+    return RestaurantView(r, ENTRY_PROJECTION)
+
+
+def record_entry(r):
+    # Every field, for history entries that time_travel replays
+    return RestaurantView(r, RECORD_PROJECTION)
+
+
+def changed_entry(r, new_deals, removed_deals):
+    return RestaurantView(r, CHANGED_PROJECTION, {'new_deals': new_deals, 'removed_deals': removed_deals})
+
+
+def deal_key(deal):
+    # Canonical form so that key order does not turn an unchanged deal into a change
+    return json.dumps(deal, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+
+def index_by_uuid(restaurants):
+    return {r['uuid']: r for r in restaurants}
+
+
+def diff_deals(current_deals, previous_deals):
+    current_keys = {}
+    for deal in current_deals:
+        current_keys.setdefault(deal_key(deal), deal)
+    previous_keys = {}
+    for deal in previous_deals:
+        previous_keys.setdefault(deal_key(deal), deal)
+
+    new_deals = [deal for key, deal in current_keys.items() if key not in previous_keys]
+    removed_deals = [deal for key, deal in previous_keys.items() if key not in current_keys]
+    return new_deals, removed_deals
+
+
+def compute_daily_changes(previous_data, data, today):
+    previous_index = index_by_uuid(previous_data)
+    current_index = index_by_uuid(data)
+
+    daily_changes = {
+        'date': today,
+        'new_restaurants': [record_entry(r) for r in data if r['uuid'] not in previous_index],
+        'removed_restaurants': [restaurant_entry(r) for r in previous_data if r['uuid'] not in current_index],
+        'existing_restaurants': [],
+        # Restaurants where only other fields (tags, slug, counts, deal order, ...) changed
+        'updated_restaurants': [],
+        'total_restaurants': len(data)
+    }
+
+    # Process existing restaurants for deal changes
+    for current in data:
+        previous = previous_index.get(current['uuid'])
+        if previous is None:
+            continue
+
+        current_deals = current.get('deals', [])
+        previous_deals = previous.get('deals', [])
+        if current_deals == previous_deals:
+            # Unchanged deal lists need no hashing
+            new_deals, removed_deals = [], []
+        else:
+            new_deals, removed_deals = diff_deals(current_deals, previous_deals)
+
+        if (new_deals or removed_deals or
+                current.get('avgRating') != previous.get('avgRating') or
+                current.get('priceRange') != previous.get('priceRange')):
+            daily_changes['existing_restaurants'].append(changed_entry(current, new_deals, removed_deals))
+        elif any(current.get(field) != previous.get(field) for field in FIELDS):
+            daily_changes['updated_restaurants'].append(record_entry(current))
+
+    return daily_changes
@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import json
+import os
+import zlib
+
+# Restaurant fields whose values are kept once per city and referenced by hash; a string
+# in one of them is a reference, a list is an inline value. new_deals and removed_deals
+# stay inline: they are the day's news and hardly ever repeat
+REFERENCED_FIELDS = ('deals', 'current_deals', 'images')
+RESTAURANT_LISTS = ('new_restaurants', 'removed_restaurants', 'existing_restaurants', 'updated_restaurants')
+HASH_LENGTH = 16
+
+
+def canonical_json(value):
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+
+def content_hash(value):
+    return hashlib.sha256(canonical_json(value).encode('utf-8')).hexdigest()[:HASH_LENGTH]
+
+
+class ContentStore:
+    # A per-city dictionary of deal lists and image lists under the hash of their content,
+    # so a restaurant's deals are stored once however many entries and checkpoints repeat
+    # them. Objects are only ever added: each flush appends one gzip member to
+    # content/objects.jsonl.gz
+    DIRNAME = 'content'
+    OBJECTS = 'objects.jsonl.gz'
+
+    def __init__(self, city_data_dir):
+        self.content_dir = os.path.join(city_data_dir, self.DIRNAME)
+        self.objects_path = os.path.join(self.content_dir, self.OBJECTS)
+        self._objects = None
+        self.valid_size = 0
+        self.pending = {}
+
+    @property
+    def objects(self):
+        if self._objects is None:
+            self._objects = {}
+            for member in self._read_members():
+                for line in member.decode('utf-8').splitlines():
+                    entry = json.loads(line)
+                    self._objects[entry['hash']] = entry['value']
+        return self._objects
+
+    def _read_members(self):
+        # A run that died mid-flush leaves a truncated last member; it is dropped here and
+        # cut off before the next flush. Nothing referring to it was written
+        self.valid_size = 0
+        if not os.path.exists(self.objects_path):
+            return
+        with open(self.objects_path, 'rb') as f:
+            data = memoryview(f.read())
+        while self.valid_size < len(data):
+            decompressor = zlib.decompressobj(wbits=31)
+            try:
+                member = decompressor.decompress(data[self.valid_size:])
+            except zlib.error:
+                break
+            if not decompressor.eof:
+                break
+            yield member
+            self.valid_size = len(data) - len(decompressor.unused_data)
+
+    def put(self, value):
+        digest = content_hash(value)
+        if digest not in self.objects and digest not in self.pending:
+            self.pending[digest] = value
+        return digest
+
+    def get(self, digest):
+        if digest in self.pending:
+            return self.pending[digest]
+        if digest not in self.objects:
+            raise KeyError(f"{digest} is not in {self.objects_path}")
+        return self.objects[digest]
+
+    def flush(self):
+        # Objects land before the entries that reference them are written
+        if not self.pending:
+            return 0
+        lines = ''.join(json.dumps({'hash': digest, 'value': value}, ensure_ascii=False, separators=(',', ':')) + '\n'
+                        for digest, value in self.pending.items())
+        os.makedirs(self.content_dir, exist_ok=True)
+        with open(self.objects_path, 'ab') as f:
+            if f.tell() > self.valid_size:
+                f.truncate(self.valid_size)
+            f.write(gzip.compress(lines.encode('utf-8'), mtime=0))
+            self.valid_size = f.tell()
+        written = len(self.pending)
+        self.objects.update(self.pending)
+        self.pending = {}
+        return written
+
+    def compact_restaurant(self, restaurant):
+        # Works on dicts, RestaurantRecords and change entry views alike; empty lists stay inline
+        return {key: self.put(value) if key in REFERENCED_FIELDS and isinstance(value, list) and value
+                else value for key, value in restaurant.items()}
+
+    def inflate_restaurant(self, restaurant):
+        return {key: self.get(value) if key in REFERENCED_FIELDS and isinstance(value, str) else value
+                for key, value in restaurant.items()}
+
+    def compact_changes(self, daily_changes):
+        compacted = dict(daily_changes)
+        for key in RESTAURANT_LISTS:
+            if key in compacted:
+                compacted[key] = [self.compact_restaurant(r) for r in compacted[key]]
+        return compacted
+
+    def inflate_changes(self, daily_changes):
+        inflated = dict(daily_changes)
+        for key in RESTAURANT_LISTS:
+            if key in inflated:
+                inflated[key] = [self.inflate_restaurant(r) for r in inflated[key]]
+        return inflated
+
+    def compact_snapshot(self, snapshot):
+        return [self.compact_restaurant(r) for r in snapshot]
+
+    def inflate_snapshot(self, snapshot):
+        return [self.inflate_restaurant(r) for r in snapshot]
+
+    def size(self):
+        return os.path.getsize(self.objects_path) if os.path.exists(self.objects_path) else 0
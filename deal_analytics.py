@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from snapshot_store import atomic_write_json
+from summary_store import SummaryStore
+
+STATISTICS_NAME = 'statistics.json'
+DEFAULT_WINDOW = 7
+RATING_TREND_DAYS = 90
+COUNT_FIELDS = ('total_restaurants', 'new_restaurants', 'removed_restaurants',
+                'restaurants_with_deal_changes', 'total_deals')
+
+
+class CityHistory:
+    # The summary's daily_counts as one typed column per field. They come one entry per day,
+    # in date order, from SummaryStore.daily_counts, which already combined same-day reruns
+    def __init__(self, daily_counts):
+        self.dates = np.array([entry['date'] for entry in daily_counts], dtype='datetime64[D]')
+        self.columns = {field: np.array([entry.get(field, 0) for entry in daily_counts], dtype=np.int64)
+                        for field in COUNT_FIELDS}
+        # Days recorded before the average rating was tracked are NaN
+        self.avg_rating = np.array([np.nan if entry.get('avg_rating') is None else entry['avg_rating']
+                                    for entry in daily_counts], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, field):
+        return self.columns[field]
+
+
+class Snapshot:
+    # latest_full_data.json flattened into arrays: one row per restaurant, one row per (restaurant, tag)
+    def __init__(self, restaurants):
+        self.deal_counts = np.array([len(r.get('deals', [])) for r in restaurants], dtype=np.int64)
+        self.ratings = np.array([np.nan if r.get('avgRating') is None else r['avgRating'] for r in restaurants],
+                                dtype=np.float64)
+
+        tag_ids = {}
+        rows, tags = [], []
+        for i, restaurant in enumerate(restaurants):
+            for name in dict.fromkeys(tag['name'] for tag in restaurant.get('tags', [])):
+                rows.append(i)
+                tags.append(tag_ids.setdefault(name, len(tag_ids)))
+        self.tag_names = list(tag_ids)
+        self.tag_rows = np.array(rows, dtype=np.int64)
+        self.tag_ids = np.array(tags, dtype=np.int64)
+
+
+def load_daily_counts(city_data_dir):
+    return SummaryStore(city_data_dir).daily_counts()
+
+
+def load_snapshot(city_data_dir):
+    path = os.path.join(city_data_dir, 'latest_full_data.json')
+    if not os.path.exists(path):
+        return Snapshot([])
+    with open(path, 'r', encoding='utf-8') as f:
+        return Snapshot(json.load(f))
+
+
+def load_all(data_dir='data'):
+    # city -> (CityHistory, Snapshot) for every city with a summary
+    cities = {}
+    for city in sorted(os.listdir(data_dir)):
+        city_data_dir = os.path.join(data_dir, city)
+        if SummaryStore(city_data_dir).exists():
+            cities[city] = (CityHistory(load_daily_counts(city_data_dir)), load_snapshot(city_data_dir))
+    return cities
+
+
+def rolling_sum(values, window):
+    # Sum over the last `window` days including today; shorter at the start
+    sums = np.cumsum(values, dtype=np.float64)
+    sums[window:] = sums[window:] - sums[:-window]
+    return sums
+
+
+def rolling_mean(values, window):
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return rolling_sum(values, window) / counts
+
+
+def rolling_nanmean(values, window):
+    # NaN days are left out of both the sum and the count
+    present = ~np.isnan(values)
+    counts = rolling_sum(present.astype(np.float64), window)
+    sums = rolling_sum(np.where(present, values, 0.0), window)
+    return np.divide(sums, counts, out=np.full(len(values), np.nan), where=counts > 0)
+
+
+def ratio(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.full(len(numerator), np.nan), where=denominator > 0)
+
+
+def churn_rate(history):
+    # Share of yesterday's restaurants that were added or removed today
+    previous_total = np.concatenate(([0], history['total_restaurants'][:-1]))
+    return ratio(history['new_restaurants'] + history['removed_restaurants'], previous_total)
+
+
+def trend_per_day(dates, values):
+    # Least-squares slope over the days that have a value
+    present = ~np.isnan(values)
+    if present.sum() < 2:
+        return None
+    days = (dates[present] - dates[present][0]).astype(np.float64)
+    if np.all(days == days[0]):
+        return None
+    return float(np.polyfit(days, values[present], 1)[0])
+
+
+def deal_count_distribution(snapshot):
+    return np.bincount(snapshot.deal_counts) if len(snapshot.deal_counts) else np.zeros(0, dtype=np.int64)
+
+
+def tag_breakdown(snapshot):
+    # Restaurants, deals and mean rating per tag, from one bincount per measure
+    tag_count = len(snapshot.tag_names)
+    restaurants = np.bincount(snapshot.tag_ids, minlength=tag_count)
+    deals = np.bincount(snapshot.tag_ids, weights=snapshot.deal_counts[snapshot.tag_rows], minlength=tag_count)
+    ratings = snapshot.ratings[snapshot.tag_rows]
+    rated = ~np.isnan(ratings)
+    rating_sums = np.bincount(snapshot.tag_ids[rated], weights=ratings[rated], minlength=tag_count)
+    rating_counts = np.bincount(snapshot.tag_ids[rated], minlength=tag_count)
+    return restaurants, deals, ratio(rating_sums, rating_counts)
+
+
+def city_statistics(history, snapshot, window=DEFAULT_WINDOW):
+    churn = churn_rate(history)
+    rating_trend = None
+    if len(history):
+        recent = history.dates >= history.dates[-1] - np.timedelta64(RATING_TREND_DAYS, 'D')
+        rating_trend = trend_per_day(history.dates[recent], history.avg_rating[recent])
+    tag_restaurants, tag_deals, tag_ratings = tag_breakdown(snapshot)
+
+    return {
+        'window': window,
+        'dates': history.dates,
+        'series': {
+            'total_restaurants': history['total_restaurants'],
+            'total_deals': history['total_deals'],
+            'deals_per_restaurant': ratio(history['total_deals'], history['total_restaurants']),
+            'rolling_new_restaurants': rolling_sum(history['new_restaurants'], window),
+            'rolling_removed_restaurants': rolling_sum(history['removed_restaurants'], window),
+            'rolling_deal_changes': rolling_sum(history['restaurants_with_deal_changes'], window),
+            'rolling_total_deals': rolling_mean(history['total_deals'], window),
+            'churn_rate': churn,
+            'rolling_churn_rate': rolling_nanmean(churn, window),
+            'avg_rating': history.avg_rating,
+            'rolling_avg_rating': rolling_nanmean(history.avg_rating, window)
+        },
+        'totals': {
+            'days': len(history),
+            'new_restaurants': int(history['new_restaurants'].sum()),
+            'removed_restaurants': int(history['removed_restaurants'].sum()),
+            'mean_churn_rate': float(np.nanmean(churn)) if np.any(~np.isnan(churn)) else None
+        },
+        'rating_trend_per_30_days': rating_trend * 30 if rating_trend is not None else None,
+        'deal_count_distribution': deal_count_distribution(snapshot),
+        'tags': sorted(({'name': name, 'restaurants': int(tag_restaurants[i]), 'deals': int(tag_deals[i]),
+                         'avg_rating': tag_ratings[i]} for i, name in enumerate(snapshot.tag_names)),
+                       key=lambda tag: (-tag['restaurants'], tag['name']))
+    }
+
+
+def to_json(value, digits=4):
+    # numpy arrays and scalars to plain JSON values; NaN becomes null
+    if isinstance(value, dict):
+        return {key: to_json(item, digits) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item, digits) for item in value]
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == 'M':
+            return value.astype(str).tolist()
+        return to_json(value.tolist(), digits)
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else round(float(value), digits)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def write_city_statistics(city_data_dir, city=None, window=DEFAULT_WINDOW):
+    history = CityHistory(load_daily_counts(city_data_dir))
+    statistics = city_statistics(history, load_snapshot(city_data_dir), window)
+    statistics = {'city': city or os.path.basename(os.path.normpath(city_data_dir)),
+                  'generated': datetime.now().strftime("%Y-%m-%d"), **to_json(statistics)}
+    atomic_write_json(os.path.join(city_data_dir, STATISTICS_NAME), statistics,
+                      ensure_ascii=False, separators=(',', ':'))
+    return statistics
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute deal statistics from the per-city summary history')
+    parser.add_argument('cities', nargs='*', help='city names (default: every city with a summary)')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='rolling window in days')
+    args = parser.parse_args()
+
+    cities = args.cities or sorted(name for name in os.listdir(args.data_dir)
+                                   if SummaryStore(os.path.join(args.data_dir, name)).exists())
+    for city in cities:
+        statistics = write_city_statistics(os.path.join(args.data_dir, city), city, args.window)
+        totals = statistics['totals']
+        print(f"{city}: {totals['days']} days, {totals['new_restaurants']} added, "
+              f"{totals['removed_restaurants']} removed, mean churn {totals['mean_churn_rate']}")
+
+
+if __name__ == '__main__':
+    main()
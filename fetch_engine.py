@@ -0,0 +1,119 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from http_cache import CachingAdapter
+from replay import configure_session
+from request_scheduler import AdaptiveLimiter, RequestScheduler
+
+
+def make_session(pool_size=10, headers=None, cache=None):
+    # Keep-alive connections are reused across requests to the same host
+    session = requests.Session()
+    if cache is not None:
+        adapter = CachingAdapter(cache, pool_connections=pool_size, pool_maxsize=pool_size)
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if headers:
+        session.headers.update(headers)
+    # Records into or replays from a cassette when SCRAPER_RECORD_DIR / SCRAPER_REPLAY_DIR is set
+    return configure_session(session, pool_size)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = None
+
+    async def acquire(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class FetchEngine:
+    # max_per_host is the ceiling of each host's adaptive concurrency limit
+    def __init__(self, max_per_host=8, rate_limit=None, headers=None, session=None, cache=None, scheduler=None):
+        self.max_per_host = max_per_host
+        self.rate_limit = rate_limit
+        self.session = session or make_session(max_per_host, headers, cache)
+        self.scheduler = scheduler or RequestScheduler()
+        self.executor = None
+        self.bucket = None
+        self.host_limits = {}
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.host_limits:
+            self.host_limits[host] = AdaptiveLimiter(self.max_per_host)
+        return self.host_limits[host]
+
+    async def get(self, url, params=None):
+        limiter = self._host_limit(url)
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.scheduler.pause_remaining())
+            response, error = None, None
+            async with limiter:
+                if self.bucket:
+                    await self.bucket.acquire()
+                try:
+                    response = await loop.run_in_executor(
+                        self.executor, lambda: self.session.get(url, params=params))
+                except requests.exceptions.RequestException as e:
+                    error = e
+            limiter.record(self.scheduler.is_healthy(response))
+
+            delay = self.scheduler.retry_delay(attempt, response, error)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            # The slot is free while this request waits
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def fetch_json(self, url, params=None):
+        response = await self.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def run(self, func, *args, **kwargs):
+        # Runs the coroutine func(engine, *args, **kwargs) to completion and returns its result
+        # Loop-bound primitives are recreated for every run
+        self.host_limits = {}
+        self.bucket = TokenBucket(self.rate_limit) if self.rate_limit else None
+        with ThreadPoolExecutor(max_workers=self.max_per_host) as executor:
+            self.executor = executor
+            try:
+                return asyncio.run(func(self, *args, **kwargs))
+            finally:
+                self.executor = None
+
+    def map(self, func, items):
+        # Runs func(engine, item) for every item and returns the results in input order
+        async def runner(engine):
+            return await asyncio.gather(*(func(engine, item) for item in items))
+
+        return self.run(runner)
+
+    def close(self):
+        self.session.close()
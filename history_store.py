@@ -0,0 +1,198 @@
+import gzip
+import json
+import os
+from datetime import date as Date
+
+from content_store import ContentStore
+from snapshot_store import atomic_write_bytes, atomic_write_json
+
+LEGACY_DIR = 'daily_changes'
+CHECKPOINT_INTERVAL_DAYS = 30
+
+
+class HistoryStore:
+    # Daily changes are appended as one gzip member per day to a segment file per month
+    # (history/YYYY-MM.jsonl.gz); index.json maps every date to its segment, offset and length.
+    # Deals and image lists in entries and checkpoints are hashes into the city's ContentStore
+    DIRNAME = 'history'
+    INDEX = 'index.json'
+
+    def __init__(self, city_data_dir):
+        self.city_data_dir = city_data_dir
+        self.history_dir = os.path.join(city_data_dir, self.DIRNAME)
+        self.index_path = os.path.join(self.history_dir, self.INDEX)
+        self._index = None
+        self.content = ContentStore(city_data_dir)
+
+    @property
+    def index(self):
+        if self._index is None:
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            else:
+                self._index = {}
+        return self._index
+
+    def _segment_path(self, segment):
+        return os.path.join(self.history_dir, segment)
+
+    def append(self, daily_changes, save_index=True):
+        date = daily_changes['date']
+        segment = f'{date[:7]}.jsonl.gz'
+        # Deals and image lists go to the content store; the entry keeps their hashes
+        compacted = self.content.compact_changes(daily_changes)
+        self.content.flush()
+        line = json.dumps(compacted, ensure_ascii=False, separators=(',', ':')) + '\n'
+        member = gzip.compress(line.encode('utf-8'), mtime=0)
+
+        os.makedirs(self.history_dir, exist_ok=True)
+        with open(self._segment_path(segment), 'ab') as f:
+            offset = f.tell()
+            f.write(member)
+
+        # Each run's entry is a diff against the run before it, so a rerun on the same day
+        # keeps the earlier entries and adds its own after them
+        runs = self.runs(date)
+        self.index[date] = runs + [[segment, offset, len(member)]] if runs else [segment, offset, len(member)]
+        if save_index:
+            self.save_index()
+
+    def save_index(self):
+        atomic_write_json(self.index_path, self.index, sort_keys=True, separators=(',', ':'))
+
+    def dates(self):
+        legacy_dir = os.path.join(self.city_data_dir, LEGACY_DIR)
+        dates = set(self.index)
+        if os.path.isdir(legacy_dir):
+            dates.update(name[:-5] for name in os.listdir(legacy_dir) if name.endswith('.json'))
+        return sorted(dates)
+
+    def runs(self, date):
+        # [segment, offset, length] of every run recorded for the date, oldest first; a day
+        # with a single run is indexed by that run's entry alone
+        entry = self.index.get(date)
+        if entry is None:
+            return []
+        return [entry] if isinstance(entry[0], str) else entry
+
+    def _read_member(self, segment, offset, length):
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            return self.content.inflate_changes(json.loads(gzip.decompress(f.read(length))))
+
+    def read_runs(self, date):
+        # Every run's changes for the date in the order they were made; replaying all of
+        # them gets from the day before to the day's last snapshot
+        runs = self.runs(date)
+        if runs:
+            return [self._read_member(*run) for run in runs]
+
+        # Days written before the history store existed
+        legacy_path = os.path.join(self.city_data_dir, LEGACY_DIR, f'{date}.json')
+        if os.path.exists(legacy_path):
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                return [json.load(f)]
+        return []
+
+    def read(self, date):
+        # The last run's changes for the date; see read_runs for days with reruns
+        runs = self.read_runs(date)
+        return runs[-1] if runs else None
+
+    def iter_changes(self, start=None, end=None):
+        for date in self.dates():
+            if (start is None or date >= start) and (end is None or date <= end):
+                yield from self.read_runs(date)
+
+    # Checkpoints are full snapshots that bound how many days a reconstruction has to replay
+    def _checkpoint_dir(self):
+        return os.path.join(self.history_dir, 'checkpoints')
+
+    def checkpoint_dates(self):
+        if not os.path.isdir(self._checkpoint_dir()):
+            return []
+        return sorted(name[:10] for name in os.listdir(self._checkpoint_dir()) if name.endswith('.json.gz'))
+
+    def write_checkpoint(self, date, snapshot):
+        os.makedirs(self._checkpoint_dir(), exist_ok=True)
+        path = os.path.join(self._checkpoint_dir(), f'{date}.json.gz')
+        compacted = self.content.compact_snapshot(snapshot)
+        self.content.flush()
+        body = json.dumps(compacted, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        atomic_write_bytes(path, gzip.compress(body, mtime=0))
+
+    def load_checkpoint(self, date):
+        with gzip.open(os.path.join(self._checkpoint_dir(), f'{date}.json.gz'), 'rt', encoding='utf-8') as f:
+            return self.content.inflate_snapshot(json.load(f))
+
+    def maybe_checkpoint(self, date, snapshot, interval_days=CHECKPOINT_INTERVAL_DAYS):
+        checkpoints = self.checkpoint_dates()
+        # A rerun on the same day refreshes that day's checkpoint, like its history entry
+        if checkpoints and checkpoints[-1] != date:
+            age = Date.fromisoformat(date) - Date.fromisoformat(checkpoints[-1])
+            if age.days < interval_days:
+                return False
+        self.write_checkpoint(date, snapshot)
+        return True
+
+    def migrate_legacy(self, delete=False):
+        legacy_dir = os.path.join(self.city_data_dir, LEGACY_DIR)
+        if not os.path.isdir(legacy_dir):
+            return 0
+
+        migrated = 0
+        for name in sorted(os.listdir(legacy_dir)):
+            if not name.endswith('.json') or name[:-5] in self.index:
+                continue
+            path = os.path.join(legacy_dir, name)
+            with open(path, 'r', encoding='utf-8') as f:
+                self.append(json.load(f), save_index=False)
+            migrated += 1
+
+        if migrated:
+            self.save_index()
+        if delete:
+            for name in os.listdir(legacy_dir):
+                if name.endswith('.json') and name[:-5] in self.index:
+                    os.remove(os.path.join(legacy_dir, name))
+
+        if delete and not os.listdir(legacy_dir):
+            os.rmdir(legacy_dir)
+        return migrated
+
+
+def read_changes(city_data_dir, date):
+    return HistoryStore(city_data_dir).read(date)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Read or migrate the per-city daily change history')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    show = subparsers.add_parser('show', help='print the changes recorded for one day')
+    show.add_argument('city_dir')
+    show.add_argument('date')
+
+    migrate = subparsers.add_parser('migrate', help='move daily_changes/*.json into the history store')
+    migrate.add_argument('city_dirs', nargs='+')
+    migrate.add_argument('--delete', action='store_true', help='remove the migrated daily_changes files')
+
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        runs = HistoryStore(args.city_dir).read_runs(args.date)
+        if not runs:
+            print(f"No changes recorded for {args.date}")
+        for changes in runs:
+            print(json.dumps(changes, ensure_ascii=False, indent=2))
+    else:
+        for city_dir in args.city_dirs:
+            migrated = HistoryStore(city_dir).migrate_legacy(delete=args.delete)
+            print(f"Migrated {migrated} daily change files in {city_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_CACHE_PATH = '.cache/http_cache.sqlite'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class HttpCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0, 'bytes_saved': 0}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Shared by the fetch engine's worker threads; every access goes through self.lock
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+        self.db.commit()
+
+    def lookup(self, url):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT status, headers, body, etag, last_modified FROM responses WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        status, headers, body, etag, last_modified = row
+        return {'status': status, 'headers': json.loads(headers), 'body': body,
+                'etag': etag, 'last_modified': last_modified}
+
+    def store(self, url, response):
+        body = response.content
+        # The stored body is already decoded, so transfer-level headers no longer apply
+        headers = {key: value for key, value in response.headers.items()
+                   if key.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, response.status_code, json.dumps(headers), body,
+                 response.headers.get('ETag'), response.headers.get('Last-Modified'), len(body), time.time()))
+            self.db.commit()
+            self.stats['stored'] += 1
+        self.evict()
+
+    def record_hit(self, url, size):
+        with self.lock:
+            self.db.execute('UPDATE responses SET last_used = ? WHERE url = ?', (time.time(), url))
+            self.db.commit()
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += size
+
+    def record_miss(self):
+        with self.lock:
+            self.stats['misses'] += 1
+
+    def evict(self):
+        # Drop least recently used responses until the cache fits in max_bytes
+        with self.lock:
+            total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for url, size in self.db.execute('SELECT url, size FROM responses ORDER BY last_used').fetchall():
+                self.db.execute('DELETE FROM responses WHERE url = ?', (url,))
+                self.stats['evicted'] += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            self.db.commit()
+
+    def summary(self):
+        return dict(self.stats)
+
+    def close(self):
+        self.db.close()
+
+
+class CachingAdapter(HTTPAdapter):
+    def __init__(self, cache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+
+        entry = self.cache.lookup(request.url)
+        if entry:
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and entry:
+            response.close()
+            self.cache.record_hit(request.url, len(entry['body']))
+            cached = self._cached_response(request, entry)
+            # The revalidation round trip still took this long
+            cached.elapsed = response.elapsed
+            return cached
+
+        self.cache.record_miss()
+        if response.status_code == 200 and ('ETag' in response.headers or 'Last-Modified' in response.headers):
+            self.cache.store(request.url, response)
+        return response
+
+    def _cached_response(self, request, entry):
+        response = Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = entry['body']
+        response.encoding = None
+        response.url = request.url
+        response.request = request
+        response.reason = 'OK (cached)'
+        response.from_cache = True
+        response.connection = self
+        return response
+
+
+def merge_stats(stats_list):
+    merged = {}
+    for stats in stats_list:
+        for key, value in stats.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def format_stats(stats):
+    return (f"{stats.get('hits', 0)} hits, {stats.get('misses', 0)} misses, "
+            f"{stats.get('bytes_saved', 0) / 1024:.1f} KiB saved")
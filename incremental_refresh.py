@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+from snapshot_store import atomic_write_json
+
+# Fields the cheap listing endpoint returns for every restaurant
+LISTING_FIELDS = ('name', 'slug', 'address', 'addressOptional', 'zipCode', 'latitude', 'longitude',
+                  'avgRating', 'ratingsCount', 'reviewsCount', 'priceRange')
+# Fields only the per-restaurant details endpoint fills in
+DETAIL_FIELDS = ('deals', 'tags', 'address', 'addressOptional', 'zipCode', 'latitude', 'longitude',
+                 'avgRating', 'ratingsCount', 'reviewsCount', 'images', 'priceRange')
+
+DEFAULT_DETAIL_TTL_HOURS = 168
+
+
+def listing_fingerprint(restaurant):
+    fields = {field: restaurant.get(field) for field in LISTING_FIELDS}
+    canonical = json.dumps(fields, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class DetailState:
+    FILENAME = 'detail_state.json'
+
+    def __init__(self, city_data_dir):
+        self.path = os.path.join(city_data_dir, self.FILENAME)
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = {}
+
+    def is_fresh(self, uuid, fingerprint, now, ttl):
+        entry = self.entries.get(uuid)
+        if not entry or entry['fingerprint'] != fingerprint:
+            return False
+        return now - datetime.fromisoformat(entry['fetched_at']) < ttl
+
+    def record(self, uuid, fingerprint, now):
+        self.entries[uuid] = {'fingerprint': fingerprint, 'fetched_at': now.isoformat(timespec='seconds')}
+
+    def prune(self, uuids):
+        self.entries = {uuid: entry for uuid, entry in self.entries.items() if uuid in uuids}
+
+    def save(self):
+        atomic_write_json(self.path, self.entries, indent=2, sort_keys=True)
+
+
+def plan_detail_refresh(restaurants, previous_snapshot, state, ttl_hours=DEFAULT_DETAIL_TTL_HOURS, now=None):
+    # Returns the restaurants that need a details request and their listing fingerprints;
+    # all others get their details copied over from the previous snapshot
+    now = now or datetime.now()
+    ttl = timedelta(hours=ttl_hours)
+    # A list of restaurants, or anything with get(uuid) such as a BinarySnapshot
+    if hasattr(previous_snapshot, 'get'):
+        previous_index = previous_snapshot
+    else:
+        previous_index = {r['uuid']: r for r in previous_snapshot}
+
+    to_fetch = []
+    fingerprints = {}
+    for restaurant in restaurants:
+        fingerprint = listing_fingerprint(restaurant)
+        fingerprints[restaurant['uuid']] = fingerprint
+        previous = previous_index.get(restaurant['uuid'])
+
+        if previous is not None and state.is_fresh(restaurant['uuid'], fingerprint, now, ttl):
+            restaurant.update({field: previous[field] for field in DETAIL_FIELDS if field in previous})
+        else:
+            to_fetch.append(restaurant)
+
+    return to_fetch, fingerprints
@@ -0,0 +1,132 @@
+import json
+import re
+
+STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+STRUCTURAL = re.compile(r'["{}\[\]]')
+WHITESPACE = re.compile(r'\s*')
+SCALAR_END = re.compile(r'[,}\]\s]')
+# Characters that can continue a number, e.g. after a chunk that ends in "1" or "1."
+NUMBER_CONTINUATION = frozenset('.eE+-0123456789')
+
+_decoder = json.JSONDecoder()
+
+
+class JsonStream:
+    # Minimal pull parser over a text file: navigates objects by key and skips
+    # unrelated values without materialising them, holding at most one chunk
+    # plus the value currently being decoded in memory
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of JSON input')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'Expected {char!r} at offset {self.pos}, found {self.buf[self.pos]!r}')
+        self.pos += 1
+
+    def read_string(self):
+        self.peek()
+        while True:
+            match = STRING.match(self.buf, self.pos)
+            if match:
+                self.pos = match.end()
+                return json.loads(match.group())
+            if not self._fill():
+                raise ValueError('Unterminated string in JSON input')
+
+    def skip_value(self):
+        char = self.peek()
+        if char == '"':
+            self.read_string()
+        elif char in '{[':
+            self.pos += 1
+            depth = 1
+            while depth:
+                match = STRUCTURAL.search(self.buf, self.pos)
+                if match is None:
+                    # Nothing structural left in the buffer, so none of it is needed any more
+                    self.pos = len(self.buf)
+                    if not self._fill():
+                        raise ValueError('Unexpected end of JSON input')
+                    continue
+                self.pos = match.start()
+                if match.group() == '"':
+                    self.read_string()
+                    continue
+                depth += 1 if match.group() in '{[' else -1
+                self.pos += 1
+        else:
+            while SCALAR_END.search(self.buf, self.pos) is None and self._fill():
+                pass
+            match = SCALAR_END.search(self.buf, self.pos)
+            self.pos = match.start() if match else len(self.buf)
+
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number cut off by the chunk boundary ("1" of "1.5", "2" of "2e3") decodes
+            # without error, so make sure whatever follows cannot continue it
+            if ((end == len(self.buf) or self.buf[end] in NUMBER_CONTINUATION) and not self.eof and
+                    self._fill()):
+                continue
+            self.pos = end
+            return value
+
+    def find_key(self, key):
+        self.expect('{')
+        while self.peek() != '}':
+            name = self.read_string()
+            self.expect(':')
+            if name == key:
+                return True
+            self.skip_value()
+            if self.peek() == ',':
+                self.pos += 1
+        self.pos += 1
+        return False
+
+
+def iter_array_items(f, path, chunk_size=1 << 16):
+    # Yields the elements of the array found by following the object keys in path
+    stream = JsonStream(f, chunk_size)
+    for key in path:
+        if not stream.find_key(key):
+            raise KeyError(key)
+
+    stream.expect('[')
+    if stream.peek() == ']':
+        return
+    while True:
+        yield stream.decode_value()
+        char = stream.peek()
+        stream.pos += 1
+        if char == ']':
+            return
+        if char != ',':
+            raise ValueError(f'Expected "," or "]" in array, found {char!r}')
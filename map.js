@@ -27,8 +27,11 @@ function updateMap(restaurants) {
     markers = [];
 
     restaurants.forEach(restaurant => {
-        const lat = restaurant.latitude || (restaurant.geolocation ? restaurant.geolocation.latitude : null);
-        const lng = restaurant.longitude || (restaurant.geolocation ? restaurant.geolocation.longitude : null);
+        // Bundle records carry [lat, lng]; the raw data files have separate fields
+        const [lat, lng] = restaurant.position || [
+            restaurant.latitude || (restaurant.geolocation ? restaurant.geolocation.latitude : null),
+            restaurant.longitude || (restaurant.geolocation ? restaurant.geolocation.longitude : null)
+        ];
 
         if (lat && lng) {
             const marker = L.marker([lat, lng]).addTo(map);
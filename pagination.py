@@ -0,0 +1,85 @@
+import asyncio
+
+import requests
+
+# Pages requested ahead of the last confirmed one, at the start and at most
+DEFAULT_WINDOW = 4
+MAX_WINDOW = 16
+
+
+def is_last_page(payload):
+    # isLastPage is authoritative, like in the serial walk; an empty page ends the listing too
+    return payload.get('meta', {}).get('isLastPage', False) or not payload.get('data')
+
+
+def is_short_page(payload, page_size):
+    # A page shorter than the first one hints that the end is near, but only isLastPage ends the listing
+    return len(payload.get('data') or []) < page_size
+
+
+async def fetch_page(engine, url, params, page):
+    return await engine.fetch_json(url, params={**params, 'page': page})
+
+
+async def fetch_pages(engine, url, params=None, window=DEFAULT_WINDOW, max_window=MAX_WINDOW, label=None):
+    # Returns the JSON payload of every page up to the last one, in page order. After page 1
+    # pages are requested `window` ahead; each full page widens the window by one (so it
+    # doubles every round trip while the listing goes on; a short page does not) and the
+    # first last page cancels everything requested past it. A failed page ends the listing
+    # there, like the serial walk.
+    params = dict(params or {})
+    label = label or url
+    try:
+        first = await fetch_page(engine, url, params, 1)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"An error occurred while fetching page 1 for {label}: {e}")
+        return []
+    pages = {1: first}
+    page_size = len(first.get('data') or [])
+    last_page = 1 if is_last_page(first) else None
+
+    in_flight = {}
+    next_page = 2
+    while True:
+        while last_page is None and len(in_flight) < window:
+            in_flight[asyncio.ensure_future(fetch_page(engine, url, params, next_page))] = next_page
+            next_page += 1
+        if not in_flight:
+            break
+
+        done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            page = in_flight.pop(task)
+            if last_page is not None and page > last_page:
+                continue
+            try:
+                payload = task.result()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"An error occurred while fetching page {page} for {label}: {e}")
+                last_page = page - 1 if last_page is None else min(last_page, page - 1)
+                continue
+            pages[page] = payload
+            if is_last_page(payload):
+                last_page = page if last_page is None else min(last_page, page)
+            elif not is_short_page(payload, page_size):
+                window = min(max_window, window + 1)
+
+        if last_page is not None:
+            for task, page in list(in_flight.items()):
+                if page > last_page:
+                    task.cancel()
+                    del in_flight[task]
+
+    return [pages[page] for page in range(1, last_page + 1)]
+
+
+def unique_by_uuid(items):
+    # Listings can shift while they are paged, so a restaurant may show up on two pages;
+    # the first occurrence keeps its place
+    seen = set()
+    unique = []
+    for item in items:
+        if item['uuid'] not in seen:
+            seen.add(item['uuid'])
+            unique.append(item)
+    return unique
@@ -0,0 +1,222 @@
+import argparse
+import base64
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+# Every session from fetch_engine.make_session records into / replays from these directories
+RECORD_ENV = 'SCRAPER_RECORD_DIR'
+REPLAY_ENV = 'SCRAPER_REPLAY_DIR'
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Retry-After')
+
+NEOTASTE_LISTING = '/cities/'
+NEOTASTE_DETAILS = '/restaurants/'
+
+
+def path_and_query(url):
+    parts = urlsplit(url)
+    return parts.path + ('?' + parts.query if parts.query else '')
+
+
+def origin(url):
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+class Cassette:
+    # A directory of recorded GET responses, one JSON line each; every recording process
+    # appends to its own file, so process-pool runs never interleave writes
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self._by_url = None
+
+    def _path(self):
+        return os.path.join(self.directory, f'recorded-{os.getpid()}.jsonl')
+
+    def record(self, response, *args, **kwargs):
+        # requests response hook
+        if response.request is None or response.request.method != 'GET':
+            return response
+        body = response.content or b''
+        try:
+            text, encoding = body.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            text, encoding = base64.b64encode(body).decode('ascii'), 'base64'
+        interaction = {
+            'url': response.request.url,
+            'status': response.status_code,
+            'headers': {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+            'encoding': encoding,
+            'body': text
+        }
+        line = json.dumps(interaction, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(), 'a', encoding='utf-8') as f:
+                f.write(line)
+        return response
+
+    def interactions(self):
+        if not os.path.isdir(self.directory):
+            return []
+        interactions = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.jsonl'):
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                    interactions.extend(json.loads(line) for line in f if line.strip())
+        return interactions
+
+    @property
+    def by_url(self):
+        # A URL recorded more than once (retries, reruns) replays its last successful response
+        if self._by_url is None:
+            self._by_url = {}
+            for interaction in self.interactions():
+                previous = self._by_url.get(interaction['url'])
+                if previous is None or previous['status'] != 200 or interaction['status'] == 200:
+                    self._by_url[interaction['url']] = interaction
+        return self._by_url
+
+    def lookup(self, url):
+        return self.by_url.get(url)
+
+
+def interaction_body(interaction):
+    if interaction['encoding'] == 'base64':
+        return base64.b64decode(interaction['body'])
+    return interaction['body'].encode('utf-8')
+
+
+class ReplayAdapter(HTTPAdapter):
+    # Answers every request from the cassette and never touches the network
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        interaction = self.cassette.lookup(request.url)
+        if interaction is None:
+            raise requests.exceptions.ConnectionError(f"{request.url} is not in the cassette {self.cassette.directory}",
+                                                      request=request)
+        response = Response()
+        response.status_code = interaction['status']
+        response.headers = CaseInsensitiveDict(interaction['headers'])
+        response._content = interaction_body(interaction)
+        response.encoding = None
+        response.url = request.url
+        response.request = request
+        response.reason = 'OK (replayed)' if response.status_code == 200 else 'Replayed'
+        response.connection = self
+        return response
+
+
+def configure_session(session, pool_size=10):
+    # Called by make_session; a no-op unless one of the environment variables is set
+    replay_dir = os.environ.get(REPLAY_ENV)
+    record_dir = os.environ.get(RECORD_ENV)
+    if replay_dir:
+        adapter = ReplayAdapter(Cassette(replay_dir), pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    elif record_dir:
+        session.hooks['response'].append(Cassette(record_dir).record)
+    return session
+
+
+def recorded_restaurants(cassette):
+    # Neotaste listing entries merged with their detail payloads, in listing order
+    listed, details = [], {}
+    for interaction in cassette.by_url.values():
+        if interaction['status'] != 200:
+            continue
+        path = urlsplit(interaction['url']).path
+        if path.startswith(NEOTASTE_LISTING) and path.rstrip('/').endswith('/restaurants'):
+            page = json.loads(interaction_body(interaction))
+            listed.append((page.get('meta', {}).get('page', 0), page.get('data', [])))
+        elif path.startswith(NEOTASTE_DETAILS):
+            data = json.loads(interaction_body(interaction)).get('data') or {}
+            if 'slug' in data:
+                details[data['slug']] = data
+
+    restaurants = []
+    for _, page in sorted(listed, key=lambda entry: entry[0]):
+        for restaurant in page:
+            restaurants.append({**restaurant, **details.get(restaurant['slug'], {})})
+    return restaurants
+
+
+def scale_restaurants(restaurants, count):
+    # Cycles the recorded restaurants up to count; copies get distinct uuids and slugs
+    scaled = []
+    for n in range(count):
+        restaurant = dict(restaurants[n % len(restaurants)])
+        copy = n // len(restaurants)
+        if copy:
+            restaurant['uuid'] = f"{copy:08x}{restaurant['uuid'][8:]}"
+            restaurant['slug'] = f"{restaurant['slug']}-{copy}"
+            restaurant['name'] = f"{restaurant['name']} ({copy})"
+        scaled.append(restaurant)
+    return scaled
+
+
+def recorded_documents(cassette, stub_url, skip_neotaste=False):
+    # path + query -> (status, headers, body) for StubServer; absolute links to the recorded
+    # sites are rewritten to the stub so follow-up requests land there too
+    origins = {origin(url) for url in cassette.by_url}
+    documents = {}
+    for url, interaction in cassette.by_url.items():
+        path = urlsplit(url).path
+        if skip_neotaste and (path.startswith(NEOTASTE_LISTING) or path.startswith(NEOTASTE_DETAILS)):
+            continue
+        body = interaction_body(interaction)
+        if interaction['encoding'] == 'utf-8':
+            text = body.decode('utf-8')
+            for recorded_origin in origins:
+                text = text.replace(recorded_origin, stub_url)
+                text = text.replace(recorded_origin.replace('/', '\\/'), stub_url.replace('/', '\\/'))
+            body = text.encode('utf-8')
+        documents[path_and_query(url)] = (interaction['status'], interaction['headers'], body)
+    return documents
+
+
+def main():
+    from stub_server import StubServer
+
+    parser = argparse.ArgumentParser(description='Serve recorded responses from a cassette directory locally. '
+                                                 f'Record one by running a scraper with {RECORD_ENV}=DIR; '
+                                                 f'replay it offline with {REPLAY_ENV}=DIR.')
+    parser.add_argument('cassette')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--retry-after', type=float, help='fail with 429 and this Retry-After instead of 503')
+    parser.add_argument('--restaurants', type=int,
+                        help='serve the recorded Neotaste restaurants cycled up to this many')
+    parser.add_argument('--page-size', type=int, default=20, help='Neotaste listing page size with --restaurants')
+    args = parser.parse_args()
+
+    cassette = Cassette(args.cassette)
+    restaurants = ()
+    if args.restaurants:
+        recorded = recorded_restaurants(cassette)
+        if not recorded:
+            parser.error(f"no Neotaste restaurants recorded in {args.cassette}")
+        restaurants = scale_restaurants(recorded, args.restaurants)
+
+    with StubServer(restaurants, args.latency, args.page_size, port=args.port, error_rate=args.error_rate,
+                    retry_after=args.retry_after) as stub:
+        stub.httpd.recorded = recorded_documents(cassette, stub.url, skip_neotaste=bool(restaurants))
+        print(f"Replaying {len(stub.httpd.recorded)} recorded responses"
+              f"{f' and {len(restaurants)} Neotaste restaurants' if restaurants else ''} on {stub.url}")
+        stub.thread.join()
+
+
+if __name__ == '__main__':
+    main()
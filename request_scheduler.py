@@ -0,0 +1,134 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+
+# Responses worth another attempt; anything else is final
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 30.0
+
+
+def retry_after_seconds(response):
+    # Retry-After is either a number of seconds or an HTTP date
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveLimiter:
+    # AIMD concurrency limit used like an asyncio.Semaphore: every healthy response adds
+    # 1/limit (one slot per window of successes), a 429/5xx halves it, at most once per cooldown
+    def __init__(self, maximum, initial=None, minimum=1, decrease=0.5, cooldown=1.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(initial or max(minimum, maximum // 2))
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = None
+
+    async def __aenter__(self):
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def record(self, healthy):
+        if healthy:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            return
+        now = time.monotonic()
+        if now - self.last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self.last_decrease = now
+
+
+class RequestScheduler:
+    # Retry policy shared by the sync and async fetch paths: exponential backoff with full
+    # jitter, Retry-After honoured, and a host-wide pause while the server asks us to wait
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'errors': 0}
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def is_healthy(self, response):
+        return response is not None and response.status_code not in RETRY_STATUSES
+
+    def retry_delay(self, attempt, response=None, error=None):
+        # Seconds to wait before attempt + 1, or None when the outcome is final
+        self._count('requests')
+        if error is None and self.is_healthy(response):
+            return None
+        if error is not None:
+            self._count('errors')
+        elif response.status_code in THROTTLE_STATUSES:
+            self._count('throttled')
+        if attempt + 1 >= self.max_attempts:
+            return None
+
+        delay = retry_after_seconds(response)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        else:
+            delay = min(delay, self.max_delay)
+            # The server asked everyone to back off, not just this request
+            with self.lock:
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        self._count('retries')
+        return delay
+
+    def pause_remaining(self):
+        return max(0.0, self.paused_until - time.monotonic())
+
+    def get(self, session, url, **kwargs):
+        # Sync GET with retries; returns the last response or raises the last connection error
+        attempt = 0
+        while True:
+            time.sleep(self.pause_remaining())
+            response, error = None, None
+            try:
+                response = (session or requests).get(url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                error = e
+            delay = self.retry_delay(attempt, response, error)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            print(f"Retrying {url} in {delay:.1f}s "
+                  f"({error or response.status_code}, attempt {attempt + 2} of {self.max_attempts})")
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,203 @@
+import argparse
+import json
+import math
+import os
+import re
+import unicodedata
+from datetime import datetime
+from difflib import SequenceMatcher
+
+from build_bundles import latest_thefork_file
+from snapshot_store import atomic_write_json
+
+MATCHES_NAME = 'restaurant_matches.json'
+DEFAULT_MAX_DISTANCE_M = 150
+DEFAULT_MIN_SCORE = 0.6
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEGREE = 111320
+
+# Words that say what kind of place it is rather than which one
+GENERIC_WORDS = {'restaurant', 'ristorante', 'trattoria', 'osteria', 'gasthaus', 'gasthof', 'wirtshaus', 'cafe',
+                 'caffe', 'bar', 'bistro', 'the', 'das', 'der', 'die', 'la', 'le', 'il', 'by', 'and', 'und',
+                 'wien', 'vienna'}
+
+
+def normalize_name(name):
+    # Accents folded, punctuation dropped and generic words removed: "Café Zum Hirschen, Wien" -> "zum hirschen"
+    folded = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode('ascii').lower()
+    folded = folded.replace('&', ' and ')
+    tokens = [t for t in re.findall(r'[a-z0-9]+', folded) if t not in GENERIC_WORDS]
+    return ' '.join(tokens)
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class GridIndex:
+    # Uniform grid of roughly cell_m x cell_m cells; a radius query only looks at the
+    # cells the search circle can touch, so lookups cost the local density, not n
+    def __init__(self, points, cell_m=DEFAULT_MAX_DISTANCE_M):
+        # points: (key, latitude, longitude)
+        self.points = list(points)
+        latitudes = sorted(lat for _, lat, _ in self.points)
+        reference_lat = latitudes[len(latitudes) // 2] if latitudes else 0.0
+        self.cell_m = cell_m
+        self.lat_step = cell_m / METERS_PER_DEGREE
+        self.lng_step = cell_m / (METERS_PER_DEGREE * max(math.cos(math.radians(reference_lat)), 0.01))
+        self.cells = {}
+        for i, (_, lat, lng) in enumerate(self.points):
+            self.cells.setdefault(self._cell(lat, lng), []).append(i)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.lat_step), math.floor(lng / self.lng_step))
+
+    def query(self, lat, lng, radius_m):
+        # Yields (key, distance in metres) for every point within radius_m
+        row, col = self._cell(lat, lng)
+        # A degree of longitude shrinks away from the equator, so the column span is worked out at this latitude
+        lng_radius = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(abs(lat) + self.lat_step)), 0.01))
+        rows = math.ceil(radius_m / self.cell_m)
+        cols = math.ceil(lng_radius / self.lng_step)
+        # Flat-earth distance is within a fraction of a percent at this scale, so it
+        # cheaply rules out most points before the exact haversine
+        lng_scale = math.cos(math.radians(lat))
+        limit = (radius_m * 1.01 / METERS_PER_DEGREE) ** 2
+        for r in range(row - rows, row + rows + 1):
+            for c in range(col - cols, col + cols + 1):
+                for i in self.cells.get((r, c), ()):
+                    key, other_lat, other_lng = self.points[i]
+                    if (other_lat - lat) ** 2 + ((other_lng - lng) * lng_scale) ** 2 > limit:
+                        continue
+                    distance = haversine_m(lat, lng, other_lat, other_lng)
+                    if distance <= radius_m:
+                        yield key, distance
+
+
+def name_similarity(matcher, other, threshold=0.0):
+    # matcher has the Neotaste name as its second sequence, which SequenceMatcher caches;
+    # the cheap upper bounds skip the full comparison for names that cannot reach threshold
+    matcher.set_seq1(other)
+    if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+        return 0.0
+    return matcher.ratio()
+
+
+def score_pair(name_score, distance_m, max_distance_m):
+    # Mostly the name; being closer only breaks near-ties between similar names
+    return 0.85 * name_score + 0.15 * (1 - distance_m / max_distance_m)
+
+
+def neotaste_position(restaurant):
+    return restaurant.get('latitude'), restaurant.get('longitude')
+
+
+def thefork_position(restaurant):
+    geolocation = restaurant.get('geolocation') or {}
+    return geolocation.get('latitude'), geolocation.get('longitude')
+
+
+def candidate_pairs(neotaste, thefork, max_distance_m=DEFAULT_MAX_DISTANCE_M, min_score=DEFAULT_MIN_SCORE,
+                    index_class=GridIndex):
+    thefork_names = [normalize_name(r['name']) for r in thefork]
+    index = index_class(((j, lat, lng) for j, (lat, lng) in enumerate(map(thefork_position, thefork))
+                       if lat is not None and lng is not None), max_distance_m)
+
+    # Records without coordinates can still match on an identical name
+    by_name = {}
+    for j, name in enumerate(thefork_names):
+        if name:
+            by_name.setdefault(name, []).append(j)
+
+    pairs = []
+    for i, restaurant in enumerate(neotaste):
+        name = normalize_name(restaurant['name'])
+        if not name:
+            continue
+        lat, lng = neotaste_position(restaurant)
+        if lat is None or lng is None:
+            for j in by_name.get(name, ()):
+                pairs.append((score_pair(1.0, max_distance_m, max_distance_m), i, j, None))
+            continue
+
+        matcher = SequenceMatcher(None, '', name, autojunk=False)
+        for j, distance in index.query(lat, lng, max_distance_m):
+            similarity = 1.0 if thefork_names[j] == name else name_similarity(matcher, thefork_names[j], min_score)
+            score = score_pair(similarity, distance, max_distance_m)
+            if similarity >= min_score and score >= min_score:
+                pairs.append((score, i, j, distance))
+    return pairs
+
+
+def match_restaurants(neotaste, thefork, max_distance_m=DEFAULT_MAX_DISTANCE_M, min_score=DEFAULT_MIN_SCORE,
+                      index_class=GridIndex):
+    # Best-scoring pairs first, each restaurant linked at most once per side
+    pairs = candidate_pairs(neotaste, thefork, max_distance_m, min_score, index_class)
+    pairs.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+
+    matched_neotaste = set()
+    matched_thefork = set()
+    matches = []
+    for score, i, j, distance in pairs:
+        if i in matched_neotaste or j in matched_thefork:
+            continue
+        matched_neotaste.add(i)
+        matched_thefork.add(j)
+        matches.append({
+            'neotaste_uuid': neotaste[i]['uuid'],
+            'thefork_id': thefork[j]['id'],
+            'neotaste_name': neotaste[i]['name'],
+            'thefork_name': thefork[j]['name'],
+            'distance_m': round(distance, 1) if distance is not None else None,
+            'score': round(score, 3)
+        })
+
+    matches.sort(key=lambda match: match['neotaste_name'])
+    return matches
+
+
+def write_city_matches(city_data_dir, city=None, max_distance_m=DEFAULT_MAX_DISTANCE_M, min_score=DEFAULT_MIN_SCORE):
+    thefork_path = latest_thefork_file(city_data_dir)
+    if thefork_path is None:
+        return None
+
+    with open(os.path.join(city_data_dir, 'latest_full_data.json'), 'r', encoding='utf-8') as f:
+        neotaste = json.load(f)
+    with open(thefork_path, 'r', encoding='utf-8') as f:
+        thefork = json.load(f)
+
+    matches = match_restaurants(neotaste, thefork, max_distance_m, min_score)
+    atomic_write_json(os.path.join(city_data_dir, MATCHES_NAME), {
+        'city': city or os.path.basename(os.path.normpath(city_data_dir)),
+        'generated': datetime.now().strftime("%Y-%m-%d"),
+        'thefork_source': os.path.basename(thefork_path),
+        'neotaste_restaurants': len(neotaste),
+        'thefork_restaurants': len(thefork),
+        'max_distance_m': max_distance_m,
+        'min_score': min_score,
+        'matches': matches
+    }, ensure_ascii=False, indent=2)
+    print(f"Matched {len(matches)} of {len(neotaste)} Neotaste and {len(thefork)} TheFork restaurants")
+    return matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Link Neotaste and TheFork restaurants by location and name')
+    parser.add_argument('cities', nargs='+')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--max-distance', type=float, default=DEFAULT_MAX_DISTANCE_M, help='metres')
+    parser.add_argument('--min-score', type=float, default=DEFAULT_MIN_SCORE)
+    args = parser.parse_args()
+
+    for city in args.cities:
+        city_data_dir = os.path.join(args.data_dir, city)
+        if write_city_matches(city_data_dir, city, args.max_distance, args.min_score) is None:
+            print(f"No TheFork data for {city}")
+
+
+if __name__ == '__main__':
+    main()
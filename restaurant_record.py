@@ -0,0 +1,170 @@
+import sys
+from collections.abc import Mapping
+from itertools import chain
+
+# Every stored restaurant has these fields, in the order latest_full_data.json has always listed them
+FIELDS = ('uuid', 'name', 'slug', 'address', 'addressOptional', 'zipCode', 'latitude', 'longitude', 'deals',
+          'tags', 'avgRating', 'ratingsCount', 'reviewsCount', 'images', 'priceRange')
+FIELD_SET = frozenset(FIELDS)
+LIST_FIELDS = frozenset(('deals', 'tags', 'images'))
+STRING_FIELDS = frozenset(('address', 'addressOptional', 'zipCode'))
+# Values that repeat across thousands of restaurants and are kept once per process
+INTERNED_FIELDS = frozenset(('zipCode', 'addressOptional'))
+INTERNED_DEAL_FIELDS = frozenset(('name', 'type'))
+COMPACTED_FIELDS = INTERNED_FIELDS | {'tags', 'deals'}
+LISTING_FIELDS = tuple(field for field in FIELDS if field not in LIST_FIELDS)
+
+# Output key -> restaurant field of the daily change entries; None marks a value the entry carries itself
+ENTRY_PROJECTION = {field: field for field in ('name', 'uuid', 'deals', 'address', 'zipCode', 'latitude',
+                                               'longitude', 'avgRating', 'ratingsCount', 'reviewsCount',
+                                               'images', 'priceRange')}
+# History entries carry every field so a past snapshot can be rebuilt from them exactly
+RECORD_PROJECTION = {**ENTRY_PROJECTION, **{field: field for field in FIELDS if field not in ENTRY_PROJECTION}}
+CHANGED_PROJECTION = {'name': 'name', 'uuid': 'uuid', 'new_deals': None, 'removed_deals': None,
+                      'current_deals': 'deals',
+                      **{key: field for key, field in RECORD_PROJECTION.items() if key not in ('name', 'uuid', 'deals')}}
+# Missing from a snapshot dict these raise KeyError, like they always did
+REQUIRED_FIELDS = frozenset(('name', 'uuid'))
+LISTING_REQUIRED_FIELDS = REQUIRED_FIELDS | {'slug'}
+
+_shared_tags = {}
+
+
+def field_default(field):
+    if field in LIST_FIELDS:
+        return []
+    return '' if field in STRING_FIELDS else None
+
+
+def intern_string(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def shared_tag(tag):
+    # Tags are small dicts like {'name': 'Pizza'}; equal ones become one object. Like
+    # every list and dict a record holds, they are treated as read-only
+    if not isinstance(tag, dict):
+        return intern_string(tag)
+    try:
+        key = tuple(sorted(tag.items()))
+        return _shared_tags.setdefault(key, {intern_string(k): intern_string(v) for k, v in tag.items()})
+    except TypeError:
+        # Unhashable values (nested lists or dicts) keep their own copy
+        return tag
+
+
+def interned_deal(deal):
+    if not isinstance(deal, dict):
+        return deal
+    return {sys.intern(key): intern_string(value) if key in INTERNED_DEAL_FIELDS else value
+            for key, value in deal.items()}
+
+
+def compact_value(field, value):
+    if field in INTERNED_FIELDS:
+        return intern_string(value)
+    if field == 'tags' and value:
+        return [shared_tag(tag) for tag in value]
+    if field == 'deals' and value:
+        return [interned_deal(deal) for deal in value]
+    return value
+
+
+class RestaurantRecord(Mapping):
+    # One restaurant in fixed slots instead of a 15-key dict. It reads like the dict it
+    # replaces (r['deals'], r.get('avgRating'), r.update(details), json via to_json), so
+    # code that takes snapshot dicts takes records unchanged
+    __slots__ = FIELDS
+
+    def __init__(self, fields=(), **kwargs):
+        fields = dict(fields, **kwargs)
+        unknown = fields.keys() - FIELD_SET
+        if unknown:
+            raise KeyError(f"restaurant records have no field {min(unknown)!r}")
+        for field in FIELDS:
+            if field not in fields:
+                setattr(self, field, field_default(field))
+            elif field in COMPACTED_FIELDS:
+                setattr(self, field, compact_value(field, fields[field]))
+            else:
+                setattr(self, field, fields[field])
+
+    @classmethod
+    def from_listing(cls, restaurant):
+        # Only the fields the listing endpoint knows; deals, tags and images come with the details
+        return cls({field: restaurant[field] if field in LISTING_REQUIRED_FIELDS
+                    else restaurant.get(field, field_default(field))
+                    for field in LISTING_FIELDS})
+
+    def __getitem__(self, key):
+        if key not in FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        self.update(((key, value),))
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __contains__(self, key):
+        return key in FIELD_SET
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in FIELD_SET else default
+
+    def update(self, fields=(), **kwargs):
+        items = fields.items() if hasattr(fields, 'items') else fields
+        for key, value in chain(items, kwargs.items()):
+            if key in COMPACTED_FIELDS:
+                value = compact_value(key, value)
+            elif key not in FIELD_SET:
+                raise KeyError(f"restaurant records have no field {key!r}")
+            setattr(self, key, value)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in FIELDS}
+
+    def __repr__(self):
+        return f'RestaurantRecord(uuid={self.uuid!r}, name={self.name!r})'
+
+
+class RestaurantView(Mapping):
+    # A restaurant (record or snapshot dict) seen through a projection such as ENTRY_PROJECTION.
+    # Nothing is copied: lists are the restaurant's own and values are read on access
+    __slots__ = ('restaurant', 'projection', 'extra')
+
+    def __init__(self, restaurant, projection, extra=None):
+        self.restaurant = restaurant
+        self.projection = projection
+        self.extra = extra
+
+    def __getitem__(self, key):
+        field = self.projection[key]
+        if field is None:
+            return self.extra[key]
+        if field in REQUIRED_FIELDS:
+            return self.restaurant[field]
+        return self.restaurant.get(field, field_default(field))
+
+    def __iter__(self):
+        return iter(self.projection)
+
+    def __len__(self):
+        return len(self.projection)
+
+    def to_dict(self):
+        return {key: self[key] for key in self.projection}
+
+    def __repr__(self):
+        return f'RestaurantView({self.to_dict()!r})'
+
+
+def to_json(value):
+    # default= hook for json.dump(s): records and views are written as the dicts they stand for
+    if isinstance(value, (RestaurantRecord, RestaurantView)):
+        return value.to_dict()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
@@ -1,6 +1,8 @@
 let neotasteRestaurants = [];
 let theforkRestaurants = [];
 let currentCity = 'vienna';
+// Tag and price indices from the prebuilt city bundle, null when the raw files were loaded
+let bundleIndex = null;
 
 document.addEventListener('DOMContentLoaded', function() {
     document.getElementById('neotasteSource').addEventListener('change', fetchData);
@@ -28,23 +30,48 @@ function changeCity(event) {
 }
 
 
+async function loadCityBundle(city) {
+    try {
+        const response = await fetch(`./data/${city}/bundle.min.json`);
+        if (response.ok) {
+            return await response.json();
+        }
+    } catch (error) {
+        console.warn(`No bundle for ${city}, loading the full data files`, error);
+    }
+    return null;
+}
+
 async function fetchData() {
     const neotasteChecked = document.getElementById('neotasteSource').checked;
     const theforkChecked = document.getElementById('theforkSource').checked;
 
     try {
-        if (neotasteChecked) {
-            const neotasteResponse = await fetch(`./data/${currentCity}/latest_full_data.json`);
-            neotasteRestaurants = await neotasteResponse.json();
+        const bundle = await loadCityBundle(currentCity);
+        if (bundle) {
+            neotasteRestaurants = neotasteChecked ? bundle.neotaste.restaurants : [];
+            theforkRestaurants = theforkChecked ? bundle.thefork.restaurants : [];
+            bundleIndex = {
+                tags: bundle.neotaste.tags,
+                neotastePrices: bundle.neotaste.price_buckets,
+                theforkPrices: bundle.thefork.price_buckets
+            };
         } else {
-            neotasteRestaurants = [];
-        }
-
-        if (theforkChecked) {
-            const theforkResponse = await fetch(`./data/${currentCity}/processed_thefork_data_2024-08-27.json`);
-            theforkRestaurants = await theforkResponse.json();
-        } else {
-            theforkRestaurants = [];
+            bundleIndex = null;
+
+            if (neotasteChecked) {
+                const neotasteResponse = await fetch(`./data/${currentCity}/latest_full_data.json`);
+                neotasteRestaurants = await neotasteResponse.json();
+            } else {
+                neotasteRestaurants = [];
+            }
+
+            if (theforkChecked) {
+                const theforkResponse = await fetch(`./data/${currentCity}/processed_thefork_data_2024-08-27.json`);
+                theforkRestaurants = await theforkResponse.json();
+            } else {
+                theforkRestaurants = [];
+            }
         }
 
         initMap(currentCity);
@@ -58,7 +85,9 @@ async function fetchData() {
 function populateTagFilter() {
     const tagFilter = document.getElementById('tagFilter');
     tagFilter.innerHTML = '<option value="">All Tags</option>';
-    const allTags = [...new Set(neotasteRestaurants.flatMap(r => r.tags.map(t => t.name)))];
+    const allTags = bundleIndex
+        ? (neotasteRestaurants.length ? Object.keys(bundleIndex.tags) : [])
+        : [...new Set(neotasteRestaurants.flatMap(r => r.tags.map(t => t.name)))];
     allTags.forEach(tag => {
         const option = document.createElement('option');
         option.value = tag;
@@ -75,7 +104,10 @@ function filterRestaurants() {
     let filteredNeotaste = neotasteRestaurants;
     let filteredThefork = theforkRestaurants;
 
-    if (priceFilter) {
+    if (priceFilter && bundleIndex) {
+        filteredNeotaste = selectIndexed(filteredNeotaste, neotasteRestaurants, bundleIndex.neotastePrices[priceFilter]);
+        filteredThefork = selectIndexed(filteredThefork, theforkRestaurants, bundleIndex.theforkPrices[priceFilter]);
+    } else if (priceFilter) {
         filteredNeotaste = filteredNeotaste.filter(r => r.priceRange === parseInt(priceFilter));
         filteredThefork = filteredThefork.filter(r => Math.ceil(r.averagePrice / 25) === parseInt(priceFilter));
     }
@@ -85,7 +117,9 @@ function filterRestaurants() {
         filteredThefork = filteredThefork.filter(r => r.address.zipCode.startsWith(zipCodeFilter));
     }
 
-    if (tagFilter) {
+    if (tagFilter && bundleIndex) {
+        filteredNeotaste = selectIndexed(filteredNeotaste, neotasteRestaurants, bundleIndex.tags[tagFilter]);
+    } else if (tagFilter) {
         filteredNeotaste = filteredNeotaste.filter(r => r.tags.some(t => t.name === tagFilter));
         // TheFork doesn't have tags, so we don't filter it
     }
@@ -95,6 +129,12 @@ function filterRestaurants() {
     updateRestaurantCards(mergedRestaurants);
 }
 
+// Keeps the restaurants whose position in the bundle list is in the index entry
+function selectIndexed(restaurants, bundleRestaurants, positions) {
+    const selected = new Set((positions || []).map(i => bundleRestaurants[i]));
+    return restaurants.filter(r => selected.has(r));
+}
+
 function mergeRestaurants(neotasteRestaurants, theforkRestaurants) {
     const mergedRestaurants = [...neotasteRestaurants];
 
@@ -0,0 +1,229 @@
+import cProfile
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from snapshot_store import atomic_write_bytes
+
+# Upper bounds of the request latency histogram in seconds, Prometheus style (cumulative, plus +Inf)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_MODES = ('cpu', 'memory')
+DEFAULT_PROFILE_DIR = 'profiles'
+METRIC_PREFIX = 'neotaste_scrape'
+
+
+def wire_size(response):
+    # Body bytes as they came over the network, before gzip/br decoding. urllib3 counts them
+    # while the body is read; responses built without a connection (replay) fall back to the
+    # declared length of an encoded body, or the body itself
+    body = response.content or b''
+    tell = getattr(response.raw, 'tell', None)
+    if tell is not None:
+        try:
+            return tell()
+        except (OSError, ValueError):
+            pass
+    length = response.headers.get('Content-Length')
+    if response.headers.get('Content-Encoding') and length and length.isdigit():
+        return int(length)
+    return len(body)
+
+
+class RunMetrics:
+    # Stage timings and per-request counters for one city run. Everything ends up in
+    # to_dict(), which is plain JSON so results from worker processes can be merged
+    def __init__(self, label='run', profile=None, profile_dir=DEFAULT_PROFILE_DIR):
+        self.label = label
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.stages = {}
+        self.memory_peaks = {}
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.requests = 0
+        self.cached_responses = 0
+        self.bytes_received = 0
+        self.statuses = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        # Wall time of the block, added to earlier runs of the same stage
+        profiler = self._start_profile(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stop_profile(name, profiler)
+            with self.lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def _start_profile(self, name):
+        if self.profile == 'memory':
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        elif self.profile == 'cpu':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:
+                # Only one profiler can be active at a time
+                print(f"Not profiling {self.label}/{name}: {e}")
+                return None
+            return profiler
+        return None
+
+    def _stop_profile(self, name, profiler):
+        if self.profile == 'memory':
+            peak = tracemalloc.get_traced_memory()[1]
+            with self.lock:
+                self.memory_peaks[name] = max(self.memory_peaks.get(name, 0), peak)
+        elif profiler is not None:
+            profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f'{self.label}-{name}.prof')
+            profiler.dump_stats(path)
+            print(f"CPU profile for {self.label}/{name} written to {path} (read it with python -m pstats)")
+
+    def observe_response(self, response, *args, **kwargs):
+        # requests response hook; cached responses count their revalidation time but no body bytes
+        seconds = response.elapsed.total_seconds()
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+        from_cache = getattr(response, 'from_cache', False)
+        size = 0 if from_cache else wire_size(response)
+        with self.lock:
+            self.requests += 1
+            self.latency_counts[bucket] += 1
+            self.latency_sum += seconds
+            self.bytes_received += size
+            self.cached_responses += from_cache
+            status = str(response.status_code)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        return response
+
+    def instrument(self, session):
+        session.hooks['response'].append(self.observe_response)
+        return session
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+                'memory_peaks': dict(self.memory_peaks),
+                'requests': self.requests,
+                'cached_responses': self.cached_responses,
+                'bytes_received': self.bytes_received,
+                'statuses': dict(self.statuses),
+                'latency_sum': round(self.latency_sum, 4),
+                'latency_buckets': list(self.latency_counts)
+            }
+
+
+def merge_metrics(metrics_list):
+    merged = RunMetrics().to_dict()
+    for metrics in metrics_list:
+        for key in ('stages', 'memory_peaks', 'statuses'):
+            for name, value in metrics.get(key, {}).items():
+                if key == 'memory_peaks':
+                    merged[key][name] = max(merged[key].get(name, 0), value)
+                else:
+                    merged[key][name] = round(merged[key].get(name, 0) + value, 4)
+        for key in ('requests', 'cached_responses', 'bytes_received'):
+            merged[key] += metrics.get(key, 0)
+        merged['latency_sum'] = round(merged['latency_sum'] + metrics.get('latency_sum', 0), 4)
+        merged['latency_buckets'] = [a + b for a, b in
+                                     zip(merged['latency_buckets'], metrics.get('latency_buckets', []))]
+    return merged
+
+
+def latency_quantile(metrics, quantile):
+    # Upper bound of the bucket the quantile falls into (None above the last bound)
+    total = sum(metrics['latency_buckets'])
+    if not total:
+        return None
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS + (None,), metrics['latency_buckets']):
+        seen += count
+        if seen >= quantile * total:
+            return bound
+    return None
+
+
+def format_metrics(metrics):
+    stages = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in metrics['stages'].items())
+    p50, p95 = latency_quantile(metrics, 0.5), latency_quantile(metrics, 0.95)
+    latency = f"p50 <= {p50 * 1000:.0f} ms, p95 <= {p95 * 1000:.0f} ms" if p95 is not None else "p95 > 10 s"
+    line = (f"{stages}; {metrics['requests']} responses ({metrics['cached_responses']} cached), "
+            f"{metrics['bytes_received'] / 1024:.1f} KiB, {latency if metrics['requests'] else 'no requests'}")
+    if metrics['memory_peaks']:
+        line += '; peak memory ' + ', '.join(f"{name} {peak / 2 ** 20:.1f} MiB"
+                                             for name, peak in metrics['memory_peaks'].items())
+    return line
+
+
+def sample_line(name, labels, value):
+    label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+    return f'{METRIC_PREFIX}_{name}{{{label_text}}} {value}' if labels else f'{METRIC_PREFIX}_{name} {value}'
+
+
+def prometheus_lines(report):
+    # Text exposition format, e.g. for node_exporter's textfile collector
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        # samples: (labels, value), or (suffix, labels, value) for a histogram's series
+        lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+        lines.append(f'# TYPE {METRIC_PREFIX}_{name} {kind}')
+        for sample in samples:
+            suffix, labels, value = sample if len(sample) == 3 else ('', *sample)
+            lines.append(sample_line(name + suffix, labels, value))
+
+    cities = report['cities']
+    ok = [r for r in cities if r['status'] == 'ok']
+    with_metrics = [r for r in cities if r.get('metrics')]
+
+    metric('last_run_timestamp_seconds', 'gauge', 'When the run finished.', [({}, report['finished_at_unix'])])
+    metric('run_duration_seconds', 'gauge', 'Wall time of the whole run.', [({}, report['total_seconds'])])
+    metric('city_success', 'gauge', '1 if the city was processed without an exception.',
+           [({'city': r['city']}, int(r['status'] == 'ok')) for r in cities])
+    metric('city_duration_seconds', 'gauge', 'Wall time per city.', [({'city': r['city']}, r['seconds']) for r in cities])
+    metric('restaurants', 'gauge', 'Restaurants listed per city.', [({'city': r['city']}, r['restaurants']) for r in ok])
+    metric('detail_failures', 'gauge', 'Restaurants whose details could not be fetched.',
+           [({'city': r['city']}, r['details_failed']) for r in ok])
+    metric('stage_duration_seconds', 'gauge', 'Wall time per pipeline stage.',
+           [({'city': r['city'], 'stage': stage}, seconds)
+            for r in with_metrics for stage, seconds in r['metrics']['stages'].items()])
+    metric('stage_memory_peak_bytes', 'gauge', 'Python heap peak per stage (memory profile mode only).',
+           [({'city': r['city'], 'stage': stage}, peak)
+            for r in with_metrics for stage, peak in r['metrics']['memory_peaks'].items()])
+    # These are counted per run, so they are exported as gauges: a counter would
+    # have to keep growing across runs, and these reset every time the scraper starts
+    metric('response_bytes', 'gauge', 'Response body bytes received over the network in the last run, '
+           'before decompression.', [({'city': r['city']}, r['metrics']['bytes_received']) for r in with_metrics])
+    metric('responses', 'gauge', 'HTTP responses by status code in the last run.',
+           [({'city': r['city'], 'code': code}, count)
+            for r in with_metrics for code, count in r['metrics']['statuses'].items()])
+    for key in ('retries', 'throttled', 'errors'):
+        metric(f'request_{key}', 'gauge', f'Request scheduler {key} in the last run.',
+               [({'city': r['city']}, r['requests'][key]) for r in ok if r.get('requests')])
+
+    histogram = []
+    for r in with_metrics:
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), r['metrics']['latency_buckets']):
+            cumulative += count
+            histogram.append(('_bucket', {'city': r['city'], 'le': bound}, cumulative))
+        histogram.append(('_sum', {'city': r['city']}, r['metrics']['latency_sum']))
+        histogram.append(('_count', {'city': r['city']}, r['metrics']['requests']))
+    metric('request_duration_seconds', 'histogram', 'HTTP request latency up to the response headers.', histogram)
+    return lines
+
+
+def write_prometheus_textfile(path, report):
+    # Written next to the target and renamed so the collector never reads half a file
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    atomic_write_bytes(path, ('\n'.join(prometheus_lines(report)) + '\n').encode('utf-8'))
@@ -2,56 +2,60 @@ import requests
 import json
 from datetime import datetime
 import os
+import sys
 import time
-
-def fetch_neotaste_data(city):
-    base_url = f"https://api.neotaste.com/cities/{city}/restaurants/"
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from build_bundles import build_and_write
+from change_detection import compute_daily_changes
+from deal_analytics import write_city_statistics
+from fetch_engine import FetchEngine, make_session
+from history_store import HistoryStore
+from restaurant_matcher import write_city_matches
+from http_cache import DEFAULT_CACHE_PATH, HttpCache, format_stats, merge_stats
+from incremental_refresh import DEFAULT_DETAIL_TTL_HOURS, DetailState, plan_detail_refresh
+from pagination import DEFAULT_WINDOW as LISTING_WINDOW, MAX_WINDOW, fetch_pages, unique_by_uuid
+from request_scheduler import RequestScheduler
+from restaurant_record import RestaurantRecord
+from run_metrics import (DEFAULT_PROFILE_DIR, PROFILE_MODES, RunMetrics, format_metrics, merge_metrics,
+                         write_prometheus_textfile)
+from snapshot_store import SnapshotStore, snapshot_hash
+from summary_store import SummaryStore, migrate as migrate_summary
+
+API_BASE_URL = os.environ.get('NEOTASTE_API_URL', 'https://api.neotaste.com')
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://neotaste.com/',
+    'Origin': 'https://neotaste.com'
+}
+
+# Requests in flight per host and overall requests per second, for the listing and the details
+DETAIL_CONCURRENCY = 8
+DETAIL_RATE_LIMIT = 10
+
+CITIES = ["karlsruhe", "freiburg", "heidelberg", "mannheim", "frankfurt", "vienna", "mainz"]
+DEFAULT_CITY_WORKERS = 4
+
+def fetch_neotaste_pages_serial(city, session=None, scheduler=None):
+    base_url = f"{API_BASE_URL}/cities/{city}/restaurants/"
     params = {"citySlug": city, "page": 1}
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Referer': 'https://neotaste.com/',
-        'Origin': 'https://neotaste.com'
-    }
-
-    all_restaurants = []
-    total_pages = 0
+    scheduler = scheduler or RequestScheduler()
+    pages = []
 
     while True:
         try:
-            response = requests.get(base_url, params=params, headers=headers)
+            response = scheduler.get(session, base_url, params=params, headers=HEADERS)
             response.raise_for_status()
             data = response.json()
-
-            for restaurant in data['data']:
-                all_restaurants.append({
-                    'uuid': restaurant['uuid'],
-                    'name': restaurant['name'],
-                    'slug': restaurant['slug'],
-                    'address': restaurant.get('address', ''),
-                    'addressOptional': restaurant.get('addressOptional', ''),
-                    'zipCode': restaurant.get('zipCode', ''),
-                    'latitude': restaurant.get('latitude'),
-                    'longitude': restaurant.get('longitude'),
-                    'deals': [],
-                    'tags': [],
-                    'avgRating': restaurant.get('avgRating'),
-                    'ratingsCount': restaurant.get('ratingsCount'),
-                    'reviewsCount': restaurant.get('reviewsCount'),
-                    'images': [],
-                    'priceRange': restaurant.get('priceRange')
-                })
-
-            total_pages += 1
-
-            print(f"Fetched page {params['page']} for {city}: {len(data['data'])} restaurants")
+            pages.append(data)
 
             if data['meta']['isLastPage']:
                 break
 
             params['page'] += 1
-            time.sleep(1)
 
         except requests.exceptions.RequestException as e:
             print(f"An error occurred while fetching page {params['page']} for {city}: {e}")
@@ -60,469 +64,428 @@ def fetch_neotaste_data(city):
                 print(f"Response body: {e.response.text}")
             break
 
-    print(f"\nTotal restaurants fetched for {city}: {len(all_restaurants)}")
-    print(f"Total pages: {total_pages}")
-
-    return all_restaurants
+    return pages
 
-def fetch_restaurant_details(slug):
-    url = f"https://api.neotaste.com/restaurants/{slug}/"
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Referer': 'https://neotaste.com/',
-        'Origin': 'https://neotaste.com'
-    }
+def listing_window_limit(concurrency=DETAIL_CONCURRENCY):
+    # The speculative window never asks for more pages than the city's host budget lets run at once
+    return max(1, min(MAX_WINDOW, concurrency))
 
+def fetch_neotaste_pages(city, session=None, scheduler=None, window=LISTING_WINDOW, concurrency=DETAIL_CONCURRENCY,
+                         rate_limit=DETAIL_RATE_LIMIT):
+    # Pages after the first are requested `window` at a time; see pagination.fetch_pages.
+    # The listing goes to the same host as the details and gets the same budget
+    max_window = listing_window_limit(concurrency)
+    engine = FetchEngine(max_per_host=max_window, rate_limit=rate_limit, headers=HEADERS, session=session,
+                         scheduler=scheduler)
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        details = {
-            'deals': data['data'].get('deals', []),
-            'tags': data['data'].get('tags', []),
-            'address': data['data'].get('address', ''),
-            'addressOptional': data['data'].get('addressOptional', ''),
-            'zipCode': data['data'].get('zipCode', ''),
-            'latitude': data['data'].get('latitude'),
-            'longitude': data['data'].get('longitude'),
-            'avgRating': data['data'].get('avgRating'),
-            'ratingsCount': data['data'].get('ratingsCount'),
-            'reviewsCount': data['data'].get('reviewsCount'),
-            'images': [img['url'] for img in data['data'].get('images', [])],
-            'priceRange': data['data'].get('priceRange')
-        }
-        
-        return details
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred while fetching details for {slug}: {e}")
-        return None
-
-def save_structured_data(data, city):
-    today = datetime.now().strftime("%Y-%m-%d")
-    city_data_dir = f'data/{city}'
-    os.makedirs(city_data_dir, exist_ok=True)
-    
-    # Save latest full data
-    with open(f'{city_data_dir}/latest_full_data.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-    # Load previous data to compare changes
-    if os.path.exists(f'{city_data_dir}/latest_full_data.json'):
-        with open(f'{city_data_dir}/latest_full_data.json', 'r', encoding='utf-8') as f:
-            previous_data = json.load(f)
-    else:
-        previous_data = []
-
-    # Compute changes
-    new_restaurants = [r for r in data if r['uuid'] not in [pr['uuid'] for pr in previous_data]]
-    removed_restaurants = [r for r in previous_data if r['uuid'] not in [nr['uuid'] for nr in data]]
-    existing_restaurants = [r for r in data if r['uuid'] in [pr['uuid'] for pr in previous_data]]
-
-    # Prepare daily changes
-    daily_changes = {
-        'date': today,
-        'new_restaurants': [{
-            'name': r['name'],
-            'uuid': r['uuid'],
-            'deals': r.get('deals', []),
-            'address': r.get('address', ''),
-            'zipCode': r.get('zipCode', ''),
-            'latitude': r.get('latitude', None),
-            'longitude': r.get('longitude', None),
-            'avgRating': r.get('avgRating'),
-            'ratingsCount': r.get('ratingsCount'),
-            'reviewsCount': r.get('reviewsCount'),
-            'images': r.get('images', []),
-            'priceRange': r.get('priceRange')
-        } for r in new_restaurants],
-        'removed_restaurants': [{
-            'name': r['name'],
-            'uuid': r['uuid'],
-            'deals': r.get('deals', []),
-            'address': r.get('address', ''),
-            'zipCode': r.get('zipCode', ''),
-            'latitude': r.get('latitude', None),
-            'longitude': r.get('longitude', None),
-            'avgRating': r.get('avgRating'),
-            'ratingsCount': r.get('ratingsCount'),
-            'reviewsCount': r.get('reviewsCount'),
-            'images': r.get('images', []),
-            'priceRange': r.get('priceRange')
-        } for r in removed_restaurants],
-        'existing_restaurants': [],
-        'total_restaurants': len(data)
-    }
-
-    # Process existing restaurants for deal changes
-    for current in existing_restaurants:
-        previous = next((r for r in previous_data if r['uuid'] == current['uuid']), None)
-        if previous:
-            current_deals = set(json.dumps(d) for d in current.get('deals', []))
-            previous_deals = set(json.dumps(d) for d in previous.get('deals', []))
-            
-            new_deals = [json.loads(d) for d in current_deals - previous_deals]
-            removed_deals = [json.loads(d) for d in previous_deals - current_deals]
-            
-            if (new_deals or removed_deals or 
-                current['avgRating'] != previous['avgRating'] or
-                current['priceRange'] != previous['priceRange']):
-                daily_changes['existing_restaurants'].append({
-                    'name': current['name'],
-                    'uuid': current['uuid'],
-                    'new_deals': new_deals,
-                    'removed_deals': removed_deals,
-                    'current_deals': current.get('deals', []),
-                    'address': current.get('address', ''),
-                    'zipCode': current.get('zipCode', ''),
-                    'latitude': current.get('latitude', None),
-                    'longitude': current.get('longitude', None),
-                    'avgRating': current.get('avgRating'),
-                    'ratingsCount': current.get('ratingsCount'),
-                    'reviewsCount': current.get('reviewsCount'),
-                    'images': current.get('images', []),
-                    'priceRange': current.get('priceRange')
-                })
-
-    # Save daily changes
-    os.makedirs(f'{city_data_dir}/daily_changes', exist_ok=True)
-    with open(f'{city_data_dir}/daily_changes/{today}.json', 'w', encoding='utf-8') as f:
-        json.dump(daily_changes, f, ensure_ascii=False, indent=2)
-
-    # Update summary file
-    if os.path.exists(f'{city_data_dir}/summary.json'):
-        with open(f'{city_data_dir}/summary.json', 'r', encoding='utf-8') as f:
-            summary = json.load(f)
+        return engine.run(fetch_pages, f"{API_BASE_URL}/cities/{city}/restaurants/", {"citySlug": city},
+                          window=min(window, max_window), max_window=max_window, label=city)
+    finally:
+        # A session passed in belongs to the caller
+        if session is None:
+            engine.close()
+
+def fetch_neotaste_data(city, session=None, scheduler=None, window=LISTING_WINDOW, concurrency=DETAIL_CONCURRENCY,
+                        rate_limit=DETAIL_RATE_LIMIT):
+    if window > 1:
+        pages = fetch_neotaste_pages(city, session, scheduler, window, concurrency, rate_limit)
     else:
-        summary = {'daily_counts': []}
-
-    summary['daily_counts'].append({
-        'date': today,
-        'total_restaurants': len(data),
-        'new_restaurants': len(new_restaurants),
-        'removed_restaurants': len(removed_restaurants),
-        'restaurants_with_deal_changes': len(daily_changes['existing_restaurants']),
-        'total_deals': sum(len(r.get('deals', [])) for r in data)
-    })
-    summary['last_updated'] = today
-
-    summary['restaurants'] = [{
-        'name': r['name'],
-        'uuid': r['uuid'],
-        'deals': r.get('deals', []),
-        'address': r.get('address', ''),
-        'zipCode': r.get('zipCode', ''),
-        'latitude': r.get('latitude', None),
-        'longitude': r.get('longitude', None),
-        'avgRating': r.get('avgRating'),
-        'ratingsCount': r.get('ratingsCount'),
-        'reviewsCount': r.get('reviewsCount'),
-        'images': r.get('images', []),
-        'priceRange': r.get('priceRange')
-    } for r in data]
-
-    with open(f'{city_data_dir}/summary.json', 'w', encoding='utf-8') as f:
-        json.dump(summary, f, ensure_ascii=False, indent=2)
-
-    print(f"Data updated for {city} on {today}")
-    print(f"Total restaurants: {len(data)}")
-    print(f"New restaurants: {len(new_restaurants)}")
-    print(f"Removed restaurants: {len(removed_restaurants)}")
-    print(f"Restaurants with deal changes: {len(daily_changes['existing_restaurants'])}")
-    print(f"Total deals: {sum(len(r.get('deals', [])) for r in data)}")
-
-import requests
-import json
-from datetime import datetime
-import os
-import time
-
-def fetch_neotaste_data(city):
-    base_url = f"https://api.neotaste.com/cities/{city}/restaurants/"
-    params = {"citySlug": city, "page": 1}
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Referer': 'https://neotaste.com/',
-        'Origin': 'https://neotaste.com'
-    }
-
-    all_restaurants = []
-    total_pages = 0
-
-    while True:
-        try:
-            response = requests.get(base_url, params=params, headers=headers)
-            response.raise_for_status()
-            data = response.json()
+        pages = fetch_neotaste_pages_serial(city, session, scheduler)
 
-            for restaurant in data['data']:
-                all_restaurants.append({
-                    'uuid': restaurant['uuid'],
-                    'name': restaurant['name'],
-                    'slug': restaurant['slug'],
-                    'address': restaurant.get('address', ''),
-                    'addressOptional': restaurant.get('addressOptional', ''),
-                    'zipCode': restaurant.get('zipCode', ''),
-                    'latitude': restaurant.get('latitude'),
-                    'longitude': restaurant.get('longitude'),
-                    'deals': [],
-                    'tags': [],
-                    'avgRating': restaurant.get('avgRating'),
-                    'ratingsCount': restaurant.get('ratingsCount'),
-                    'reviewsCount': restaurant.get('reviewsCount'),
-                    'images': [],
-                    'priceRange': restaurant.get('priceRange')
-                })
-
-            total_pages += 1
-
-            print(f"Fetched page {params['page']} for {city}: {len(data['data'])} restaurants")
-
-            if data['meta']['isLastPage']:
-                break
-
-            params['page'] += 1
-            time.sleep(1)
-
-        except requests.exceptions.RequestException as e:
-            print(f"An error occurred while fetching page {params['page']} for {city}: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Status code: {e.response.status_code}")
-                print(f"Response body: {e.response.text}")
-            break
+    listed = []
+    for page, data in enumerate(pages, start=1):
+        print(f"Fetched page {page} for {city}: {len(data['data'])} restaurants")
+        listed.extend(RestaurantRecord.from_listing(restaurant) for restaurant in data['data'])
+    all_restaurants = unique_by_uuid(listed)
 
     print(f"\nTotal restaurants fetched for {city}: {len(all_restaurants)}")
-    print(f"Total pages: {total_pages}")
+    print(f"Total pages: {len(pages)}")
+    if len(all_restaurants) < len(listed):
+        print(f"Dropped {len(listed) - len(all_restaurants)} restaurants listed on more than one page")
 
     return all_restaurants
 
-def fetch_restaurant_details(slug):
-    url = f"https://api.neotaste.com/restaurants/{slug}/"
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Referer': 'https://neotaste.com/',
-        'Origin': 'https://neotaste.com'
+def parse_restaurant_details(payload):
+    data = payload['data']
+    return {
+        'deals': data.get('deals', []),
+        'tags': data.get('tags', []),
+        'address': data.get('address', ''),
+        'addressOptional': data.get('addressOptional', ''),
+        'zipCode': data.get('zipCode', ''),
+        'latitude': data.get('latitude'),
+        'longitude': data.get('longitude'),
+        'avgRating': data.get('avgRating'),
+        'ratingsCount': data.get('ratingsCount'),
+        'reviewsCount': data.get('reviewsCount'),
+        'images': [img['url'] for img in data.get('images', [])],
+        'priceRange': data.get('priceRange')
     }
 
+def fetch_restaurant_details(slug, session=None, scheduler=None):
+    url = f"{API_BASE_URL}/restaurants/{slug}/"
+
     try:
-        response = requests.get(url, headers=headers)
+        response = (scheduler or RequestScheduler()).get(session, url, headers=HEADERS)
         response.raise_for_status()
-        data = response.json()
-        
-        details = {
-            'deals': data['data'].get('deals', []),
-            'tags': data['data'].get('tags', []),
-            'address': data['data'].get('address', ''),
-            'addressOptional': data['data'].get('addressOptional', ''),
-            'zipCode': data['data'].get('zipCode', ''),
-            'latitude': data['data'].get('latitude'),
-            'longitude': data['data'].get('longitude'),
-            'avgRating': data['data'].get('avgRating'),
-            'ratingsCount': data['data'].get('ratingsCount'),
-            'reviewsCount': data['data'].get('reviewsCount'),
-            'images': [img['url'] for img in data['data'].get('images', [])],
-            'priceRange': data['data'].get('priceRange')
-        }
-        
-        return details
+        return parse_restaurant_details(response.json())
+    except requests.exceptions.RequestException as e:
+        print(f"An error occurred while fetching details for {slug}: {e}")
+        return None
+
+async def fetch_restaurant_details_async(engine, slug):
+    url = f"{API_BASE_URL}/restaurants/{slug}/"
+
+    try:
+        payload = await engine.fetch_json(url)
+        return parse_restaurant_details(payload)
     except requests.exceptions.RequestException as e:
         print(f"An error occurred while fetching details for {slug}: {e}")
         return None
+    except (KeyError, ValueError) as e:
+        print(f"Unexpected response while fetching details for {slug}: {e}")
+        return None
+
+def fetch_all_details(slugs, concurrency=DETAIL_CONCURRENCY, rate_limit=DETAIL_RATE_LIMIT, cache=None,
+                      scheduler=None, metrics=None):
+    engine = FetchEngine(max_per_host=concurrency, rate_limit=rate_limit, headers=HEADERS, cache=cache,
+                         scheduler=scheduler)
+    if metrics:
+        metrics.instrument(engine.session)
+    try:
+        return engine.map(fetch_restaurant_details_async, slugs)
+    finally:
+        engine.close()
 
-def save_structured_data(data, city):
+def average_rating(data):
+    ratings = [r['avgRating'] for r in data if r.get('avgRating') is not None]
+    return round(sum(ratings) / len(ratings), 3) if ratings else None
+
+def save_structured_data(data, city, metrics=None):
     today = datetime.now().strftime("%Y-%m-%d")
     city_data_dir = f'data/{city}'
     os.makedirs(city_data_dir, exist_ok=True)
+    metrics = metrics or RunMetrics(city)
     
-    # Save latest full data
-    with open(f'{city_data_dir}/latest_full_data.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-    # Load previous data to compare changes
-    if os.path.exists(f'{city_data_dir}/latest_full_data.json'):
-        with open(f'{city_data_dir}/latest_full_data.json', 'r', encoding='utf-8') as f:
-            previous_data = json.load(f)
-    else:
-        previous_data = []
-
-    # Compute changes
-    new_restaurants = [r for r in data if r['uuid'] not in [pr['uuid'] for pr in previous_data]]
-    removed_restaurants = [r for r in previous_data if r['uuid'] not in [nr['uuid'] for nr in data]]
-    existing_restaurants = [r for r in data if r['uuid'] in [pr['uuid'] for pr in previous_data]]
+    store = SnapshotStore(city_data_dir)
+    daily_changes = None
+    with metrics.stage('diff'):
+        digest = snapshot_hash(data)
+        previous_hash = store.current_hash()
+        previous_data = None
+        if previous_hash is None:
+            previous_data = store.load_current()
+            previous_hash = snapshot_hash(previous_data)
+
+        if digest == previous_hash:
+            # Unchanged day: nothing to diff and no snapshot or daily changes to write
+            print(f"No changes for {city} since the last snapshot")
+            new_restaurants = []
+            removed_restaurants = []
+            changed_restaurants = []
+        else:
+            # Compute changes against the snapshot before overwriting it
+            if previous_data is None:
+                previous_data = store.load_current()
+            daily_changes = compute_daily_changes(previous_data, data, today)
+            new_restaurants = daily_changes['new_restaurants']
+            removed_restaurants = daily_changes['removed_restaurants']
+            changed_restaurants = daily_changes['existing_restaurants']
+
+    with metrics.stage('persistence'):
+        if daily_changes is not None:
+            store.commit(data, today, digest)
+
+            # Append daily changes to the history store
+            history = HistoryStore(city_data_dir)
+            history.append(daily_changes)
+            history.maybe_checkpoint(today, data)
+
+        write_summary(data, city_data_dir, today, new_restaurants, removed_restaurants, changed_restaurants)
 
-    # Prepare daily changes
-    daily_changes = {
-        'date': today,
-        'new_restaurants': [{
-            'name': r['name'],
-            'uuid': r['uuid'],
-            'deals': r.get('deals', []),
-            'address': r.get('address', ''),
-            'zipCode': r.get('zipCode', ''),
-            'latitude': r.get('latitude', None),
-            'longitude': r.get('longitude', None),
-            'avgRating': r.get('avgRating'),
-            'ratingsCount': r.get('ratingsCount'),
-            'reviewsCount': r.get('reviewsCount'),
-            'images': r.get('images', []),
-            'priceRange': r.get('priceRange')
-        } for r in new_restaurants],
-        'removed_restaurants': [{
-            'name': r['name'],
-            'uuid': r['uuid'],
-            'deals': r.get('deals', []),
-            'address': r.get('address', ''),
-            'zipCode': r.get('zipCode', ''),
-            'latitude': r.get('latitude', None),
-            'longitude': r.get('longitude', None),
-            'avgRating': r.get('avgRating'),
-            'ratingsCount': r.get('ratingsCount'),
-            'reviewsCount': r.get('reviewsCount'),
-            'images': r.get('images', []),
-            'priceRange': r.get('priceRange')
-        } for r in removed_restaurants],
-        'existing_restaurants': [],
-        'total_restaurants': len(data)
-    }
-
-    # Process existing restaurants for deal changes
-    for current in existing_restaurants:
-        previous = next((r for r in previous_data if r['uuid'] == current['uuid']), None)
-        if previous:
-            current_deals = set(json.dumps(d) for d in current.get('deals', []))
-            previous_deals = set(json.dumps(d) for d in previous.get('deals', []))
-            
-            new_deals = [json.loads(d) for d in current_deals - previous_deals]
-            removed_deals = [json.loads(d) for d in previous_deals - current_deals]
-            
-            if (new_deals or removed_deals or 
-                current['avgRating'] != previous['avgRating'] or
-                current['priceRange'] != previous['priceRange']):
-                daily_changes['existing_restaurants'].append({
-                    'name': current['name'],
-                    'uuid': current['uuid'],
-                    'new_deals': new_deals,
-                    'removed_deals': removed_deals,
-                    'current_deals': current.get('deals', []),
-                    'address': current.get('address', ''),
-                    'zipCode': current.get('zipCode', ''),
-                    'latitude': current.get('latitude', None),
-                    'longitude': current.get('longitude', None),
-                    'avgRating': current.get('avgRating'),
-                    'ratingsCount': current.get('ratingsCount'),
-                    'reviewsCount': current.get('reviewsCount'),
-                    'images': current.get('images', []),
-                    'priceRange': current.get('priceRange')
-                })
-
-    # Save daily changes
-    os.makedirs(f'{city_data_dir}/daily_changes', exist_ok=True)
-    with open(f'{city_data_dir}/daily_changes/{today}.json', 'w', encoding='utf-8') as f:
-        json.dump(daily_changes, f, ensure_ascii=False, indent=2)
-
-    # Update summary file
-    if os.path.exists(f'{city_data_dir}/summary.json'):
-        with open(f'{city_data_dir}/summary.json', 'r', encoding='utf-8') as f:
-            summary = json.load(f)
-    else:
-        summary = {'daily_counts': []}
+    print(f"Data updated for {city} on {today}")
+    print(f"Total restaurants: {len(data)}")
+    print(f"New restaurants: {len(new_restaurants)}")
+    print(f"Removed restaurants: {len(removed_restaurants)}")
+    print(f"Restaurants with deal changes: {len(changed_restaurants)}")
+    print(f"Total deals: {sum(len(r.get('deals', [])) for r in data)}")
 
-    summary['daily_counts'].append({
+def write_summary(data, city_data_dir, today, new_restaurants, removed_restaurants, changed_restaurants):
+    # One log line per run; the restaurant list itself stays in latest_full_data.json
+    summary = SummaryStore(city_data_dir)
+    if summary.needs_migration():
+        migrate_summary(city_data_dir)
+    summary.append({
         'date': today,
         'total_restaurants': len(data),
         'new_restaurants': len(new_restaurants),
         'removed_restaurants': len(removed_restaurants),
-        'restaurants_with_deal_changes': len(daily_changes['existing_restaurants']),
-        'total_deals': sum(len(r.get('deals', [])) for r in data)
+        'restaurants_with_deal_changes': len(changed_restaurants),
+        'total_deals': sum(len(r.get('deals', [])) for r in data),
+        'avg_rating': average_rating(data)
     })
-    summary['last_updated'] = today
-
-    summary['restaurants'] = [{
-        'name': r['name'],
-        'uuid': r['uuid'],
-        'deals': r.get('deals', []),
-        'address': r.get('address', ''),
-        'zipCode': r.get('zipCode', ''),
-        'latitude': r.get('latitude', None),
-        'longitude': r.get('longitude', None),
-        'avgRating': r.get('avgRating'),
-        'ratingsCount': r.get('ratingsCount'),
-        'reviewsCount': r.get('reviewsCount'),
-        'images': r.get('images', []),
-        'priceRange': r.get('priceRange')
-    } for r in data]
-
-    with open(f'{city_data_dir}/summary.json', 'w', encoding='utf-8') as f:
-        json.dump(summary, f, ensure_ascii=False, indent=2)
+    summary.maybe_compact()
 
-    print(f"Data updated for {city} on {today}")
-    print(f"Total restaurants: {len(data)}")
-    print(f"New restaurants: {len(new_restaurants)}")
-    print(f"Removed restaurants: {len(removed_restaurants)}")
-    print(f"Restaurants with deal changes: {len(daily_changes['existing_restaurants'])}")
-    print(f"Total deals: {sum(len(r.get('deals', [])) for r in data)}")
+# Both return the restaurants whose details were fetched and the ones that failed;
+# transient errors are already retried by the scheduler
+def fetch_details_serial(restaurants, city, session=None, scheduler=None):
+    fetched = []
+    failed = []
 
-def process_city(city):
-    print(f"Processing data for {city}...")
-    restaurants = fetch_neotaste_data(city)
-    
-    successful_fetches = 0
-    failed_fetches = 0
-    
     for restaurant in restaurants:
-        retries = 3
-        while retries > 0:
-            try:
-                print(f"Fetching details for {restaurant['name']} in {city}...")
-                details = fetch_restaurant_details(restaurant['slug'])
-                if details:
-                    restaurant.update(details)
-                    successful_fetches += 1
-                else:
-                    failed_fetches += 1
-                break  # Exit the retry loop if successful
-            except Exception as e:
-                print(f"Error fetching details for {restaurant['name']}: {e}")
-                retries -= 1
-                if retries > 0:
-                    print(f"Retrying... ({retries} attempts left)")
-                    time.sleep(5)  # Wait 5 seconds before retrying
-                else:
-                    failed_fetches += 1
-    
-    print(f"Successfully fetched details for {successful_fetches} restaurants")
+        print(f"Fetching details for {restaurant['name']} in {city}...")
+        details = fetch_restaurant_details(restaurant['slug'], session, scheduler)
+        if details:
+            restaurant.update(details)
+            fetched.append(restaurant)
+        else:
+            failed.append(restaurant)
+
+    return fetched, failed
+
+def fetch_details_concurrent(restaurants, city, concurrency=DETAIL_CONCURRENCY, rate_limit=DETAIL_RATE_LIMIT,
+                             cache=None, scheduler=None, metrics=None):
+    print(f"Fetching details for {len(restaurants)} restaurants in {city} "
+          f"({concurrency} concurrent, {rate_limit or 'unlimited'} req/s)...")
+    results = fetch_all_details([r['slug'] for r in restaurants], concurrency, rate_limit, cache, scheduler,
+                                metrics)
+
+    fetched = []
+    failed = []
+    for restaurant, details in zip(restaurants, results):
+        if details:
+            restaurant.update(details)
+            fetched.append(restaurant)
+        else:
+            failed.append(restaurant)
+
+    return fetched, failed
+
+def process_city(city, concurrency=DETAIL_CONCURRENCY, rate_limit=DETAIL_RATE_LIMIT, serial=False,
+                 incremental=False, detail_ttl_hours=DEFAULT_DETAIL_TTL_HOURS, cache_path=DEFAULT_CACHE_PATH,
+                 listing_window=LISTING_WINDOW, profile=None, profile_dir=DEFAULT_PROFILE_DIR):
+    print(f"Processing data for {city}...")
+    city_data_dir = f'data/{city}'
+    metrics = RunMetrics(city, profile, profile_dir)
+    cache = HttpCache(cache_path) if cache_path else None
+    # Enough pooled connections for a full speculative listing window, so none get discarded
+    session = metrics.instrument(make_session(pool_size=listing_window_limit(concurrency), headers=HEADERS,
+                                              cache=cache))
+    scheduler = RequestScheduler()
+    with metrics.stage('listing'):
+        restaurants = fetch_neotaste_data(city, session, scheduler, 1 if serial else listing_window, concurrency,
+                                          rate_limit)
+
+    if incremental:
+        # Only new, changed or stale restaurants get a details request
+        now = datetime.now()
+        detail_state = DetailState(city_data_dir)
+        store = SnapshotStore(city_data_dir)
+        # Only reused restaurants get decoded when the binary snapshot is there
+        binary_snapshot = store.open_binary()
+        previous_snapshot = binary_snapshot if binary_snapshot is not None else store.load_current()
+        to_fetch, fingerprints = plan_detail_refresh(restaurants, previous_snapshot, detail_state,
+                                                     detail_ttl_hours, now)
+        if binary_snapshot is not None:
+            binary_snapshot.close()
+        print(f"Incremental refresh for {city}: {len(to_fetch)} of {len(restaurants)} restaurants need details")
+    else:
+        to_fetch = restaurants
+
+    def fetch_details(batch):
+        if serial:
+            return fetch_details_serial(batch, city, session, scheduler)
+        return fetch_details_concurrent(batch, city, concurrency, rate_limit, cache, scheduler, metrics)
+
+    with metrics.stage('details'):
+        fetched, failed = fetch_details(to_fetch)
+        if failed:
+            # Failures wait until the rest of the city is done instead of stalling it
+            print(f"Retrying {len(failed)} failed detail requests for {city}...")
+            retried, failed = fetch_details(failed)
+            fetched.extend(retried)
+    failed_fetches = len(failed)
+    session.close()
+
+    print(f"Successfully fetched details for {len(fetched)} restaurants")
     print(f"Failed to fetch details for {failed_fetches} restaurants")
     
-    save_structured_data(restaurants, city)
+    save_structured_data(restaurants, city, metrics)
+    with metrics.stage('derived'):
+        write_city_matches(city_data_dir, city)
+        write_city_statistics(city_data_dir, city)
+        build_and_write(city_data_dir, city)
+
+    if incremental:
+        with metrics.stage('persistence'):
+            for restaurant in fetched:
+                detail_state.record(restaurant['uuid'], fingerprints[restaurant['uuid']], now)
+            detail_state.prune(fingerprints)
+            detail_state.save()
 
     # Verify data integrity
-    verify_data_integrity(city)
+    with metrics.stage('integrity'):
+        integrity_ok = verify_data_integrity(city)
+
+    cache_stats = {}
+    if cache:
+        cache_stats = cache.summary()
+        cache.close()
+        print(f"HTTP cache for {city}: {format_stats(cache_stats)}")
+
+    return {
+        'city': city,
+        'restaurants': len(restaurants),
+        'details_fetched': len(fetched),
+        'details_skipped': len(restaurants) - len(to_fetch),
+        'details_failed': failed_fetches,
+        'integrity_ok': integrity_ok,
+        'http_cache': cache_stats,
+        'requests': dict(scheduler.stats),
+        'metrics': metrics.to_dict()
+    }
+
+def count_snapshot_deals(city_data_dir):
+    # Deal total from the memory-mapped snapshot's record table when it is current,
+    # otherwise from the JSON snapshot
+    snapshot = SnapshotStore(city_data_dir).open_binary()
+    if snapshot is None:
+        with open(f'{city_data_dir}/latest_full_data.json', 'r', encoding='utf-8') as f:
+            full_data = json.load(f)
+        return sum(len(r.get('deals', [])) for r in full_data)
+
+    with snapshot:
+        total_deals = sum(snapshot.deal_counts())
+        if total_deals != snapshot.total_deals:
+            print(f"Binary snapshot in {city_data_dir} is inconsistent: {total_deals} deals in its records, "
+                  f"{snapshot.total_deals} in its header")
+            return None
+        return total_deals
 
 def verify_data_integrity(city):
     city_data_dir = f'data/{city}'
-    with open(f'{city_data_dir}/latest_full_data.json', 'r', encoding='utf-8') as f:
-        full_data = json.load(f)
-    with open(f'{city_data_dir}/summary.json', 'r', encoding='utf-8') as f:
-        summary = json.load(f)
-    
-    total_deals_full_data = sum(len(r.get('deals', [])) for r in full_data)
-    total_deals_summary = summary['daily_counts'][-1]['total_deals']
+    total_deals_full_data = count_snapshot_deals(city_data_dir)
+    total_deals_summary = SummaryStore(city_data_dir).last_entry()['total_deals']
     
     if total_deals_full_data != total_deals_summary:
         print(f"Data integrity issue detected for {city}:")
         print(f"Total deals in full data: {total_deals_full_data}")
         print(f"Total deals in summary: {total_deals_summary}")
         print("Please check your data processing pipeline for potential issues.")
-    else:
-        print(f"Data integrity verified for {city}. Total deals: {total_deals_full_data}")
+        return False
+
+    print(f"Data integrity verified for {city}. Total deals: {total_deals_full_data}")
+    return True
+
+def run_city_job(city, options):
+    start = time.perf_counter()
+    try:
+        result = process_city(city, **options)
+        result['status'] = 'ok'
+    except Exception as e:
+        print(f"Processing failed for {city}: {e}")
+        result = {'city': city, 'status': 'failed', 'error': str(e)}
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+def split_host_budget(options, workers):
+    # Every city talks to the same API host, and each city job builds its own rate limiter
+    # and per-host concurrency limit (in its own process by default). The budget is for the
+    # whole run, so each of the cities running at the same time gets an equal share, which
+    # its listing and its details both stay within
+    if workers <= 1:
+        return options
+    shared = dict(options)
+    shared['concurrency'] = max(1, options.get('concurrency', DETAIL_CONCURRENCY) // workers)
+    rate_limit = options.get('rate_limit', DETAIL_RATE_LIMIT)
+    shared['rate_limit'] = rate_limit / workers if rate_limit else rate_limit
+    return shared
+
+def run_cities(cities, max_workers=DEFAULT_CITY_WORKERS, use_threads=False, **options):
+    # Every city is an independent job: listing, details, persistence and integrity check
+    started_at = datetime.now().isoformat(timespec='seconds')
+    start = time.perf_counter()
+    options = split_host_budget(options, min(max_workers, len(cities)))
+    executor_class = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+    results = {}
+
+    with executor_class(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_city_job, city, options): city for city in cities}
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['city']] = result
+            print(f"Finished {result['city']} in {result['seconds']:.1f}s ({result['status']})")
+
+    return {
+        'started_at': started_at,
+        'max_workers': max_workers,
+        'executor': 'thread' if use_threads else 'process',
+        'total_seconds': round(time.perf_counter() - start, 3),
+        'http_cache': merge_stats(result.get('http_cache', {}) for result in results.values()),
+        'requests': merge_stats(result.get('requests', {}) for result in results.values()),
+        'metrics': merge_metrics(result['metrics'] for result in results.values() if 'metrics' in result),
+        'finished_at_unix': int(time.time()),
+        'cities': [results[city] for city in cities]
+    }
+
+def print_run_report(report):
+    print(f"\nRun report ({report['executor']} pool, {report['max_workers']} workers, "
+          f"{report['total_seconds']:.1f}s total)")
+    for result in report['cities']:
+        if result['status'] == 'ok':
+            print(f"  {result['city']:<12} {result['seconds']:>7.1f}s  {result['restaurants']} restaurants, "
+                  f"{result['details_skipped']} details reused, {result['details_failed']} detail failures, integrity {'ok' if result['integrity_ok'] else 'FAILED'}")
+            print(f"  {'':<12} {'':>8}  {format_metrics(result['metrics'])}")
+        else:
+            print(f"  {result['city']:<12} {result['seconds']:>7.1f}s  failed: {result['error']}")
+    if report['http_cache']:
+        print(f"  HTTP cache: {format_stats(report['http_cache'])}")
+    if report['requests']:
+        requests_stats = report['requests']
+        print(f"  Requests: {requests_stats['requests']} sent, {requests_stats['retries']} retries, "
+              f"{requests_stats['throttled']} throttled, {requests_stats['errors']} connection errors")
 
 if __name__ == "__main__":
-    cities = ["karlsruhe", "freiburg", "heidelberg", "mannheim", "frankfurt","vienna","mainz"]
-    for city in cities:
-        process_city(city)
+    parser = argparse.ArgumentParser(description='Scrape Neotaste restaurants and deals per city')
+    parser.add_argument('cities', nargs='*', default=CITIES)
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_CITY_WORKERS,
+                        help='number of cities processed at the same time')
+    parser.add_argument('--threads', action='store_true', help='use a thread pool instead of processes')
+    parser.add_argument('--concurrency', type=int, default=DETAIL_CONCURRENCY,
+                        help='listing and detail requests in flight, shared by all cities running at the same time '
+                             '(also caps the speculative listing window)')
+    parser.add_argument('--rate-limit', type=float, default=DETAIL_RATE_LIMIT,
+                        help='listing and detail requests per second, shared by all cities running at the same time')
+    parser.add_argument('--serial', action='store_true', help='fetch listing pages and restaurant details one at a time')
+    parser.add_argument('--listing-window', type=int, default=LISTING_WINDOW,
+                        help='listing pages requested ahead at first (1 walks the pages one by one)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only fetch details for new, changed or stale restaurants')
+    parser.add_argument('--detail-ttl-hours', type=float, default=DEFAULT_DETAIL_TTL_HOURS,
+                        help='refetch details older than this in incremental mode')
+    parser.add_argument('--cache-path', default=DEFAULT_CACHE_PATH, help='sqlite file for the HTTP response cache')
+    parser.add_argument('--no-cache', action='store_true', help='disable the HTTP response cache')
+    parser.add_argument('--report', help='write the run report as JSON to this path')
+    parser.add_argument('--fail-on-error', action='store_true',
+                        help='exit with status 1 if any city failed (the run report lists failures either way)')
+    parser.add_argument('--metrics-textfile', help='write run metrics in Prometheus text format to this path')
+    parser.add_argument('--profile', choices=PROFILE_MODES,
+                        help='profile every stage: cpu writes cProfile files, memory records tracemalloc peaks')
+    parser.add_argument('--profile-dir', default=DEFAULT_PROFILE_DIR, help='where --profile cpu writes its files')
+    args = parser.parse_args()
+
+    report = run_cities(args.cities, args.max_workers, args.threads,
+                        concurrency=args.concurrency, rate_limit=args.rate_limit, serial=args.serial,
+                        listing_window=args.listing_window, profile=args.profile, profile_dir=args.profile_dir,
+                        incremental=args.incremental, detail_ttl_hours=args.detail_ttl_hours,
+                        cache_path=None if args.no_cache else args.cache_path)
+    print_run_report(report)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.metrics_textfile:
+        write_prometheus_textfile(args.metrics_textfile, report)
+
+    if args.fail_on_error and any(result['status'] != 'ok' for result in report['cities']):
+        sys.exit(1)
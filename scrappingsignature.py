@@ -1,12 +1,44 @@
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, FeatureNotFound
+import argparse
 import re
 import json
 import html
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor
 
-def get_soup(url):
-    response = requests.get(url)
-    return BeautifulSoup(response.text, 'html.parser')
+from fetch_engine import make_session
+from http_cache import HttpCache, format_stats
+
+# BeautifulSoup tree builders (lxml is a C parser and only used when installed),
+# plus 'stream', which extracts the needed sections without building a DOM
+PARSER_BACKENDS = ('html.parser', 'lxml', 'stream')
+DEFAULT_PARSER = 'stream'
+# Tree builder for the marker page, which needs a real DOM
+SOUP_PARSER = 'html.parser'
+DEFAULT_WORKERS = 8
+
+MAIN_CLASS = 'text-gray-900 sm:w-10/12 mx-auto leading-normal'
+DESCRIPTION_CLASS = 'font-thin mb-8 text-justify'
+CONTACT_CLASS = 'text-gray-800 mt-12 sm:w-10/12 mx-auto mb-8'
+GALLERY_CLASS = 'js-gallery-item gallery-item mb-4'
+EURO_AMOUNT = re.compile(r'(?:€|EUR)\s*(\d+(?:,\d+)?)')
+
+def resolve_parser(parser):
+    if parser not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend {parser!r}, expected one of {', '.join(PARSER_BACKENDS)}")
+    if parser == 'stream':
+        return parser
+    try:
+        BeautifulSoup('', parser)
+    except FeatureNotFound:
+        print(f"Parser backend {parser} is not installed, falling back to {SOUP_PARSER}")
+        return SOUP_PARSER
+    return parser
+
+def get_soup(url, session=None, parser=SOUP_PARSER):
+    response = (session or requests).get(url)
+    return BeautifulSoup(response.text, parser)
 
 def extract_marker_data(soup):
     map_div = soup.find('div', id='map')
@@ -15,7 +47,7 @@ def extract_marker_data(soup):
         return json.loads(markers_data)
     return []
 
-def extract_restaurant_info(marker, base_url):
+def extract_restaurant_info(marker, base_url, session=None, parser=DEFAULT_PARSER):
     info = {
         'name': marker['title'],
         'url': marker['url'],
@@ -27,16 +59,24 @@ def extract_restaurant_info(marker, base_url):
     }
     
     # Fetch additional details from the restaurant's page
-    soup = get_soup(info['url'])
-    main_content = soup.find('div', class_='text-gray-900 sm:w-10/12 mx-auto leading-normal')
+    if parser == 'stream':
+        response = (session or requests).get(info['url'])
+        extract_page_sections(response.text, info)
+    else:
+        soup = get_soup(info['url'], session, parser)
+        parse_restaurant_page(soup, info)
+    return info
+
+def parse_restaurant_page(soup, info):
+    main_content = soup.find('div', class_=MAIN_CLASS)
     
     if main_content:
-        description_div = main_content.find('div', class_='font-thin mb-8 text-justify')
+        description_div = main_content.find('div', class_=DESCRIPTION_CLASS)
         if description_div:
             info['description'] = description_div.text.strip()
-        info['euro_amounts'] = re.findall(r'(?:€|EUR)\s*(\d+(?:,\d+)?)', main_content.text)
+        info['euro_amounts'] = EURO_AMOUNT.findall(main_content.text)
         
-        contact_div = soup.find('div', class_='text-gray-800 mt-12 sm:w-10/12 mx-auto mb-8')
+        contact_div = soup.find('div', class_=CONTACT_CLASS)
         if contact_div:
             address_div = contact_div.find('div', recursive=False)
             if address_div:
@@ -54,7 +94,7 @@ def extract_restaurant_info(marker, base_url):
             if website_link:
                 info['website'] = website_link.text.strip()
         
-        image_div = soup.find('div', class_='js-gallery-item gallery-item mb-4')
+        image_div = soup.find('div', class_=GALLERY_CLASS)
         if image_div:
             img_tag = image_div.find('img')
             if img_tag and 'src' in img_tag.attrs:
@@ -62,19 +102,196 @@ def extract_restaurant_info(marker, base_url):
 
     return info
 
+class _SectionsComplete(Exception):
+    pass
+
+class SectionExtractor(HTMLParser):
+    # Collects exactly what parse_restaurant_page reads from the BeautifulSoup tree
+    # (first main/description/contact/gallery divs, their text, links and image)
+    # while tracking only a stack of open tag names. Nesting follows BeautifulSoup's
+    # html.parser builder: void elements never open a frame, an end tag closes
+    # everything up to the nearest open tag of that name, stray end tags are ignored.
+    VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem',
+                     'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame',
+                     'image', 'isindex', 'nextid', 'spacer'}
+    # Their text is not part of .text in BeautifulSoup
+    NON_TEXT_CONTAINERS = {'script', 'style', 'template', 'rt', 'rp'}
+    PRESERVE_WHITESPACE = {'pre', 'textarea'}
+    ASCII_SPACES = ' \n\t\x0c\r'
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.pending = []
+        self.non_text_depth = 0
+        self.preserve_depth = 0
+        # Section name -> stack depth of its element while it is open
+        self.open_sections = {}
+        self.texts = {}
+        self.strings = []
+        self.links = {}
+        self.image = None
+        self.main_done = False
+        self.contact_done = False
+        self.gallery_done = False
+
+    def _flush(self):
+        if not self.pending:
+            return
+        text = ''.join(self.pending)
+        self.pending = []
+        if self.non_text_depth:
+            return
+        # BeautifulSoup collapses whitespace-only strings outside <pre>/<textarea>
+        if not self.preserve_depth and not text.strip(self.ASCII_SPACES):
+            text = '\n' if '\n' in text else ' '
+        for section in self.open_sections:
+            self.texts.setdefault(section, []).append(text)
+        if 'address' in self.open_sections:
+            self.strings.append(text)
+
+    def _open(self, section):
+        self.open_sections[section] = len(self.stack) - 1
+        self.texts.setdefault(section, [])
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        attrs = {name: value if value is not None else '' for name, value in attrs}
+        if tag in self.VOID_ELEMENTS:
+            if tag == 'img' and 'gallery' in self.open_sections and not self.gallery_done:
+                self.image = attrs.get('src')
+                self.gallery_done = True
+            return
+
+        self.stack.append(tag)
+        if tag in self.NON_TEXT_CONTAINERS:
+            self.non_text_depth += 1
+        if tag in self.PRESERVE_WHITESPACE:
+            self.preserve_depth += 1
+
+        if tag == 'div':
+            css_class = ' '.join(attrs.get('class', '').split())
+            if css_class == MAIN_CLASS and 'main' not in self.texts:
+                self._open('main')
+            elif css_class == DESCRIPTION_CLASS and 'main' in self.open_sections and 'description' not in self.texts:
+                self._open('description')
+            if css_class == CONTACT_CLASS and 'contact' not in self.texts:
+                self._open('contact')
+            elif ('contact' in self.open_sections and 'address' not in self.texts
+                  and self.open_sections['contact'] == len(self.stack) - 2):
+                self._open('address')
+            if css_class == GALLERY_CLASS and not self.gallery_done and 'gallery' not in self.open_sections:
+                self._open('gallery')
+        elif tag == 'a' and 'contact' in self.open_sections:
+            href = attrs.get('href')
+            if href:
+                if href.startswith('tel:'):
+                    kind = 'phone'
+                elif href.startswith('mailto:'):
+                    kind = 'email'
+                else:
+                    kind = 'website'
+                if kind not in self.texts:
+                    self._open(kind)
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag not in self.stack:
+            return
+        while self.stack:
+            name = self.stack.pop()
+            if name in self.NON_TEXT_CONTAINERS:
+                self.non_text_depth -= 1
+            if name in self.PRESERVE_WHITESPACE:
+                self.preserve_depth -= 1
+            depth = len(self.stack)
+            for section in [s for s, d in self.open_sections.items() if d == depth]:
+                del self.open_sections[section]
+                if section == 'main':
+                    self.main_done = True
+                elif section == 'contact':
+                    self.contact_done = True
+                elif section == 'gallery':
+                    self.gallery_done = True
+            if name == tag:
+                break
+
+        if self.main_done and self.contact_done and self.gallery_done:
+            raise _SectionsComplete()
+
+    def handle_data(self, data):
+        self.pending.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def close(self):
+        super().close()
+        self._flush()
+
+def extract_page_sections(page_html, info, chunk_size=16384):
+    # Same result as parse_restaurant_page(BeautifulSoup(page_html, 'html.parser'), info),
+    # but parsing stops as soon as every section it reads has been closed
+    extractor = SectionExtractor()
+    try:
+        for start in range(0, len(page_html), chunk_size):
+            extractor.feed(page_html[start:start + chunk_size])
+        extractor.close()
+    except _SectionsComplete:
+        pass
+
+    if 'main' not in extractor.texts:
+        return info
+
+    texts = {section: ''.join(parts) for section, parts in extractor.texts.items()}
+    if 'description' in texts:
+        info['description'] = texts['description'].strip()
+    info['euro_amounts'] = EURO_AMOUNT.findall(texts['main'])
+
+    if 'address' in texts:
+        info['address'] = ' '.join(s.strip() for s in extractor.strings if s.strip())
+    for kind in ('phone', 'email', 'website'):
+        if kind in texts:
+            info[kind] = texts[kind].strip()
+
+    if extractor.image is not None:
+        info['images'] = [extractor.image]
+
+    return info
+
+def scrape_restaurants(markers, base_url, session=None, workers=DEFAULT_WORKERS, parser=DEFAULT_PARSER):
+    # Restaurant pages are fetched and parsed on a thread pool sharing one keep-alive session;
+    # results keep the marker order
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        infos = executor.map(lambda marker: extract_restaurant_info(marker, base_url, session, parser), markers)
+        return [info for info in infos if info]
+
 def main():
+    parser = argparse.ArgumentParser(description='Scrape signature.at 2-for-1 gourmet restaurants')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='restaurant pages fetched at the same time')
+    parser.add_argument('--parser', default=DEFAULT_PARSER, choices=PARSER_BACKENDS, help='HTML parser backend')
+    args = parser.parse_args()
+
     base_url = 'https://signature.at'
     main_page_url = f'{base_url}/2-for-1-gourmet-gutscheinbuch'
+    parser_backend = resolve_parser(args.parser)
+    cache = HttpCache()
+    session = make_session(pool_size=args.workers, cache=cache)
     
-    soup = get_soup(main_page_url)
+    soup = get_soup(main_page_url, session, SOUP_PARSER if parser_backend == 'stream' else parser_backend)
     markers = extract_marker_data(soup)
     
-    results = []
-    
-    for marker in markers:
-        restaurant_info = extract_restaurant_info(marker, base_url)
-        if restaurant_info:
-            results.append(restaurant_info)
+    results = scrape_restaurants(markers, base_url, session, args.workers, parser_backend)
+
+    session.close()
+    print(f"HTTP cache: {format_stats(cache.summary())}")
+    cache.close()
     
     # Save results to a JSON file
     with open('restaurant_info.json', 'w', encoding='utf-8') as f:
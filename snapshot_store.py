@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import uuid
+
+from binary_snapshot import BINARY_NAME, BinarySnapshot, write_binary_snapshot
+from restaurant_record import to_json
+
+
+def open_temp(path):
+    # Temp file lives next to the target so the final rename stays on one filesystem. Its
+    # name ends in .tmp, so globs for the target's extension (*.prom, *.json) skip it, and
+    # unlike mkstemp's 0600 it gets the permissions a plain open() would
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f'.{name}.{uuid.uuid4().hex[:12]}.tmp')
+    return os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), tmp_path
+
+
+def write_temp_json(path, data, **dump_kwargs):
+    fd, tmp_path = open_temp(path)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, **dump_kwargs)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    os.replace(write_temp_json(path, data, **dump_kwargs), path)
+
+
+def atomic_write_bytes(path, data):
+    # Readers see the old file or the new one, never half of one
+    fd, tmp_path = open_temp(path)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def snapshot_hash(data):
+    canonical = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=to_json)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class SnapshotStore:
+    CURRENT = 'latest_full_data.json'
+    PREVIOUS = 'previous_full_data.json'
+    META = 'snapshot_meta.json'
+    BINARY = BINARY_NAME
+
+    def __init__(self, city_data_dir):
+        self.city_data_dir = city_data_dir
+        os.makedirs(city_data_dir, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.city_data_dir, name)
+
+    def _load(self, name, default):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return default
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def load_current(self):
+        return self._load(self.CURRENT, [])
+
+    def load_previous(self):
+        return self._load(self.PREVIOUS, [])
+
+    def load_meta(self):
+        return self._load(self.META, {})
+
+    def current_hash(self):
+        # None for snapshots written before the store recorded hashes
+        return self.load_meta().get('current_hash')
+
+    def open_binary(self):
+        # Memory-mapped copy of the current snapshot, or None when it is missing or
+        # was written for a different snapshot than the JSON one
+        path = self._path(self.BINARY)
+        if not os.path.exists(path):
+            return None
+        snapshot = BinarySnapshot(path)
+        if snapshot.digest is None or snapshot.digest != self.current_hash():
+            snapshot.close()
+            return None
+        return snapshot
+
+    def commit(self, data, date, digest=None):
+        digest = digest or snapshot_hash(data)
+        meta = self.load_meta()
+
+        tmp_path = write_temp_json(self._path(self.CURRENT), data, ensure_ascii=False, indent=2,
+                                   default=to_json)
+
+        # The outgoing snapshot becomes the previous one right before the new one lands
+        if os.path.exists(self._path(self.CURRENT)):
+            os.replace(self._path(self.CURRENT), self._path(self.PREVIOUS))
+            meta['previous_hash'] = meta.get('current_hash')
+            meta['previous_date'] = meta.get('current_date')
+
+        os.replace(tmp_path, self._path(self.CURRENT))
+        write_binary_snapshot(self._path(self.BINARY), data, digest)
+        meta['current_hash'] = digest
+        meta['current_date'] = date
+        atomic_write_json(self._path(self.META), meta, indent=2)
+        return digest
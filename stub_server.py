@@ -0,0 +1,209 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+LISTING_PATH = re.compile(r'^/cities/([^/]+)/restaurants/?$')
+DETAILS_PATH = re.compile(r'^/restaurants/([^/]+)/?$')
+
+
+def synthetic_restaurants(count, seed=0):
+    restaurants = []
+    for i in range(count):
+        n = seed + i
+        restaurants.append({
+            'uuid': f'00000000-0000-4000-8000-{n:012d}',
+            'name': f'Restaurant {n}',
+            'slug': f'restaurant-{n}',
+            'address': f'Teststrasse {n % 200 + 1}',
+            'addressOptional': '',
+            'zipCode': f'{60000 + n % 500}',
+            'latitude': 50.0 + (n % 1000) / 10000,
+            'longitude': 8.6 + (n // 1000) / 10000,
+            'avgRating': round(3.5 + (n % 15) / 10, 1),
+            'ratingsCount': n % 300,
+            'reviewsCount': n % 120,
+            'priceRange': n % 4 + 1,
+            'deals': [
+                {'uuid': f'deal-{n}-1', 'name': '2for1 Main Course', 'type': 'TWO_FOR_ONE'},
+                {'uuid': f'deal-{n}-2', 'name': '50% on drinks', 'type': 'DISCOUNT'}
+            ][:n % 3],
+            'tags': [{'name': tag} for tag in ('Pizza', 'Vegan', 'Burger', 'Sushi')[:n % 4 + 1]],
+            'images': [{'url': f'https://images.example/{n}/{k}.jpg'} for k in range(3)]
+        })
+    return restaurants
+
+
+class NeotasteStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_html(self, body):
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_recorded(self, status, headers, body):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Counts requests being answered at the same time, so benchmarks can check a client's limits
+        server = self.server
+        with server.in_flight_lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            self._answer_get()
+        finally:
+            with server.in_flight_lock:
+                server.in_flight -= 1
+
+    def _answer_get(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        if server.error_rate and server.should_fail():
+            # Simulated overload: 429 with Retry-After when configured, otherwise a bare 503
+            if server.retry_after is not None:
+                self.send_response(429)
+                self.send_header('Retry-After', str(server.retry_after))
+            else:
+                self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        url = urlsplit(self.path)
+        if self.path in server.recorded:
+            self._send_recorded(*server.recorded[self.path])
+            return
+        if self.path in server.json_pages:
+            self._send_json(server.json_pages[self.path])
+            return
+        if url.path in server.pages:
+            self._send_html(server.pages[url.path])
+            return
+
+        listing = LISTING_PATH.match(url.path)
+        details = DETAILS_PATH.match(url.path)
+
+        if listing:
+            page = int(parse_qs(url.query).get('page', ['1'])[0])
+            if page in server.fail_pages:
+                self._send_json({'message': 'Internal Server Error'}, status=500)
+                return
+            start = (page - 1) * server.page_size
+            chunk = server.restaurants[start:start + server.page_size]
+            if page in server.short_pages:
+                # A restaurant that went away while the listing was paged
+                chunk = chunk[:-1]
+            is_last = start + server.page_size >= len(server.restaurants)
+            self._send_json({'data': chunk, 'meta': {'page': page, 'isLastPage': is_last}})
+        elif details and details.group(1) in server.by_slug:
+            self._send_json({'data': server.by_slug[details.group(1)]})
+        else:
+            self._send_json({'message': 'Not found'}, status=404)
+
+
+class StubServer:
+    def __init__(self, restaurants=(), latency=0.0, page_size=20, host='127.0.0.1', port=0, pages=None,
+                 json_pages=None, error_rate=0.0, retry_after=None, seed=0, fail_pages=(), recorded=None,
+                 short_pages=()):
+        self.httpd = ThreadingHTTPServer((host, port), NeotasteStubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.restaurants = restaurants
+        self.httpd.by_slug = {r['slug']: r for r in restaurants}
+        self.httpd.latency = latency
+        self.httpd.page_size = page_size
+        # Static HTML documents by path, e.g. saved signature.at restaurant pages
+        self.httpd.pages = pages or {}
+        # JSON documents by path and query string, e.g. TheFork _next/data pages ('/x.json?p=2')
+        self.httpd.json_pages = json_pages or {}
+        # Recorded responses by path and query: (status, headers, body bytes), see replay.py
+        self.httpd.recorded = recorded or {}
+        # Fraction of requests answered with 503 (or 429 + Retry-After seconds)
+        self.httpd.error_rate = error_rate
+        self.httpd.retry_after = retry_after
+        # Listing pages that always answer 500
+        self.httpd.fail_pages = set(fail_pages)
+        # Listing pages that come back one restaurant short without being the last page
+        self.httpd.short_pages = set(short_pages)
+        self.httpd.in_flight = 0
+        self.httpd.max_in_flight = 0
+        self.httpd.in_flight_lock = threading.Lock()
+        rng = random.Random(seed)
+        rng_lock = threading.Lock()
+
+        def should_fail():
+            with rng_lock:
+                return rng.random() < error_rate
+        self.httpd.should_fail = should_fail
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def max_in_flight(self):
+        return self.httpd.max_in_flight
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve a synthetic Neotaste API locally')
+    parser.add_argument('--restaurants', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--retry-after', type=float, help='fail with 429 and this Retry-After instead of 503')
+    args = parser.parse_args()
+
+    with StubServer(synthetic_restaurants(args.restaurants), args.latency, args.page_size, port=args.port,
+                    error_rate=args.error_rate, retry_after=args.retry_after) as stub:
+        print(f"Stub API listening on {stub.url} (set NEOTASTE_API_URL to use it)")
+        stub.thread.join()
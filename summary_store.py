@@ -0,0 +1,181 @@
+import json
+import os
+import time
+
+from change_detection import restaurant_entry
+from snapshot_store import SnapshotStore, atomic_write_json
+
+SUMMARY_FORMAT = 2
+# Log entries folded into summary.json once the log has this many
+COMPACT_EVERY = 30
+# Counts of what changed since the run before; the runs of one day add up
+RUN_COUNT_FIELDS = ('new_restaurants', 'removed_restaurants', 'restaurants_with_deal_changes')
+COMPACTING_PREFIX = 'summary_log.compacting-'
+
+
+class SummaryStore:
+    # summary.json holds the compacted daily counts and a reference to the snapshot the
+    # restaurant list comes from; each run appends one line to summary_log.jsonl, so a
+    # daily write costs one entry instead of the whole history and catalogue
+    SUMMARY = 'summary.json'
+    LOG = 'summary_log.jsonl'
+
+    def __init__(self, city_data_dir):
+        self.city_data_dir = city_data_dir
+        self.summary_path = os.path.join(city_data_dir, self.SUMMARY)
+        self.log_path = os.path.join(city_data_dir, self.LOG)
+
+    def exists(self):
+        return os.path.exists(self.summary_path) or os.path.exists(self.log_path)
+
+    def load_compacted(self):
+        if not os.path.exists(self.summary_path):
+            return {'format': SUMMARY_FORMAT, 'daily_counts': []}
+        with open(self.summary_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _read_log(self, path):
+        if not os.path.exists(path):
+            return []
+        entries = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A run that died mid-append leaves a partial last line
+                    continue
+        return entries
+
+    def _compacting_logs(self):
+        # Logs a compaction has set aside, oldest first
+        if not os.path.isdir(self.city_data_dir):
+            return []
+        return sorted(name for name in os.listdir(self.city_data_dir)
+                      if name.startswith(COMPACTING_PREFIX) and name.endswith('.jsonl'))
+
+    def log_entries(self):
+        # Runs not folded into summary.json yet: logs an interrupted compaction set aside,
+        # then the live log
+        entries = []
+        pending = self._compacting_logs()
+        if pending:
+            folded = set(self.load_compacted().get('folded_logs', []))
+            for name in pending:
+                if name not in folded:
+                    entries.extend(self._read_log(os.path.join(self.city_data_dir, name)))
+        return entries + self._read_log(self.log_path)
+
+    def append(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+    def daily_counts(self):
+        return combine_by_date(self.load_compacted()['daily_counts'] + self.log_entries())
+
+    def last_entry(self):
+        entries = self.log_entries()
+        if entries:
+            return entries[-1]
+        daily_counts = self.load_compacted()['daily_counts']
+        return daily_counts[-1] if daily_counts else None
+
+    def last_updated(self):
+        entry = self.last_entry()
+        return entry['date'] if entry else None
+
+    def restaurants(self):
+        # The catalogue is not copied into the summary any more; it is the current snapshot
+        return [restaurant_entry(r) for r in SnapshotStore(self.city_data_dir).load_current()]
+
+    def load(self, include_restaurants=False):
+        # The old summary.json shape, for readers that want everything at once
+        summary = {'daily_counts': self.daily_counts(), 'last_updated': self.last_updated()}
+        if include_restaurants:
+            summary['restaurants'] = self.restaurants()
+        return summary
+
+    def compact(self):
+        # The log is renamed aside, folded into summary.json together with the names of
+        # the logs folded, and only then removed. Same-day runs add up, so folding a run
+        # twice would count it twice; wherever a crash lands, each run is counted once
+        if os.path.exists(self.log_path):
+            os.replace(self.log_path, os.path.join(self.city_data_dir,
+                                                   f'{COMPACTING_PREFIX}{time.time_ns():020d}.jsonl'))
+        set_aside = self._compacting_logs()
+        daily_counts = self.daily_counts()
+        atomic_write_json(self.summary_path, {
+            'format': SUMMARY_FORMAT,
+            'last_updated': daily_counts[-1]['date'] if daily_counts else None,
+            'restaurants_source': SnapshotStore.CURRENT,
+            'folded_logs': set_aside,
+            'daily_counts': daily_counts
+        }, ensure_ascii=False, separators=(',', ':'))
+        for name in set_aside:
+            os.remove(os.path.join(self.city_data_dir, name))
+        return len(daily_counts)
+
+    def maybe_compact(self, every=COMPACT_EVERY):
+        if len(self.log_entries()) < every:
+            return False
+        self.compact()
+        return True
+
+    def needs_migration(self):
+        if not os.path.exists(self.summary_path):
+            return False
+        return self.load_compacted().get('format') != SUMMARY_FORMAT
+
+
+def combine_by_date(daily_counts):
+    # Each run counts what changed since the run before it, so a day with reruns adds up
+    # their counts; totals describe the catalogue afterwards and come from the last run
+    combined = {}
+    for entry in daily_counts:
+        earlier = combined.get(entry['date'])
+        if earlier is not None:
+            entry = {**entry, **{field: earlier.get(field, 0) + entry.get(field, 0)
+                                 for field in RUN_COUNT_FIELDS if field in earlier or field in entry}}
+        combined[entry['date']] = entry
+    return [combined[date] for date in sorted(combined)]
+
+
+def migrate(city_data_dir):
+    # Rewrites a pre-log summary.json (daily counts plus a full restaurant copy) in the
+    # compacted format; returns the sizes before and after, or None if nothing to do
+    store = SummaryStore(city_data_dir)
+    if not store.needs_migration():
+        return None
+    before = os.path.getsize(store.summary_path)
+    store.compact()
+    return before, os.path.getsize(store.summary_path)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Migrate or compact the per-city summary files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help='convert old summary.json files to the compacted format')
+    migrate_parser.add_argument('city_dirs', nargs='+')
+
+    compact_parser = subparsers.add_parser('compact', help='fold summary_log.jsonl into summary.json')
+    compact_parser.add_argument('city_dirs', nargs='+')
+
+    args = parser.parse_args()
+
+    for city_dir in args.city_dirs:
+        if args.command == 'migrate':
+            sizes = migrate(city_dir)
+            if sizes is None:
+                print(f"{city_dir}: already migrated")
+            else:
+                print(f"{city_dir}: summary.json {sizes[0] / 1024:.1f} KiB -> {sizes[1] / 1024:.1f} KiB")
+        else:
+            print(f"{city_dir}: {SummaryStore(city_dir).compact()} daily counts")
+
+
+if __name__ == '__main__':
+    main()
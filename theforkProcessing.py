@@ -1,70 +1,140 @@
+import argparse
 import json
 import os
+import re
+import textwrap
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-def process_thefork_data(folder_path):
-    all_restaurants = []
-    
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.json'):
-            with open(os.path.join(folder_path, filename), 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                
-                # Extract restaurant list
-                restaurants = data['pageProps']['searchPageResultsFetchResult']['list']
-                
-                for item in restaurants:
-                    restaurant = item['restaurant']
-                    marketing_offer = item.get('marketingOffer')
-                    
-                    restaurant_data = {
-                        'id': restaurant['id'],
-                        'name': restaurant['name'],
-                        'address': {
-                            'street': restaurant['address']['street'],
-                            'zipCode': restaurant['address']['zipCode'],
-                            'locality': restaurant['address']['locality'],
-                            'country': restaurant['address']['country']
-                        },
-                        'geolocation': {
-                            'latitude': restaurant['geolocation']['latitude'],
-                            'longitude': restaurant['geolocation']['longitude']
-                        },
-                        'rating': restaurant['aggregateRatings']['thefork']['ratingValue'],
-                        'reviewCount': restaurant['aggregateRatings']['thefork']['reviewCount'],
-                        'priceRange': restaurant['priceRangeLevel'],
-                        'averagePrice': restaurant['averagePrice'],
-                        'cuisine': restaurant['servesCuisine'],
-                        'mainPhotoUrl': restaurant['mainPhotoUrl'],
-                        'photos': [photo['src'] for photo in restaurant['photos']],
-                        'slug': restaurant['slug'],
-                        'marketingOffer': {
-                            'label': marketing_offer['label'] if marketing_offer else None,
-                            'type': marketing_offer['type'] if marketing_offer else None,
-                            'title': marketing_offer['title'] if marketing_offer else None,
-                            'discountPercentage': marketing_offer['discountPercentage'] if marketing_offer else None
-                        }
-                    }
-                    all_restaurants.append(restaurant_data)
-    
-    return all_restaurants
+from json_stream import iter_array_items
+
+LIST_PATH = ('pageProps', 'searchPageResultsFetchResult', 'list')
+
+def listing_files(folder_path):
+    # "promotions.json", "promotions (1).json", "promotions (2).json", ... in page order
+    def page_number(filename):
+        match = re.search(r'\((\d+)\)\.json$', filename)
+        return (int(match.group(1)) if match else 0, filename)
+
+    filenames = [f for f in os.listdir(folder_path) if f.endswith('.json')]
+    return [os.path.join(folder_path, f) for f in sorted(filenames, key=page_number)]
+
+def iter_listing_items(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        yield from iter_array_items(file, LIST_PATH)
+
+def transform_restaurant(item):
+    restaurant = item['restaurant']
+    marketing_offer = item.get('marketingOffer')
+
+    return {
+        'id': restaurant['id'],
+        'name': restaurant['name'],
+        'address': {
+            'street': restaurant['address']['street'],
+            'zipCode': restaurant['address']['zipCode'],
+            'locality': restaurant['address']['locality'],
+            'country': restaurant['address']['country']
+        },
+        'geolocation': {
+            'latitude': restaurant['geolocation']['latitude'],
+            'longitude': restaurant['geolocation']['longitude']
+        },
+        'rating': restaurant['aggregateRatings']['thefork']['ratingValue'],
+        'reviewCount': restaurant['aggregateRatings']['thefork']['reviewCount'],
+        'priceRange': restaurant['priceRangeLevel'],
+        'averagePrice': restaurant['averagePrice'],
+        'cuisine': restaurant['servesCuisine'],
+        'mainPhotoUrl': restaurant['mainPhotoUrl'],
+        'photos': [photo['src'] for photo in restaurant['photos']],
+        'slug': restaurant['slug'],
+        'marketingOffer': {
+            'label': marketing_offer['label'] if marketing_offer else None,
+            'type': marketing_offer['type'] if marketing_offer else None,
+            'title': marketing_offer['title'] if marketing_offer else None,
+            'discountPercentage': marketing_offer['discountPercentage'] if marketing_offer else None
+        }
+    }
+
+def parse_listing_file(path):
+    return [transform_restaurant(item) for item in iter_listing_items(path)]
+
+def iter_parsed_files(paths, workers):
+    # Files are parsed in a process pool but handed out in their original order;
+    # only a bounded window of parsed files is held at any time
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append(executor.submit(parse_listing_file, path))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def iter_thefork_restaurants(folder_path, workers=1):
+    paths = listing_files(folder_path)
+    if workers > 1:
+        restaurants = (r for page in iter_parsed_files(paths, workers) for r in page)
+    else:
+        restaurants = (transform_restaurant(item) for path in paths for item in iter_listing_items(path))
+
+    # Overlapping pages list the same restaurant more than once; keep the first
+    seen_ids = set()
+    for restaurant in restaurants:
+        if restaurant['id'] in seen_ids:
+            continue
+        seen_ids.add(restaurant['id'])
+        yield restaurant
+
+def process_thefork_data(folder_path, workers=1):
+    return list(iter_thefork_restaurants(folder_path, workers))
 
 def save_processed_data(data, filename):
+    # Streams the same layout json.dump(data, indent=2) would produce
+    with open(filename, 'w', encoding='utf-8') as f:
+        first = True
+        for restaurant in data:
+            f.write('[\n' if first else ',\n')
+            f.write(textwrap.indent(json.dumps(restaurant, ensure_ascii=False, indent=2), '  '))
+            first = False
+        f.write('[]' if first else '\n]')
+
+def save_processed_jsonl(data, filename):
     with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        for restaurant in data:
+            f.write(json.dumps(restaurant, ensure_ascii=False) + '\n')
+
+def counted(restaurants, stats):
+    for restaurant in restaurants:
+        stats['total'] += 1
+        if restaurant['marketingOffer']['label'] is not None:
+            stats['with_offers'] += 1
+        yield restaurant
 
 def main():
-    folder_path = 'thefork'  # Change this to the path of your folder containing TheFork JSON files
-    processed_data = process_thefork_data(folder_path)
-    
+    parser = argparse.ArgumentParser(description='Flatten TheFork promotion dumps into one restaurant list')
+    parser.add_argument('folder_path', nargs='?', default='thefork',
+                        help='folder containing the TheFork JSON files')
+    parser.add_argument('--workers', type=int, default=1, help='parse files in this many processes')
+    parser.add_argument('--jsonl', action='store_true', help='write JSON lines instead of a JSON array')
+    args = parser.parse_args()
+
     today = datetime.now().strftime("%Y-%m-%d")
-    filename = f'processed_thefork_data_{today}.json'
-    save_processed_data(processed_data, filename)
+    stats = {'total': 0, 'with_offers': 0}
+    restaurants = counted(iter_thefork_restaurants(args.folder_path, args.workers), stats)
+
+    if args.jsonl:
+        filename = f'processed_thefork_data_{today}.jsonl'
+        save_processed_jsonl(restaurants, filename)
+    else:
+        filename = f'processed_thefork_data_{today}.json'
+        save_processed_data(restaurants, filename)
     print(f"Processed data saved to {filename}")
     
     # Print some statistics
-    print(f"Total restaurants processed: {len(processed_data)}")
-    print(f"Restaurants with marketing offers: {sum(1 for r in processed_data if r['marketingOffer']['label'] is not None)}")
+    print(f"Total restaurants processed: {stats['total']}")
+    print(f"Restaurants with marketing offers: {stats['with_offers']}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,93 +1,43 @@
+import argparse
 import json
 from datetime import datetime
-import time
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 
-def fetch_restaurant_data(url):
-    all_restaurants = []
-    page = 1
-    
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    
-    driver = webdriver.Chrome(options=chrome_options)
-    
+from browser_pool import BROWSER_HEADERS, DEFAULT_BROWSERS, BrowserPool, PageNotFound, fetch_promotion_pages
+from fetch_engine import make_session
+from thefork_build_id import DEFAULT_BUILD_ID_CACHE, DEFAULT_BUILD_ID_TTL_HOURS, BuildIdResolver
+from theforkProcessing import transform_restaurant
+
+PROMOTIONS_ROUTE = 'search/cityTag/wien/597321/promotions'
+
+def fetch_promotion_data(resolver, workers=DEFAULT_BROWSERS, session=None, use_http=True, pool=None):
+    url = resolver.url(PROMOTIONS_ROUTE)
     try:
-        current_url = f"{url}?p={page}"
-        driver.get(current_url)
-        
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
-        
-        page_source = driver.page_source
-        
+        return fetch_promotion_pages(url, workers, session, use_http, pool)
+    except PageNotFound:
+        # TheFork redeployed since the build id was cached
+        print(f"{url} is gone, resolving the build id again")
+        return fetch_promotion_pages(resolver.url(PROMOTIONS_ROUTE, refresh=True), workers, session, use_http, pool)
+
+def fetch_restaurant_data(pages):
+    all_restaurants = []
+    seen_ids = set()
 
-        print("First 1000 characters of the page source:")
-        print(page_source[:1000])
-        
+    for page, data in enumerate(pages, start=1):
+        if not data or 'pageProps' not in data:
+            print(f"No restaurant data found on page {page}.")
+            continue
+
+        restaurants = data['pageProps']['searchPageResultsFetchResult']['list']
+        for item in restaurants:
+            restaurant_data = transform_restaurant(item)
+            # Listings shift while paging, so a restaurant can show up on two pages
+            if restaurant_data['id'] in seen_ids:
+                continue
+            seen_ids.add(restaurant_data['id'])
+            all_restaurants.append(restaurant_data)
+
+        print(f"Fetched page {page}: {len(restaurants)} restaurants")
 
-        try:
-            json_element = driver.find_element(By.TAG_NAME, "pre")
-            json_text = json_element.text
-            data = json.loads(json_text)
-            print("JSON data successfully extracted and parsed.")
-        except Exception as json_error:
-            print(f"Error extracting or parsing JSON: {json_error}")
-            data = None
-        
-        if data and 'pageProps' in data:
-            restaurants = data['pageProps']['searchPageResultsFetchResult']['list']
-            
-            for item in restaurants:
-                restaurant = item['restaurant']
-                marketing_offer = item.get('marketingOffer')
-                
-                restaurant_data = {
-                    'id': restaurant['id'],
-                    'name': restaurant['name'],
-                    'address': {
-                        'street': restaurant['address']['street'],
-                        'zipCode': restaurant['address']['zipCode'],
-                        'locality': restaurant['address']['locality'],
-                        'country': restaurant['address']['country']
-                    },
-                    'geolocation': {
-                        'latitude': restaurant['geolocation']['latitude'],
-                        'longitude': restaurant['geolocation']['longitude']
-                    },
-                    'rating': restaurant['aggregateRatings']['thefork']['ratingValue'],
-                    'reviewCount': restaurant['aggregateRatings']['thefork']['reviewCount'],
-                    'priceRange': restaurant['priceRangeLevel'],
-                    'averagePrice': restaurant['averagePrice'],
-                    'cuisine': restaurant['servesCuisine'],
-                    'mainPhotoUrl': restaurant['mainPhotoUrl'],
-                    'slug': restaurant['slug'],
-                    'marketingOffer': {
-                        'label': marketing_offer['label'] if marketing_offer else None,
-                        'type': marketing_offer['type'] if marketing_offer else None,
-                        'title': marketing_offer['title'] if marketing_offer else None,
-                        'discountPercentage': marketing_offer['discountPercentage'] if marketing_offer else None
-                    }
-                }
-                all_restaurants.append(restaurant_data)
-            
-            print(f"Fetched page {page}: {len(restaurants)} restaurants")
-        else:
-            print("No restaurant data found in the response.")
-    
-    except Exception as e:
-        print(f"An error occurred: {e}")
-    
-    finally:
-        driver.quit()
-    
     return all_restaurants
 
 def save_data(data, filename):
@@ -95,14 +45,28 @@ def save_data(data, filename):
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 def main():
-    url = "https://www.thefork.at/_next/data/xBoaAKbMFghBPiwAqYov8/de-AT/search/cityTag/wien/597321/promotions.json"
-    
-    restaurants = fetch_restaurant_data(url)
-    
+    parser = argparse.ArgumentParser(description='Fetch all TheFork promotion pages for Vienna')
+    parser.add_argument('--workers', type=int, default=DEFAULT_BROWSERS,
+                        help='pages fetched at the same time (and most browsers kept open)')
+    parser.add_argument('--browser-only', action='store_true', help='skip the plain HTTP attempt')
+    parser.add_argument('--build-id-cache', default=DEFAULT_BUILD_ID_CACHE)
+    parser.add_argument('--build-id-ttl-hours', type=float, default=DEFAULT_BUILD_ID_TTL_HOURS)
+    parser.add_argument('--refresh-build-id', action='store_true', help='ignore the cached build id')
+    args = parser.parse_args()
+
+    session = make_session(pool_size=args.workers, headers=BROWSER_HEADERS)
+    with BrowserPool(args.workers) as pool:
+        resolver = BuildIdResolver(session, args.build_id_cache, args.build_id_ttl_hours, pool=pool)
+        resolver.get(refresh=args.refresh_build_id)
+        pages = fetch_promotion_data(resolver, args.workers, session, not args.browser_only, pool)
+    session.close()
+
+    restaurants = fetch_restaurant_data(pages)
+
     today = datetime.now().strftime("%Y-%m-%d")
     filename = f'thefork_restaurant_data_{today}.json'
     save_data(restaurants, filename)
     print(f"Data saved to {filename}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,100 @@
+import json
+import os
+import re
+import time
+
+from browser_pool import BROWSER_HEADERS, PAGE_LOAD_TIMEOUT
+from snapshot_store import atomic_write_json
+
+SITE_URL = 'https://www.thefork.at'
+LOCALE = 'de-AT'
+DEFAULT_BUILD_ID_CACHE = '.cache/thefork_build_id.json'
+DEFAULT_BUILD_ID_TTL_HOURS = 6
+
+# Next.js puts the build id into __NEXT_DATA__ and into the static asset paths of every page
+BUILD_ID_PATTERNS = (
+    re.compile(r'"buildId"\s*:\s*"([A-Za-z0-9_-]+)"'),
+    re.compile(r'/_next/static/([A-Za-z0-9_-]+)/_buildManifest\.js'),
+)
+
+
+def extract_build_id(page_html):
+    for pattern in BUILD_ID_PATTERNS:
+        match = pattern.search(page_html)
+        if match:
+            return match.group(1)
+    return None
+
+
+def next_data_url(build_id, route, site_url=SITE_URL, locale=LOCALE):
+    # route is the page path without locale, e.g. 'search/cityTag/wien/597321/promotions'
+    return f"{site_url}/_next/data/{build_id}/{locale}/{route.strip('/')}.json"
+
+
+def read_page_source(driver, url):
+    driver.get(url)
+    return driver.page_source
+
+
+class BuildIdResolver:
+    # Finds the current build id at most once per TTL: from the cache file, else from
+    # the site's HTML over plain HTTP, else through a browser if one is available
+    def __init__(self, session, cache_path=DEFAULT_BUILD_ID_CACHE, ttl_hours=DEFAULT_BUILD_ID_TTL_HOURS,
+                 site_url=SITE_URL, pool=None):
+        self.session = session
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_hours * 3600
+        self.site_url = site_url
+        self.pool = pool
+        self.build_id = None
+
+    def _load_cached(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get('site_url') != self.site_url or time.time() - cached.get('resolved_at', 0) > self.ttl_seconds:
+            return None
+        return cached.get('build_id')
+
+    def _save_cached(self, build_id):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        atomic_write_json(self.cache_path, {'site_url': self.site_url, 'build_id': build_id,
+                                            'resolved_at': time.time()})
+
+    def _fetch_build_id(self):
+        try:
+            response = self.session.get(self.site_url + '/', headers={**BROWSER_HEADERS, 'Accept': 'text/html'},
+                                        timeout=PAGE_LOAD_TIMEOUT)
+            build_id = extract_build_id(response.text) if response.status_code == 200 else None
+        except Exception as e:
+            print(f"Could not load {self.site_url} over HTTP: {e}")
+            build_id = None
+
+        if build_id is None and self.pool is not None:
+            print("Looking up the build id in the browser")
+            build_id = extract_build_id(self.pool.run(read_page_source, self.site_url + '/'))
+
+        if build_id is None:
+            raise RuntimeError(f"No Next.js build id found on {self.site_url}")
+        return build_id
+
+    def get(self, refresh=False):
+        if self.build_id and not refresh:
+            return self.build_id
+
+        build_id = None if refresh else self._load_cached()
+        if build_id is None:
+            build_id = self._fetch_build_id()
+            self._save_cached(build_id)
+            print(f"Resolved TheFork build id {build_id}")
+        self.build_id = build_id
+        return build_id
+
+    def url(self, route, refresh=False):
+        return next_data_url(self.get(refresh), route, self.site_url)
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+from bisect import bisect_right
+
+from history_store import HistoryStore
+
+# Bookkeeping keys of an existing_restaurants entry that are not restaurant fields
+CHANGE_KEYS = ('new_deals', 'removed_deals', 'current_deals')
+
+
+def apply_changes(state, changes):
+    for entry in changes.get('removed_restaurants', []):
+        state.pop(entry['uuid'], None)
+
+    for entry in changes.get('new_restaurants', []):
+        state[entry['uuid']] = dict(entry)
+
+    for entry in changes.get('existing_restaurants', []):
+        record = state.setdefault(entry['uuid'], {})
+        record.update({key: value for key, value in entry.items() if key not in CHANGE_KEYS})
+        record['deals'] = entry.get('current_deals', [])
+
+    # Entries written before history carried every field only update the fields they have
+    for entry in changes.get('updated_restaurants', []):
+        state.setdefault(entry['uuid'], {}).update(entry)
+
+    return state
+
+
+def reconstruct_snapshot(city_data_dir, date):
+    # Start from the newest checkpoint at or before the date and replay the days after it
+    history = HistoryStore(city_data_dir)
+    checkpoints = history.checkpoint_dates()
+    position = bisect_right(checkpoints, date)
+
+    if position:
+        base_date = checkpoints[position - 1]
+        state = {r['uuid']: r for r in history.load_checkpoint(base_date)}
+    else:
+        base_date = None
+        state = {}
+
+    replayed = 0
+    for date_key in history.dates():
+        if date_key > date:
+            break
+        if base_date is not None and date_key <= base_date:
+            continue
+        # A day the scraper ran more than once has one entry per run, each against the one before
+        runs = history.read_runs(date_key)
+        for changes in runs:
+            apply_changes(state, changes)
+        replayed += bool(runs)
+
+    return list(state.values()), base_date, replayed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruct a city's restaurants and deals as of a past date")
+    parser.add_argument('city')
+    parser.add_argument('date', help='YYYY-MM-DD')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--output', help='write the reconstructed snapshot to this JSON file')
+    args = parser.parse_args()
+
+    snapshot, base_date, replayed = reconstruct_snapshot(os.path.join(args.data_dir, args.city), args.date)
+
+    print(f"{args.city} on {args.date}: {len(snapshot)} restaurants, "
+          f"{sum(len(r.get('deals', [])) for r in snapshot)} deals")
+    print(f"Started from {'checkpoint ' + base_date if base_date else 'an empty catalogue'}, "
+          f"replayed {replayed} days of changes")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        print(f"Snapshot saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()